@@ -28,6 +28,8 @@
  *   
  *   - SW inputs wired via Lumberg 6P DIN connectors (4x), contacs on two centre pins
  *   - Relay/Speaker outputs wired via RCA connectors (4x)
+ *   - Number of perch/speaker channels set by N_CHANNELS (max 8), one entry per channel in the pin tables
+ *     (the GUI N_CHOICES must match)
  *   
  *   Software:
  *   - USB/SERIAL settings 115200/8/N/1, use CR/NL as terminator when sending data to (Arduino) controller   
@@ -73,12 +75,11 @@
 
 #define TPD_PIN  12         // pin 52
 
+#define N_CHANNELS       4  // perch/speaker channels, perch events are sent as A..H
+
 #define NVM_CHK_ADR      2  // NVM address perch count
-#define NVM_CH1_CNT_ADR  4  // NVM address perch count
-#define NVM_CH2_CNT_ADR  6  // NV // NVM address perch count
-#define NVM_CH3_CNT_ADR  8  // NV // NVM address perch count
-#define NVM_CH4_CNT_ADR  10 // NVM address perch count
 #define NVM_ACT_DLY_ADR  12 // NVM actor delay
+#define NVM_CNT_ADR(ch)  ((ch) < 4 ? 4 + 2 * (ch) : 14 + 2 * ((ch) - 4))  // NVM address perch count, CH1-4 at 4..10, CH5-8 after the delay
 //#define NVM_CHECKVAL     2
 
 // Debug output switch
@@ -95,58 +96,34 @@ const int UPD_PLT_INTVAL  = 40;       // Plotter interval in mSecs
 const uint16_t Max_Latency = 5000;    //  Max latency time n mSecs // 2500 mSecs
 uint16_t DEBOUNCE_DLY =  250;          // debounce delay
 
-const int Q1_DLY_CNT =  0;        // debounce timer for CH1
-const int Q2_DLY_CNT =  0;        // debounce timer for CH2
-const int Q3_DLY_CNT =  0;        // debounce timer for CH3
-const int Q4_DLY_CNT =  0;        // debounce timer for CH4
-
 volatile int UPD_SEN_CNT = 0;     // Timer/counter for scheduling timing
 volatile int UPD_SOP_CNT = 0;     // Timer/counter for scheduling timing
 volatile int UPD_DBG_CNT = 0;     // Timer/counter for scheduling timing
 volatile int UPD_PLT_CNT = 0;     // Timer/counter for scheduling timing
 
-volatile int LAT1_TMR = 0;        // Latency 1 timer
-volatile int LAT2_TMR = 0;        // Latency 2 timer
-volatile int LAT3_TMR = 0;        // Latency 3 timer
-volatile int LAT4_TMR = 0;        // Latency 4 timer
-
-bool Perch_SW1_State = 0;         // Holds actual switch state
-bool Perch_SW2_State = 0;         // Holds actual switch state
-bool Perch_SW3_State = 0;         // Holds actual switch state
-bool Perch_SW4_State = 0;         // Holds actual switch state
+volatile int LAT_TMR[N_CHANNELS];          // Latency timer per channel
 
-bool Old_SW1_State = 0;           // Required for state change over detection
-bool Old_SW2_State = 0;           // Required for state change over detection
-bool Old_SW3_State = 0;           // Required for state change over detection
-bool Old_SW4_State = 0;           // Required for state change over detection
-
-bool Set_Q1_State = 0;            // Holds set state for relay
-bool Set_Q2_State = 0;            // Holds set state for relay
-bool Set_Q3_State = 0;            // Holds set state for relay
-bool Set_Q4_State = 0;            // Holds set state for relay
+bool Perch_SW_State[N_CHANNELS];          // Holds actual switch state
+bool Old_SW_State[N_CHANNELS];            // Required for state change over detection
+bool Set_Q_State[N_CHANNELS];             // Holds set state for relay
 
 bool TPD_STATE = 0;               // Test point debug
 int ILED = 13;                    // Internal/PCB LED
 
-int Perch_SW1_PIN = 18;           // Perch microswitch pin CH1
-int Perch_SW2_PIN = 19;           // Perch microswitch pin CH2
-int Perch_SW3_PIN = 20;           // Perch microswitch pin CH3
-int Perch_SW4_PIN = 21;           // Perch microswitch pin CH4
+const int Perch_SW_PIN[] = {18, 19, 20, 21};   // Perch microswitch pin per channel
+const int SPK_Q_PIN[]    = {5, 4, 3, 2};       // Perch relay pin per channel
 
-int SPK_Q1_PIN = 5;               // Perch relay pin CH1
-int SPK_Q2_PIN = 4;               // Perch relay pin CH2
-int SPK_Q3_PIN = 3;               // Perch relay pin CH3
-int SPK_Q4_PIN = 2;               // Perch relay pin CH4
+// A missing initialiser would silently be pin 0 (serial RX)
+static_assert(N_CHANNELS >= 1 && N_CHANNELS <= 8, "N_CHANNELS must be 1..8, perch events are sent as A..H");
+static_assert(sizeof(Perch_SW_PIN) / sizeof(Perch_SW_PIN[0]) == N_CHANNELS, "Perch_SW_PIN needs one pin per channel (N_CHANNELS)");
+static_assert(sizeof(SPK_Q_PIN) / sizeof(SPK_Q_PIN[0]) == N_CHANNELS, "SPK_Q_PIN needs one pin per channel (N_CHANNELS)");
 
 
 
 // ISR counters
 volatile uint16_t MSEC_CNT        = 0;        // mSec counter 
 
-volatile uint16_t Perch_CH1_Count = 0;        // Holds count of perches
-volatile uint16_t Perch_CH2_Count = 0;        // Holds count of perches
-volatile uint16_t Perch_CH3_Count = 0;        // Holds count of perches
-volatile uint16_t Perch_CH4_Count = 0;        // Holds count of perches
+volatile uint16_t Perch_CH_Count[N_CHANNELS];  // Holds count of perches
 
 // Serial/GUI parser variables
 char rx_byte                    = 0;           // used in the serial read routine
@@ -163,10 +140,7 @@ int GET_VAL                     = 0;           // serial receive value
 bool RUNMODE = 0;                              // 0 = STOP , RUN = 1
 long Runtime = 0;                              // Runtine in sec after reset/start
 
-int SW1_ACC_TMR = 0;
-int SW2_ACC_TMR = 0;
-int SW3_ACC_TMR = 0;
-int SW4_ACC_TMR = 0;
+int SW_ACC_TMR[N_CHANNELS];
 
 int NVM_CHECKVAL = 0;
 
@@ -187,15 +161,11 @@ void setup()
 
   pinMode(TPD_PIN, OUTPUT);
   
-  pinMode(SPK_Q1_PIN, OUTPUT);        // Define pin
-  pinMode(SPK_Q2_PIN, OUTPUT);        // Define pin
-  pinMode(SPK_Q3_PIN, OUTPUT);        // Define pin
-  pinMode(SPK_Q4_PIN, OUTPUT);        // Define pin
-  
-  pinMode(Perch_SW1_PIN, INPUT_PULLUP); // Define pin
-  pinMode(Perch_SW2_PIN, INPUT_PULLUP); // Define pin
-  pinMode(Perch_SW3_PIN, INPUT_PULLUP); // Define pin
-  pinMode(Perch_SW4_PIN, INPUT_PULLUP); // Define pin
+  for(int ch = 0; ch < N_CHANNELS; ch++)
+  {
+    pinMode(SPK_Q_PIN[ch], OUTPUT);          // Define pin
+    pinMode(Perch_SW_PIN[ch], INPUT_PULLUP); // Define pin
+  }
 
 
   // ***********  setup and initialize timer1 of Arduino Mega for task scheduling timers (via ISR) ******************************************************************
@@ -219,23 +189,24 @@ void setup()
    {
      Serial.println("NVM DATA STORED...");              // startup serial text
     
-     EEPROM.get(NVM_CH1_CNT_ADR,Perch_CH1_Count);         // Load Perch count from memory   
-     EEPROM.get(NVM_CH2_CNT_ADR,Perch_CH2_Count);         // Load Perch count from memory     
-     EEPROM.get(NVM_CH3_CNT_ADR,Perch_CH3_Count);         // Load Perch count from memory   
-     EEPROM.get(NVM_CH4_CNT_ADR,Perch_CH4_Count);         // Load Perch count from memory   
+     for(int ch = 0; ch < N_CHANNELS; ch++)
+     {
+       uint16_t count;
+       EEPROM.get(NVM_CNT_ADR(ch), count);                // Load Perch count from memory
+       Perch_CH_Count[ch] = count;
+     }
      EEPROM.get(NVM_ACT_DLY_ADR,DEBOUNCE_DLY);                 // Load Perch count from memory   
 
      if(DBG_MODE != 2 )
      {
         Serial.println("Fetched NVM data:");            // 
-        Serial.print("Perch_CH1_Count: ");              // 
-        Serial.println(Perch_CH1_Count);                // 
-        Serial.print("Perch_CH2_Count: ");              // 
-        Serial.println(Perch_CH2_Count);                // 
-        Serial.print("Perch_CH3_Count: ");              // 
-        Serial.println(Perch_CH3_Count);                // 
-        Serial.print("Perch_CH4_Count: ");              //  
-        Serial.println(Perch_CH4_Count);                // 
+        for(int ch = 0; ch < N_CHANNELS; ch++)
+        {
+          Serial.print("Perch_CH");                     // 
+          Serial.print(ch + 1);                         // 
+          Serial.print("_Count: ");                     // 
+          Serial.println(Perch_CH_Count[ch]);           // 
+        }
         Serial.print("Debounce delay: ");              // 
         Serial.println(DEBOUNCE_DLY);                        //          
      }  
@@ -250,20 +221,14 @@ void setup()
      EEPROM.write(NVM_CHK_ADR, NVM_CHECKVAL);               //
      delay(20);
      
-     Perch_CH1_Count = 0;                                   // reset count
-     Perch_CH2_Count = 0;                                   // reset count
-     Perch_CH3_Count = 0;                                   // reset count
-     Perch_CH4_Count = 0;                                   // reset count 
      DEBOUNCE_DLY = 250;                                         // defult value actor delay   
    
-     EEPROM.put(NVM_CH1_CNT_ADR, uint16_t(Perch_CH1_Count));        //
-     delay(20);
-     EEPROM.put(NVM_CH2_CNT_ADR, uint16_t(Perch_CH2_Count));        //
-     delay(20);
-     EEPROM.put(NVM_CH3_CNT_ADR, uint16_t(Perch_CH3_Count));        // 
-     delay(20);
-     EEPROM.put(NVM_CH4_CNT_ADR, uint16_t(Perch_CH4_Count));        //
-     delay(20);
+     for(int ch = 0; ch < N_CHANNELS; ch++)
+     {
+       Perch_CH_Count[ch] = 0;                                // reset count
+       EEPROM.put(NVM_CNT_ADR(ch), uint16_t(0));              //
+       delay(20);
+     }
      EEPROM.put(NVM_ACT_DLY_ADR, uint16_t(DEBOUNCE_DLY));                //
      delay(20);     
    }
@@ -292,23 +257,16 @@ void(* resetFunc) (void) = 0;                    // declare reset fuction at add
 // **************************************************************************************************************************************************
 void Defaults()
 {
-   Perch_CH1_Count = 0;                                   // reset count
-   Perch_CH2_Count = 0;                                   // reset count
-   Perch_CH3_Count = 0;                                   // reset count
-   Perch_CH4_Count = 0;                                   // reset count
-   
    DEBOUNCE_DLY = 250;                                         // defult value actor delay   
    
    EEPROM.write(NVM_CHK_ADR, 0);                          // Check ADR value
    delay(20);
-   EEPROM.put(NVM_CH1_CNT_ADR, Perch_CH1_Count);          // reset count 
-   delay(20);
-   EEPROM.put(NVM_CH2_CNT_ADR, Perch_CH2_Count);          // reset count 
-   delay(20);
-   EEPROM.put(NVM_CH3_CNT_ADR, Perch_CH3_Count);          // reset count 
-   delay(20);
-   EEPROM.put(NVM_CH4_CNT_ADR, Perch_CH4_Count);          // reset count 
-   delay(20);
+   for(int ch = 0; ch < N_CHANNELS; ch++)
+   {
+     Perch_CH_Count[ch] = 0;                              // reset count
+     EEPROM.put(NVM_CNT_ADR(ch), uint16_t(0));            // reset count 
+     delay(20);
+   }
    EEPROM.put(NVM_ACT_DLY_ADR, uint16_t(DEBOUNCE_DLY));        //
    delay(20);
 }
@@ -352,14 +310,22 @@ void CheckSerial()
                             Serial.println(" - l ==> list current state with thse parameters:");
                             Serial.println(" 1: RUNMODE ==> 0=OFF, 1 = ON");
                             Serial.println(" 2: SW Delay: xxx in mSecs");   
-                            Serial.println(" 3: State SW1 ==> 0=OFF, 1 = ON");
-                            Serial.println(" 4: State SW2 ==> 0=OFF, 1 = ON");
-                            Serial.println(" 5: State SW3 ==> 0=OFF, 1 = ON");
-                            Serial.println(" 6: State SW4 ==> 0=OFF, 1 = ON");
-                            Serial.println(" 7: State Relay 1 ==> 0=OFF, 1 = ON"); 
-                            Serial.println(" 8: State Relay 2 ==> 0=OFF, 1 = ON");     
-                            Serial.println(" 9: State Relay 3 ==> 0=OFF, 1 = ON");     
-                            Serial.println(" 10: State Relay 4 ==> 0=OFF, 1 = ON");                         
+                            for(int ch = 0; ch < N_CHANNELS; ch++)        // one line per switch, then per relay (20 + 2 * N_CHANNELS lines in all)
+                            {
+                              Serial.print(" ");
+                              Serial.print(ch + 3);
+                              Serial.print(": State SW");
+                              Serial.print(ch + 1);
+                              Serial.println(" ==> 0=OFF, 1 = ON");
+                            }
+                            for(int ch = 0; ch < N_CHANNELS; ch++)
+                            {
+                              Serial.print(" ");
+                              Serial.print(ch + 3 + N_CHANNELS);
+                              Serial.print(": State Relay ");
+                              Serial.print(ch + 1);
+                              Serial.println(" ==> 0=OFF, 1 = ON");
+                            }
                               
                             Serial.println(" - p ==> Stop mode (enables actor action )");  
                             Serial.println(" - c ==> Clear Arduino controller settings (revert to default values) and reset");  
@@ -367,7 +333,9 @@ void CheckSerial()
                             Serial.println("");                               
                             Serial.println(" **** SETTERS ****");  
                             Serial.println(" - [sdxxx] ==> Set Delay with xxx as timing in mSecs ==> sd210 = set delay to 120 mSecs");      
-                            Serial.println(" - [saxy]  ==> Set audio channel, where [x] is channel (1-4) and [y] is open/close with 0=open and 1=cose.");  
+                            Serial.print(" - [saxy]  ==> Set audio channel, where [x] is channel (1-");
+                            Serial.print(N_CHANNELS);
+                            Serial.println(") and [y] is open/close with 0=open and 1=cose.");  
                             Serial.println("");                              
                             Serial.println(" **** GETTERS ****");  
                             Serial.println(" - [gcx] ==> Get count x ==> gc3 = get count perch 3");                                    
@@ -380,14 +348,14 @@ void CheckSerial()
                             Serial.println("");                               // ACK/CMD OK
                             Serial.println(RUNMODE);
                             Serial.println(DEBOUNCE_DLY);
-                            Serial.println(Perch_SW1_State);
-                            Serial.println(Perch_SW2_State);
-                            Serial.println(Perch_SW3_State);
-                            Serial.println(Perch_SW4_State);                            
-                            Serial.println(Set_Q1_State);
-                            Serial.println(Set_Q2_State);
-                            Serial.println(Set_Q3_State);
-                            Serial.println(Set_Q4_State);
+                            for(int ch = 0; ch < N_CHANNELS; ch++)
+                            {
+                              Serial.println(Perch_SW_State[ch]);
+                            }
+                            for(int ch = 0; ch < N_CHANNELS; ch++)
+                            {
+                              Serial.println(Set_Q_State[ch]);
+                            }
                        break; 
                        
                        
@@ -472,149 +440,36 @@ void CheckSerial()
 
                                       if(SHW_LATENCY)
                                       {
-                                           if(LAT1_TMR < Max_Latency)
-                                           {
-                                           Serial.print("Latency SW1: "); 
-                                           Serial.print(LAT1_TMR); 
-                                           Serial.println(" mSecs"); 
-                                           }
-      
-                                           if(LAT2_TMR < Max_Latency)
+                                           for(int ch = 0; ch < N_CHANNELS; ch++)
                                            {
-                                           Serial.print("Latency SW2: "); 
-                                           Serial.print(LAT2_TMR); 
-                                           Serial.println(" mSecs"); 
-                                           }
-      
-      
-                                           if(LAT3_TMR < Max_Latency)
-                                           {
-                                             Serial.print("Latency SW3: "); 
-                                             Serial.print(LAT3_TMR); 
-                                             Serial.println(" mSecs"); 
-                                           }
-      
-                                           if(LAT4_TMR < Max_Latency)
-                                           {
-                                             Serial.print("Latency SW4: "); 
-                                             Serial.print(LAT4_TMR); 
-                                             Serial.println(" mSecs"); 
+                                             if(LAT_TMR[ch] < Max_Latency)
+                                             {
+                                               Serial.print("Latency SW"); 
+                                               Serial.print(ch + 1); 
+                                               Serial.print(": "); 
+                                               Serial.print(LAT_TMR[ch]); 
+                                               Serial.println(" mSecs"); 
+                                             }
                                            }
                                       }                                     
                                          
-                                      switch(rx_arr[2])
                                       {
-                                         case '1': // set audio path                                           
-                                              rx_str = rx_str.substring(3);                         // strip off first 2 chars
-                                              SER_RXD_VAL = rx_str.toInt();                         // assign newly rxd data to SER_RXD_VAL
-
-                                              // Serial.println();                                     // spacer
-                                              // Serial.println("rx_str case 1:");                     // reply ACK to GUI
-                                              // Serial.println(SER_RXD_VAL);                          // reply ACK to GUI                                              
-
-                                              if(SER_RXD_VAL == 0)
-                                              {
-                                                  Set_Q1_State = 0;
-                                                  //Serial.println("0");                             // reply ACK to GUI  
-                                              }
-
-                                              if(SER_RXD_VAL == 1)
-                                              {
-                                                  Set_Q1_State = 1;
-                                                  //Serial.println("1");                             // reply ACK to GUI  
-                                              }
-
-                                              if((SER_RXD_VAL != 0) && (SER_RXD_VAL != 1))
-                                              {                                                 
-                                                  //Serial.println("x");                             // reply ACK to GUI  
-                                              } 
-                                          break;
-                                            
-                                          
-
-                                          case '2': // set audio path                                           
-                                              rx_str = rx_str.substring(3);                         // strip off first 2 chars
-                                              SER_RXD_VAL = rx_str.toInt();                         // assign newly rxd data to SER_RXD_VAL
-
-                                              //  Serial.println();                                     // spacer
-                                              // Serial.println("rx_str case 2:");                     // reply ACK to GUI
-                                              //  Serial.println(SER_RXD_VAL);                          // reply ACK to GUI
-
-                                              if(SER_RXD_VAL == 0)
-                                              {
-                                                  Set_Q2_State = 0;
-                                                  //Serial.println("0");                             // reply ACK to GUI  
-                                              }
-
-                                              if(SER_RXD_VAL == 1)
-                                              {
-                                                  Set_Q2_State = 1;
-                                                  //Serial.println("1");                             // reply ACK to GUI  
-                                              }
-
-                                              if((SER_RXD_VAL != 0) && (SER_RXD_VAL != 1))
-                                              {                                                 
-                                                  Serial.println("x");                             // reply ACK to GUI  
-                                              } 
-                                          break;
-
-                                          case '3': // set audio path                                           
-                                              rx_str = rx_str.substring(3);                         // strip off first 2 chars
+                                         int ch = rx_arr[2] - '1';                             // channel 1..N_CHANNELS ==> index
+                                         if((ch >= 0) && (ch < N_CHANNELS))                    // set audio path 
+                                         {
+                                              rx_str = rx_str.substring(3);                         // strip off first 3 chars
                                               SER_RXD_VAL = rx_str.toInt();                         // assign newly rxd data to SER_RXD_VAL
 
-                                             // Serial.println();                                     // spacer
-                                             // Serial.println("rx_str case 3:");                     // reply ACK to GUI
-                                             // Serial.println(SER_RXD_VAL);                          // reply ACK to GUI
-
-                                              if(SER_RXD_VAL == 0)
-                                              {
-                                                  Set_Q3_State = 0;
-                                                  //Serial.println("0");                             // reply ACK to GUI  
-                                              }
-
-                                              if(SER_RXD_VAL == 1)
+                                              if((SER_RXD_VAL == 0) || (SER_RXD_VAL == 1))
                                               {
-                                                  Set_Q3_State = 1;
-                                                  //Serial.println("1");                             // reply ACK to GUI  
+                                                  Set_Q_State[ch] = SER_RXD_VAL;
                                               }
-
-                                              if((SER_RXD_VAL != 0) && (SER_RXD_VAL != 1))
+                                              else
                                               {                                                 
                                                   Serial.println("x");                             // reply ACK to GUI  
                                               } 
-                                          break;
-                                            
-                                          
-
-
-                                         case '4': // set audio path                                           
-                                              rx_str = rx_str.substring(3);                         // strip off first 2 chars
-                                              SER_RXD_VAL = rx_str.toInt();                         // assign newly rxd data to SER_RXD_VAL
-
-                                              //Serial.println();                                     // spacer
-                                             // Serial.println("rx_str case 4:");                     // reply ACK to GUI
-                                              //Serial.println(SER_RXD_VAL);                          // reply ACK to GUI
-
-                                              if(SER_RXD_VAL == 0)
-                                              {
-                                                  Set_Q4_State = 0;
-                                                  //Serial.println("0");                             // reply ACK to GUI  
-                                              }
-
-                                              if(SER_RXD_VAL == 1)
-                                              {
-                                                  Set_Q4_State = 1;
-                                                  //Serial.println("1");                             // reply ACK to GUI  
-                                              }
-
-                                              if((SER_RXD_VAL != 0) && (SER_RXD_VAL != 1))
-                                              {                                                 
-                                                  Serial.println("x");                             // reply ACK to GUI  
-                                              } 
-
-                                         break; //  case '4': 
-                                                                                     
-                                      } //switch(rx_arr[2])
+                                         }
+                                      }
 
                                   break; // case a; 
                                                                                                 
@@ -635,23 +490,12 @@ void CheckSerial()
                             switch(rx_arr[1])
                             {                    
                               case 'c': // count
-                               switch(rx_arr[2])
                                {
-                                  case '1': // count perch 1
-                                    Serial.println(Perch_CH1_Count);  // bad entry response
-                                  break;
-
-                                  case '2': // count perch 2
-                                    Serial.println(Perch_CH2_Count);  // bad entry response
-                                  break;
-
-                                  case '3': // count perch 3
-                                    Serial.println(Perch_CH3_Count);  // bad entry response
-                                  break;
-
-                                  case '4': // count perch 4
-                                    Serial.println(Perch_CH4_Count);  // bad entry response
-                                  break;                                  
+                                  int ch = rx_arr[2] - '1';           // count perch x
+                                  if((ch >= 0) && (ch < N_CHANNELS))
+                                  {
+                                    Serial.println(Perch_CH_Count[ch]);
+                                  }
                                }                                                              
                               break; // Case C ==> get count
                             }
@@ -679,218 +523,62 @@ void CheckSerial()
 // **************************************************************************************************************************************************
 void ReadSensors()
 {
-  if(LAT1_TMR > Max_Latency)
-  {
-    LAT1_TMR = Max_Latency;
-  }
-
-  if(LAT2_TMR > Max_Latency)
+  for(int ch = 0; ch < N_CHANNELS; ch++)
   {
-    LAT2_TMR = Max_Latency;
+    if(LAT_TMR[ch] > Max_Latency)
+    {
+      LAT_TMR[ch] = Max_Latency;
+    }
   }
 
-  if(LAT3_TMR > Max_Latency)
-  {
-    LAT3_TMR = Max_Latency;
-  }
-  if(LAT4_TMR > Max_Latency)
-  {
-    LAT4_TMR = Max_Latency;
-  }
-    
-    
   if((UPD_SEN_CNT > UPD_SEN_INTVAL) && (RUNMODE))
   {    
     //digitalWrite(TPD_PIN, HIGH );                  //  SET RELAY
-    // ----- PERCH SW-1 DETECT AND COUNT  -------
-    Perch_SW1_State = digitalRead(Perch_SW1_PIN);
-        
-    if(!Perch_SW1_State)
-    {
-     /// Serial.println("SW1_ACC_TMR++...");  // bad entry response      
-      SW1_ACC_TMR++;
-    }
-    else
-    {
-     // Serial.println("SW1_ACC_TMR--...");  // bad entry response      
-      SW1_ACC_TMR--;
-    }
-
-    //Serial.print("SW1_ACC_TMR: ");  // bad entry response
-    // Serial.println(SW1_ACC_TMR);  // bad entry response
-
-    if(SW1_ACC_TMR < 1 )
-    {
-    //  Set_Q1_State = 0;      
-      SW1_ACC_TMR = 0;
-
-      Old_SW1_State = 1;
-    }
-
-    if(SW1_ACC_TMR > uint16_t(DEBOUNCE_DLY))
+    // ----- PERCH SW DETECT AND COUNT, one pass per channel  -------
+    for(int ch = 0; ch < N_CHANNELS; ch++)
     {
-      // Set_Q1_State = 1;
-      
-      if(Old_SW1_State == 1)
-      {
-          Perch_CH1_Count++;              //   
-
-          LAT1_TMR = 0;  // reset counter for new timing run
-
-          if(!POLL_MODE)
-          {
-            Serial.print("A");                                      // startup serial text 
-            Serial.println(Perch_CH1_Count);                        // startup serial text 
-          }
-
-          EEPROM.write(NVM_CH1_CNT_ADR, Perch_CH1_Count);           //
+      Perch_SW_State[ch] = digitalRead(Perch_SW_PIN[ch]);
           
-          delay(10);                                                //
-
-          Old_SW1_State = 0;
+      if(!Perch_SW_State[ch])
+      {
+        SW_ACC_TMR[ch]++;
       }
-      
-      SW1_ACC_TMR = uint16_t(DEBOUNCE_DLY);
-    }
-
-    // ----- PERCH SW-2 DETECT AND COUNT  -------
-    Perch_SW2_State = digitalRead(Perch_SW2_PIN);
-    
-    if(!Perch_SW2_State)
-    {
-      SW2_ACC_TMR++;
-    }
-    else
-    {
-      SW2_ACC_TMR--;
-    }
-
-    if(SW2_ACC_TMR < 1 )
-    {
-     //Set_Q2_State = 0;      
-      SW2_ACC_TMR = 0;
-
-      Old_SW2_State = 1;
-    }
-
-
-    if(SW2_ACC_TMR > uint16_t(DEBOUNCE_DLY))
-    {
-     // Set_Q2_State = 1;      
-      if(Old_SW2_State == 1)
+      else
       {
-          Perch_CH2_Count++;                                      //  
-
-          LAT2_TMR = 0; // reset counter for new timing run
-
-          if(!POLL_MODE)
-          {
-            Serial.print("B");                                      // startup serial text 
-            Serial.println(Perch_CH2_Count);                        // startup serial text 
-          }
-
-          EEPROM.write(NVM_CH2_CNT_ADR, Perch_CH2_Count);           //
-          
-          delay(10);                                                //
-
-          Old_SW2_State = 0;
-      } 
-      SW2_ACC_TMR = uint16_t(DEBOUNCE_DLY);
-    }
-   
-    
-    // ----- PERCH SW-3 DETECT AND COUNT  -------
-    Perch_SW3_State = digitalRead(Perch_SW3_PIN);
-    
-    if(!Perch_SW3_State)
-    {
-      SW3_ACC_TMR++;
-    }
-    else
-    {
-      SW3_ACC_TMR--;
-    }
-
-    if(SW3_ACC_TMR < 1 )
-    {
-     // Set_Q3_State = 0;
-      
-      SW3_ACC_TMR = 0;
-
-      Old_SW3_State = 1;
-    }
-
+        SW_ACC_TMR[ch]--;
+      }
 
-    if(SW3_ACC_TMR > uint16_t(DEBOUNCE_DLY))
-    {
-     //  Set_Q3_State = 1;       
-      if(Old_SW3_State == 1)
+      if(SW_ACC_TMR[ch] < 1 )
       {
-          Perch_CH3_Count++;              // 
-
-          LAT3_TMR = 0; // reset counter for new timing run
-
-          if(!POLL_MODE)
-          {
-            Serial.print("C");                     // startup serial text 
-            Serial.println(Perch_CH3_Count);                     // startup serial text 
-          }
-
-          EEPROM.write(NVM_CH3_CNT_ADR, Perch_CH3_Count);           //
-          
-          delay(10);                                                //
-
-          Old_SW3_State = 0;
-      }                 //      
-      SW3_ACC_TMR = uint16_t(DEBOUNCE_DLY);
-    }        
-
-    // ----- PERCH SW-4 DETECT AND COUNT  -------
-    Perch_SW4_State = digitalRead(Perch_SW4_PIN);
-    
-    if(!Perch_SW4_State)
-    {
-      SW4_ACC_TMR++;
-    }
-    else
-    {
-      SW4_ACC_TMR--;
-    }
-
-    if(SW4_ACC_TMR < 1 )
-    {
-     // Set_Q4_State = 0;
-      
-      SW4_ACC_TMR = 0;
-
-      Old_SW4_State = 1;
-    }
+        SW_ACC_TMR[ch] = 0;
 
+        Old_SW_State[ch] = 1;
+      }
 
-    if(SW4_ACC_TMR > uint16_t(DEBOUNCE_DLY))
-    {
-      //  Set_Q4_State = 1;      
-      if(Old_SW4_State == 1)
+      if(SW_ACC_TMR[ch] > uint16_t(DEBOUNCE_DLY))
       {
-          Perch_CH4_Count++;              // 
+        if(Old_SW_State[ch] == 1)
+        {
+            Perch_CH_Count[ch]++;              //   
 
-          LAT4_TMR = 0; // reset counter for new timing run
+            LAT_TMR[ch] = 0;  // reset counter for new timing run
 
-          if(!POLL_MODE)
-          {
-            Serial.print("D");                     // startup serial text 
-            Serial.println(Perch_CH4_Count);                     // startup serial text 
-          }
+            if(!POLL_MODE)
+            {
+              Serial.print(char('A' + ch));                           // perch letter, A = CH1 
+              Serial.println(Perch_CH_Count[ch]);                     // perch count 
+            }
 
-          EEPROM.write(NVM_CH4_CNT_ADR, Perch_CH4_Count);           //
-          
-          delay(10);                                                //
+            EEPROM.write(NVM_CNT_ADR(ch), Perch_CH_Count[ch]);        //
+            
+            delay(10);                                                //
 
-          Old_SW4_State = 0;
-      }                 //             // 
-      
-      SW4_ACC_TMR = uint16_t(DEBOUNCE_DLY);
-    } 
+            Old_SW_State[ch] = 0;
+        }
+        
+        SW_ACC_TMR[ch] = uint16_t(DEBOUNCE_DLY);
+      }
+    }
   //  digitalWrite(TPD_PIN, LOW );                  //  SET RELAY  
   UPD_SEN_CNT = 0;
   }  
@@ -908,18 +596,12 @@ void SetOutputs()
 {
   if(UPD_SOP_CNT > UPD_SOP_INTVAL)
   {
-     // test
-     // Set_Q1_State = !Set_Q1_State;
-     // Set_Q2_State = !Set_Q2_State;
-     // Set_Q3_State = !Set_Q3_State;
-     // Set_Q4_State = !Set_Q4_State;       
-
      if(RUNMODE == 0)
      {   
-        Set_Q1_State = 0;    
-        Set_Q2_State = 0;    
-        Set_Q3_State = 0;    
-        Set_Q4_State = 0; 
+        for(int ch = 0; ch < N_CHANNELS; ch++)
+        {
+          Set_Q_State[ch] = 0;    
+        }
 
         digitalWrite(ILED, LOW);  
      }
@@ -928,10 +610,10 @@ void SetOutputs()
         digitalWrite(ILED, HIGH);  
      }
 
-     digitalWrite(SPK_Q1_PIN, Set_Q1_State);  
-     digitalWrite(SPK_Q2_PIN, Set_Q2_State);  
-     digitalWrite(SPK_Q3_PIN, Set_Q3_State);  
-     digitalWrite(SPK_Q4_PIN, Set_Q4_State);     
+     for(int ch = 0; ch < N_CHANNELS; ch++)
+     {
+       digitalWrite(SPK_Q_PIN[ch], Set_Q_State[ch]);  
+     }
   
      UPD_SOP_CNT = 0;
   }
@@ -968,41 +650,19 @@ void SendSerial()
          Serial.print("DEBOUNCE_DLY: ");                   // startup serial text   
          Serial.println(DEBOUNCE_DLY);                     // startup serial text 
          
-         Serial.print("Perch_CH1_Count: ");           // startup serial text   
-         Serial.println(Perch_CH1_Count);             // startup serial text 
-         Serial.print("Set_Q1_State: ");              // startup serial text   
-         Serial.println(Set_Q1_State);                // startup serial text
-         Serial.print("Perch_SW1_State: ");           // startup serial text   
-         Serial.println(Perch_SW1_State);             // startup serial text  
-         Serial.print("SW1_ACC_TMR: ");               // startup serial text   
-         Serial.println(SW1_ACC_TMR);                 // startup serial text
-
-         Serial.print("Perch_CH2_Count: ");           // startup serial text   
-         Serial.println(Perch_CH2_Count);             // startup serial text 
-         Serial.print("Set_Q2_State: ");           // startup serial text   
-         Serial.println(Set_Q2_State);             // startup serial text
-         Serial.print("Perch_SW2_State: ");           // startup serial text   
-         Serial.println(Perch_SW2_State);             // startup serial text 
-         Serial.print("SW2_ACC_TMR: ");               // startup serial text   
-         Serial.println(SW2_ACC_TMR);                 // startup serial text  
-
-         Serial.print("Perch_CH3_Count: ");           // startup serial text   
-         Serial.println(Perch_CH3_Count);             // startup serial text 
-         Serial.print("Set_Q3_State: ");           // startup serial text   
-         Serial.println(Set_Q3_State);             // startup serial text
-         Serial.print("Perch_SW3_State: ");           // startup serial text   
-         Serial.println(Perch_SW3_State);             // startup serial text
-         Serial.print("SW3_ACC_TMR: ");               // startup serial text   
-         Serial.println(SW3_ACC_TMR);                 // startup serial text   
-
-         Serial.print("Perch_CH4_Count: ");           // startup serial text   
-         Serial.println(Perch_CH4_Count);             // startup serial text 
-         Serial.print("Set_Q4_State: ");           // startup serial text   
-         Serial.println(Set_Q4_State);             // startup serial text
-         Serial.print("Perch_SW4_State: ");           // startup serial text   
-         Serial.println(Perch_SW4_State);             // startup serial text 
-         Serial.print("SW4_ACC_TMR: ");               // startup serial text   
-         Serial.println(SW4_ACC_TMR);                 // startup serial text            
+         for(int ch = 0; ch < N_CHANNELS; ch++)
+         {
+           Serial.print("Perch_CH");                  // startup serial text   
+           Serial.print(ch + 1);                      // startup serial text   
+           Serial.print("_Count: ");                  // startup serial text   
+           Serial.println(Perch_CH_Count[ch]);        // startup serial text 
+           Serial.print("Set_Q_State: ");             // startup serial text   
+           Serial.println(Set_Q_State[ch]);           // startup serial text
+           Serial.print("Perch_SW_State: ");          // startup serial text   
+           Serial.println(Perch_SW_State[ch]);        // startup serial text  
+           Serial.print("SW_ACC_TMR: ");              // startup serial text   
+           Serial.println(SW_ACC_TMR[ch]);            // startup serial text
+         }
     
          UPD_DBG_CNT = 0;                             // Reset counter
      }
@@ -1046,10 +706,10 @@ ISR(TIMER1_OVF_vect)            // ISR label for Timer1
   UPD_SEN_CNT++;                //  update sensor interval timer/counter
   UPD_SOP_CNT++;                //  update sensor interval timer/counter   
   
-  LAT1_TMR++;                   // Latency SW1
-  LAT2_TMR++;                   // Latency SW2
-  LAT3_TMR++;                   // Latency SW3
-  LAT4_TMR++;                   // Latency SW4
+  for(int ch = 0; ch < N_CHANNELS; ch++)
+  {
+    LAT_TMR[ch]++;              // Latency SW per channel
+  }
 } 
 
 // ************************************************   END Timer1 ISR       **************************************************************************
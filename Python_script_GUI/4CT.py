@@ -9,163 +9,48 @@ import tkinter as tk
 from tkinter import ttk
 from tkinter import Scrollbar
 from datetime import datetime
-import time
 from tkinter import filedialog, simpledialog
 from tkinter import messagebox
 import os
-import pygame
-import serial.tools.list_ports   #ARDUINO
-import serial
 import webbrowser
 import threading
-
-# ARDUINO connection
-# Function to list available serial ports
-def list_serial_ports():
-    ports = serial.tools.list_ports.comports()
-    available_ports = [port.device for port in ports]
-    return available_ports
-
-# Function to find and open the Arduino serial port
-def open_serial_port():
-    available_ports = list_serial_ports()
-    if not available_ports:
-        raise serial.SerialException("No serial ports available.")
-    
-    for port in available_ports:
-        try:
-            ser = serial.Serial(port, baudrate=115200, timeout=1)
-            time.sleep(1)
-            return ser
-        except (serial.SerialException, OSError):
-            continue
-    raise serial.SerialException("Could not open any serial ports.")
+from discovery import open_serial_port
+from engine import ExperimentEngine
+from ui_updates import UiUpdateQueue
+from log_view import LogView
+from log_writer import export_text
+from time_picker import create_time_spinbox
+from tracing import TRACER
+from stimulus_import import NORMALISE_DBFS, IMPORT_COMMAND
+import stimulus_import
+import multiprocessing
+import sys
+
+#The frozen program (PyInstaller) is also the child process of the song import and its workers,
+#they are handed over here before any window or serial port is opened
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if sys.argv[1:2] == [IMPORT_COMMAND]:
+        sys.exit(stimulus_import.main(sys.argv[2:]))
+
+#Arena: one perch and one speaker per choice, the firmware must be built with the same N_CHANNELS
+N_CHOICES = 4
+CACHE_BUDGET_MB = 512  # memory for decoded songs, the least recently played are dropped beyond it
+LATENCY_REFRESH_MS = 1000
 
 #Arduino object
 ser = open_serial_port()
 
 def send_command(command):
-    ser.write((command + '\r\n').encode())
-    response = ser.readline().decode().strip()
-    return response
-
-def parse_single_response(response):
-    #parts = response.split(',')
-    if len(response) < 2:
-        return "Invalid response format", 0
-    try:
-        action = response[0]
-        count = int(response[1:])
-        return action, count
-    except (IndexError, ValueError) as e:
-        return "Parsing error", 0
+    return engine.send(command)
 
 #Function to handle the dropdown selection
 def on_select(event=None):
-    selected_value = button_delay_std.get()
-    command = f"sd{selected_value} r/n"
-    response = send_command(command)
-    log_action(f"Perch timeout of {command}, Received Action: {response}", species_var.get())
-
-def read_from_arduino():
-    while True:
-        if ser and ser.in_waiting > 0:
-            response = ser.readline().decode().strip()
-            perch_count_response(response)
-
-def perch_count_response(response):                               
-    print(f"Received: {response}")
-    
-    try:
-        action, count = parse_single_response(response)
-    except ValueError as e:
-        log_action(f"Error parsing response: {e}", species_var.get())
-        return
-    
-    if action.startswith("A"):
-        send_command("sa11 r/n")
-        log_action(f"Perch 1, count: {count}", species_var.get())
-        print(f"Playing song for speaker 1: {speaker_info['song_1']}")  # Debug statement
-        play_sounds(f"Song{speaker_info['speaker_1']}", speaker_info['song_1'])
-        send_command("sa10 r/n")
-       
-        if speaker_info['speaker_1'] == "A":
-            countA_textbox.delete("1.0", tk.END)  
-            countA_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_1'] == "B":
-            countB_textbox.delete("1.0", tk.END)
-            countB_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_1'] == "C":
-            countC_textbox.delete("1.0", tk.END)  
-            countC_textbox.insert(tk.END, str(count))
-        elif speaker_info['speaker_1'] == "D":
-            countD_textbox.delete("1.0", tk.END)  
-            countD_textbox.insert(tk.END, str(count))
-    
-    elif action.startswith("B"):
-        send_command("sa21 r/n")
-        log_action(f"Perch 2, count: {count}", species_var.get())
-        print(f"Playing song for speaker 2: {speaker_info['song_2']}")  # Debug statement
-        play_sounds(f"Song{speaker_info['speaker_2']}", speaker_info['song_2'])
-        send_command("sa20 r/n")
-        
-        if speaker_info['speaker_2'] == "A":
-            countA_textbox.delete("1.0", tk.END)  
-            countA_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_2'] == "B":
-            countB_textbox.delete("1.0", tk.END)
-            countB_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_2'] == "C":
-            countC_textbox.delete("1.0", tk.END)  
-            countC_textbox.insert(tk.END, str(count))
-        elif speaker_info['speaker_2'] == "D":
-            countD_textbox.delete("1.0", tk.END)  
-            countD_textbox.insert(tk.END, str(count))
-        
-    elif action.startswith("C"):
-        send_command("sa31 r/n")
-        log_action(f"Perch 3, count: {count}", species_var.get())
-        print(f"Playing song for speaker 3: {speaker_info['song_3']}")  # Debug statement
-        play_sounds(f"Song{speaker_info['speaker_3']}", speaker_info['song_3'])
-        send_command("sa30 r/n")
-       
-        if speaker_info['speaker_3'] == "A":
-            countA_textbox.delete("1.0", tk.END)  
-            countA_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_3'] == "B":
-            countB_textbox.delete("1.0", tk.END)
-            countB_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_3'] == "C":
-            countC_textbox.delete("1.0", tk.END)  
-            countC_textbox.insert(tk.END, str(count))
-        elif speaker_info['speaker_3'] == "D":
-            countD_textbox.delete("1.0", tk.END)  
-            countD_textbox.insert(tk.END, str(count))
-    
-    elif action.startswith("D"):
-        send_command("sa41 r/n")
-        log_action(f"Perch 4, count: {count}", species_var.get())                        
-        print(f"Playing song for speaker 4: {speaker_info['song_4']}")  # Debug statement
-        play_sounds(f"Song{speaker_info['speaker_4']}", speaker_info['song_4'])
-        send_command("sa40 r/n")
-        
-        if speaker_info['speaker_4'] == "A":
-            countA_textbox.delete("1.0", tk.END)  
-            countA_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_4'] == "B":
-            countB_textbox.delete("1.0", tk.END)
-            countB_textbox.insert(tk.END, str(count)) 
-        elif speaker_info['speaker_4'] == "C":
-            countC_textbox.delete("1.0", tk.END)  
-            countC_textbox.insert(tk.END, str(count))
-        elif speaker_info['speaker_4'] == "D":
-            countD_textbox.delete("1.0", tk.END)  
-            countD_textbox.insert(tk.END, str(count))
+    engine.set_perch_delay(button_delay_std.get())
 
 # Function to exit the program
 def exit_program():
-    if ser is not None:
-        ser.close()  # Close the serial port before exiting if it's open
+    engine.close()
     root.destroy()
 #---------------------------------------------------
 #Window name
@@ -174,6 +59,15 @@ root.title("4CT")
 root.iconbitmap(r"C:/4CT/4CT_logo.ico")
 root.geometry("1800x900")
 root.resizable(width=False, height=False)
+#Widgets are only updated from the Tk thread, other threads go through this queue
+ui_updates = UiUpdateQueue(root)
+#Serial link, schedule, playback and log; this window is a front-end over it (see engine.py)
+engine = ExperimentEngine(ser, choices=N_CHOICES, cache_budget_mb=CACHE_BUDGET_MB,
+                          on_log=lambda entry: ui_updates.append_log(log_view, entry),
+                          on_count=lambda section, stimulus, count: ui_updates.set_text(count_textboxes[stimulus], str(count)),
+                          on_switch=lambda sections: ui_updates.call(show_section_counts, sections[0] if sections else None),
+                          on_rejected=lambda stimulus, message: ui_updates.call(refuse_songs, stimulus, message))
+arena = engine.arena
 
 ###Menu bar
 menu_bar = tk.Menu(root)
@@ -190,29 +84,75 @@ def open_4CT_documentation():
 help_menu.add_cascade(label="Guidelines", menu=guideline_menu)
 guideline_menu.add_command(label="4CT Documentation", command=open_4CT_documentation)
 
+##PLAYBACK TAB
+#What a hit on a speaker that is still playing does, for every speaker
+playback_menu = tk.Menu(menu_bar, tearoff=0)
+menu_bar.add_cascade(label="Playback", menu=playback_menu)
+playback_policy = tk.StringVar(value="interrupt")
+playback_menu.add_radiobutton(label="Interrupt the current song", variable=playback_policy, value="interrupt",
+                              command=lambda: engine.set_playback_policy(playback_policy.get()))
+playback_menu.add_radiobutton(label="Queue the new song", variable=playback_policy, value="queue",
+                              command=lambda: engine.set_playback_policy(playback_policy.get()))
+playback_menu.add_radiobutton(label="Drop the new song", variable=playback_policy, value="drop",
+                              command=lambda: engine.set_playback_policy(playback_policy.get()))
+playback_menu.add_separator()
+#Order of the files of a song, a new seed is drawn and logged at every change
+playback_plan = tk.StringVar(value="sequence")
+for plan_label, plan_mode in [("Files in the selected order", "sequence"), ("Files shuffled at every landing", "shuffle"),
+                              ("Files in a balanced Latin square order", "latin_square"),
+                              ("One file per landing, rotating", "rotate")]:
+    playback_menu.add_radiobutton(label=plan_label, variable=playback_plan, value=plan_mode,
+                                  command=lambda: engine.set_playback_plan(playback_plan.get()))
+playback_menu.add_separator()
+#The songs are prepared again at the new level
+normalise_songs = tk.BooleanVar(value=False)
+playback_menu.add_checkbutton(label=f"Normalise song loudness ({NORMALISE_DBFS:g} dBFS RMS)", variable=normalise_songs,
+                              command=lambda: engine.set_normalisation(NORMALISE_DBFS if normalise_songs.get() else None))
+
+##TRACE TAB
+#Span tracing of the event path (see tracing.py), dumped as a Chrome trace file
+trace_menu = tk.Menu(menu_bar, tearoff=0)
+menu_bar.add_cascade(label="Trace", menu=trace_menu)
+tracing_enabled = tk.BooleanVar(value=TRACER.enabled)
+
+def toggle_tracing():
+    if tracing_enabled.get():
+        TRACER.enable()
+    else:
+        TRACER.disable()
+
+def dump_trace():
+    file_path = filedialog.asksaveasfilename(title="Save the trace", defaultextension=".json",
+                                             initialfile=f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                                             filetypes=[("Chrome trace", "*.json")])
+    if not file_path:
+        return
+    try:
+        spans = TRACER.dump(file_path)
+        messagebox.showinfo("Trace saved", f"{spans} spans written to {file_path}\nOpen it in chrome://tracing or ui.perfetto.dev")
+    except OSError as e:
+        messagebox.showerror("Trace Error", f"An error occurred while writing the trace: {e}")
+
+trace_menu.add_checkbutton(label="Enable tracing", variable=tracing_enabled, command=toggle_tracing)
+trace_menu.add_command(label="Dump trace...", command=dump_trace)
+
 #------------------------------------------------------------------------------
-#Store the log entries and action count
-log_data = []
-action_count = 0
-selected_files_dict = {"SongA": [], "SongB": [], "SongC": [], "SongD": []}
-speaker_info = {}
-store_count = {}
+#Log entries kept by the engine, the log view pages through them
+log_data = engine.log_data
+schedule_edit_timer = None
 
 #------------------------------------------------------------------------------
 #Design the log of action
-def log_action(action, selected_option):
-    global action_count
-    current_time = datetime.now().strftime("%Y-%m-%d_%H:%M:%S.%f")[:-3]
-    action_count += 1
-    n_experiment = experiment_name.get()
-    if selected_option == "Other":
-        custom_value = other1_entry.get()
-        log_entry = f"{action_count}_{n_experiment}_{custom_value}_{current_time}_{action}"
-    else:
-        log_entry = f"{action_count}_{n_experiment}_{selected_option}_{current_time}_{action}"
-    log_data.append(log_entry)
-    log_text.insert(tk.END, log_entry + "\n")
-    log_text.see(tk.END)
+#Log an entry through the engine; event and the keyword fields go to the typed record of the entry
+def log_action(action, selected_option=None, event="message", **fields):
+    if threading.current_thread() is threading.main_thread():
+        snapshot_session_labels()
+    return engine.log(action, event, **fields)
+
+#Refresh the copy of the experiment/species fields (Tk thread only)
+def snapshot_session_labels():
+    species = species_var.get()
+    engine.set_labels(experiment_name.get(), other1_entry.get() if species == "Other" else species)
 
 # Export the log as txt
 def export_to_txt():
@@ -225,14 +165,7 @@ def export_to_txt():
     if file_name is None:
         return
     file_path = os.path.join(export_folder, f"{file_name}.txt")
-    try:
-        with open(file_path, "w") as file:
-            for log_entry in log_data:
-                file.write(log_entry + "\n")
-            
-            messagebox.showinfo("Export Successful", f"File exported to {file_path}")
-    except Exception as e:
-        messagebox.showerror("Export Error", f"An error occurred during export: {e}")
+    export_session_log(file_path)
 
 #Define the export to csv
 def export_to_csv():
@@ -244,49 +177,45 @@ def export_to_csv():
     if file_name is None:
         return
     file_path = os.path.join(export_folder, f"{file_name}.csv")
-    try:
-        with open(file_path, "w", newline="") as file:
-            for log_entry in log_data:
-                file.write(log_entry + "\n")
-            
-            messagebox.showinfo("Export Successful", f"File exported to {file_path}")
-    except Exception as e:
-        messagebox.showerror("Export Error", f"An error occurred during export: {e}")
-
-def save_csv():
-    filename = f"data_{datetime.now().strftime('%Y%m%d')}.csv"
-    log_data.to_csv(filename, index = False)
-    print(f"Data saved to {filename}")
-    
+    export_in_background(engine.records.write_csv, file_path)
+
+#Define the export to the binary columnar format (event_records.read_columnar loads it back)
+def export_to_columnar():
+    export_folder = filedialog.askdirectory(title="Select the Folder where you would like to export")
+    if not export_folder:
+        return
+    # Ask the user for the desired file name
+    file_name = simpledialog.askstring("File Name", "Enter the desired file name:")
+    if file_name is None:
+        return
+    file_path = os.path.join(export_folder, f"{file_name}.4ctcol")
+    export_in_background(engine.records.write_columnar, file_path)
+
+# Convert the session journal to the export file in the background, the log keeps running meanwhile
+def export_session_log(file_path, newline=None):
+    export_in_background(lambda path: export_text(engine.session_log.journals(), path, newline), file_path)
+
+# Run an export off the GUI thread and report the result
+def export_in_background(write, file_path):
+    def export():
+        try:
+            write(file_path)
+            ui_updates.call(messagebox.showinfo, "Export Successful", f"File exported to {file_path}")
+        except Exception as e:
+            ui_updates.call(messagebox.showerror, "Export Error", f"An error occurred during export: {e}")
+    threading.Thread(target=export, daemon=True).start()
+
+#Save the data of the day at 00:00:00 and continue in a new file, off the GUI thread
+def toggle_daily_save():
+    engine.set_daily_save(Save_at_state.get())
+
 # Clear the log
 def clear_log():
-    log_text.delete("1.0", tk.END) #Clear the log.text
-    log_data.clear()
+    log_view.clear() #Clear the log.text
+    engine.clear_log()
 #------------------------------------------------------------------------------
 #SET THE TIME SCALES
-def create_time_values():
-    time_values = []
-    for hour in range(24):
-        for minute in range(60):
-            for second in range(60):
-                time_values.append(f"{hour:02d}:{minute:02d}:{second:02d}")
-    return time_values
-
-#Function for timing with milliseconds
-def milliseconds_time_values():
-    second_values = []
-    for second in range(60):
-        for millisecond in range(1000):
-                second_values.append(f"{second:02d}.{millisecond:03d}")
-    return second_values
-
-#Save when reach 00:00:00
-def save_at_00():
-    current_time = datetime.now().strftime('%H:%M:%S')
-    if current_time == "00:00:00":
-        save_csv()
-        time.sleep(1)
-    time.sleep(0.5)
+# Time spinboxes step arithmetically on HH:MM:SS, see time_picker.py
 #------------------------------------------------------------------------------
 #Handle the species selection
 def handle_species_choice():
@@ -298,17 +227,20 @@ def handle_species_choice():
         other1_entry.config(state="readonly")  # Disable input for other options
 #------------------------------------------------------------------------------
 #SONG FRAME Functions
-# Dictionary to store selected files for each sensor:
-selected_files_dict = {"SongA": [], "SongB": [], "SongC": [], "SongD": []}
-
+# The selected files of each song are kept by the engine (engine.songs, by stimulus letter)
 def update_selected_files_textbox(song_name, selected_files_textbox):
-    selected_files = selected_files_dict[song_name]
+    selected_files = engine.songs[song_name[4:]]
     text_content = "; ".join(selected_files) if selected_files else "None"
     selected_files_textbox.configure(state=tk.NORMAL)
     selected_files_textbox.delete("1.0", tk.END)  # Clear previous content
     selected_files_textbox.insert(tk.END, f"{text_content}")
     selected_files_textbox.configure(state=tk.DISABLED)
 
+# A copy of a file of another song was found in the background, the engine cleared the selection (Tk thread)
+def refuse_songs(stimulus, message):
+    update_selected_files_textbox(f"Song{stimulus}", selected_file_labels[f"Song{stimulus}"])
+    messagebox.showerror("File Selection Error", message)
+
 def select_audio_files(song_name):
     error_occurred = False
     file_paths = filedialog.askopenfilenames(
@@ -319,18 +251,16 @@ def select_audio_files(song_name):
     selected_files = list(file_paths)  # Store full file paths
    
     if len(selected_files) > 0:
-            for other_song in selected_files_dict:
-                if other_song != song_name and set(selected_files) & set(selected_files_dict[other_song]):
-                    messagebox.showerror("File Selection Error", f"Files in {song_name} should be different from files selected in {other_song}.")
-                    error_occurred = True
-                    break
+            snapshot_session_labels()
+            try:
+                # Logs each selected audio file, checks and decodes them in the background
+                engine.set_songs(song_name[4:], selected_files)
+            except ValueError as e:
+                messagebox.showerror("File Selection Error", str(e))
+                error_occurred = True
     
             if not error_occurred:
-                selected_files_dict[song_name] = selected_files
                 update_selected_files_textbox(song_name, selected_file_labels[song_name])
-                # Log each selected audio file
-                for file_name in selected_files:
-                    log_action(f"Selected audio file for {song_name}: {os.path.basename(file_name)}", species_var.get())
     else:
             # Clear the label text
             selected_file_labels[song_name].configure(state=tk.NORMAL)
@@ -338,22 +268,6 @@ def select_audio_files(song_name):
             selected_file_labels[song_name].insert(tk.END, "Selected file: None")
             selected_file_labels[song_name].configure(state=tk.DISABLED)
 
-def play_sounds(song_name, selected_files):
-    pygame.mixer.init()
-    if selected_files:
-        for file_path in selected_files:
-            if os.path.exists(file_path):
-                pygame.mixer.music.load(file_path)
-                pygame.mixer.music.play()
-                log_action(f"{song_name} played this file: {os.path.basename(file_path)}", species_var.get())
-                while pygame.mixer.music.get_busy():
-                    pygame.time.Clock().tick(10)
-                    time.sleep(0.5)
-                    
-            else:
-                log_action(f"File not found: {file_path}", species_var.get())
-    else:
-        log_action(f"No sound selected for {song_name}", species_var.get())
 #------------------------------------------------------------------------------
 #Experimental details
 # Function to generate schedule based on user input
@@ -363,86 +277,29 @@ def generate_schedule():
         {'start': start_time2_spinbox.get(), 'end': end_time2_spinbox.get(), 'selection': 2},
         {'start': start_time3_spinbox.get(), 'end': end_time3_spinbox.get(), 'selection': 3},
         {'start': start_time4_spinbox.get(), 'end': end_time4_spinbox.get(), 'selection': 4},
-        {'start': start_time5_spinbox.get(), 'end': end_time5_spinbox.get(), 'selection': 5}
+        {'start': start_time5_spinbox.get(), 'end': end_time5_spinbox.get(), 'selection': 5},
+        {'start': start_time6_spinbox.get(), 'end': end_time6_spinbox.get(), 'selection': 6}
     ]
+
+# Compile the switching times into the schedule of the engine, it switches at the exact times
+def compile_schedule():
+    global schedule_edit_timer
+    schedule_edit_timer = None
+    try:
+        engine.set_schedule([(entry['selection'], entry['start'], entry['end']) for entry in generate_schedule()])
+    except ValueError as e:
+        print(f"Schedule not updated: {e}")  # e.g. a time being typed in
+
+# Recompile shortly after the user stops editing a time
+def on_schedule_edit(*args):
+    global schedule_edit_timer
+    if schedule_edit_timer is not None:
+        root.after_cancel(schedule_edit_timer)
+    schedule_edit_timer = root.after(300, compile_schedule)
     
+# Position chosen for a switching section
 def handle_songs_position(event, number_event):
-    speaker_starting = switch_selection_vars[number_event].get()
-    if speaker_starting == "A-1, B-2, C-3, D-4":
-        speaker_pos("A","B","C","D")
-    elif speaker_starting == "A-1, B-2, C-4, D-3":
-        speaker_pos("A","B","D","C")
-    elif speaker_starting == "A-1, B-4, C-3, D-2":
-        speaker_pos("A","D","C","B")
-    elif speaker_starting == "A-1, B-4, C-2, D-3":
-        speaker_pos("A","C","D","B") 
-    elif speaker_starting == "A-1, B-3, C-2, D-4":
-        speaker_pos("A","C","B","D")
-    elif speaker_starting == "A-1, B-3, C-4, D-2":
-        speaker_pos("A","D","B","C")     
-        
-    elif speaker_starting == "A-2, B-3, C-4, D-1":
-        speaker_pos("D","A","B","C")
-    elif speaker_starting == "A-2, B-1, C-4, D-3":
-        speaker_pos("B","A","D","C")
-    elif speaker_starting == "A-2, B-1, C-3, D-4":
-        speaker_pos("B","A","C","D")
-    elif speaker_starting == "A-2, B-4, C-3, D-1":
-        speaker_pos("D","A","C","B")
-    elif speaker_starting == "A-2, B-4, C-1, D-3":
-        speaker_pos("C","A","D","B")
-    elif speaker_starting == "A-2, B-3, C-1, D-4":
-        speaker_pos("C","A","B","D")
-
-    elif speaker_starting == "A-3, B-4, C-1, D-2":
-        speaker_pos("C","D","A","B")
-    elif speaker_starting == "A-3, B-4, C-2, D-1":
-        speaker_pos("D","C","A","B")
-    elif speaker_starting == "A-3, B-1, C-2, D-4":
-        speaker_pos("B","C","A","D")
-    elif speaker_starting == "A-3, B-1, C-4, D-2":
-        speaker_pos("B","D","A","C")     
-    elif speaker_starting == "A-3, B-2, C-1, D-4":
-        speaker_pos("C","B","A","D")
-    elif speaker_starting == "A-3, B-2, C-4, D-1":
-        speaker_pos("D","B","A","C")  
-
-    elif speaker_starting == "A-4, B-1, C-2, D-3":
-        speaker_pos("B","C","D","A")
-    elif speaker_starting == "A-4, B-1, C-3, D-2":
-        speaker_pos("B","D","C","A")  
-    elif speaker_starting == "A-4, B-3, C-2, D-1":
-        speaker_pos("D","C","B","A") 
-    elif speaker_starting == "A-4, B-3, C-1, D-2":
-        speaker_pos("C","D","B","A")
-    elif speaker_starting == "A-4, B-2, C-1, D-3":
-        speaker_pos("C","B","D","A")
-    elif speaker_starting == "A-4, B-2, C-3, D-1":
-        speaker_pos("D","B","C","A")
-    
-def speaker_pos(speaker_1, speaker_2, speaker_3, speaker_4):
-    global speaker_info 
-    speaker_info = {
-        'song_1': selected_files_dict[f"Song{speaker_1}"],
-        'song_2': selected_files_dict[f"Song{speaker_2}"],
-        'song_3': selected_files_dict[f"Song{speaker_3}"],
-        'song_4': selected_files_dict[f"Song{speaker_4}"],
-        'speaker_1': speaker_1,
-        'speaker_2': speaker_2,
-        'speaker_3': speaker_3,
-        'speaker_4': speaker_4,
-        }
-
-# Function to update the speaker_info based on the current time
-def update_speaker_info():
-    current_time = datetime.now().strftime('%H:%M:%S')
-    schedule = generate_schedule()
-    for entry in schedule:
-        if entry['start'] <= current_time <= entry['end']:
-            handle_songs_position(None, entry['selection'])
-            #print(f"Updated speaker_info: {speaker_info}")  
-            break
-    root.after(5000, update_speaker_info)  # Call this function again after 5 second
+    engine.set_position(number_event, switch_selection_vars[number_event].get())
 
 def check_start_time(switch_button, start_time):
     if switch_button.get() == 1:
@@ -480,50 +337,16 @@ def check_only_one_checkbutton(selected_button, conflicting_button1, conflicting
         conflicting_button4.state(['!disabled'])
         conflicting_button5.state(['!disabled'])
 
-# Initialize store_count with empty dictionaries for each section
-def initialize_store_count():
-    global store_count
-    store_count = {}
-
-    schedule = generate_schedule()
-    for entry in schedule:
-        selection = entry['selection']
-        store_count[selection] = {
-            "A_position": 0,
-            "B_position": 0,
-            "C_position": 0,
-            "D_position": 0
-        }
-
-def Count_storage():
-    global store_count
-    
-    current_time = datetime.now().strftime('%H:%M:%S')
-    schedule = generate_schedule()
-    
-    for entry in schedule:
-        selection = entry['selection']
-                
-        if entry['start'] <= current_time <= entry['end']:
-            # Safely convert the textbox content to integers, defaulting to 0 if empty
-            store_count[selection]["A_position"] = int(countA_textbox.get("1.0", tk.END).strip() or 0)
-            store_count[selection]["B_position"] = int(countB_textbox.get("1.0", tk.END).strip() or 0)
-            store_count[selection]["C_position"] = int(countC_textbox.get("1.0", tk.END).strip() or 0)
-            store_count[selection]["D_position"] = int(countD_textbox.get("1.0", tk.END).strip() or 0)
-            break
-
-    root.after(5000, Count_storage)  # Call this function again after 5000 milliseconds (5 seconds)
+# Show the counts of a section in the count boxes (Tk thread)
+def show_section_counts(section):
+    for stimulus, count in engine.counts.section_totals(section, arena.stimuli).items():
+        ui_updates.set_text(count_textboxes[stimulus], str(count))
 
 #------------------------------------------------------------------------------
 # Timer Function
 def start_timer():
-    global start_time, stop_timer_flag
-    stop_timer_flag = False
+    global start_time
     start_time = datetime.now()
-
-def stop_timer():
-    global stop_timer_flag
-    stop_timer_flag = True
             
 # Function of the datetime
 def update_datetime_label():
@@ -532,87 +355,30 @@ def update_datetime_label():
     first_frame.after(1000, update_datetime_label)
 
 ### Start/End functions
-def on_run():
-    command = "n r/n"
-    response = send_command(command)
-    time.sleep(1)
-    print("Progam is starting with {response}")
-    
-def on_pause():
-    command = "p r/n"
-    response = send_command(command)
-    time.sleep(1)
-    print("Program is stopping with {response}")
-    
 def on_reset():
-    command = "r r/n"
-    response = send_command(command)
-    time.sleep(1)
-    print("Program is reset with {response}")
+    engine.reset()
 
 def on_clear():
-    command = "c r/n"
-    response = send_command(command)
-    time.sleep(1)
-    print("Counter is clear with {response}")
+    engine.clear_counters()
+    show_active_counts()
 
-on_clear()
- 
-def close_speakers():                     
-        send_command('sa10 r/n')
-        send_command('sa20 r/n')
-        send_command('sa30 r/n')
-        send_command('sa40 r/n')
-
-#LOG Starting FUNCTION
-def log_variable_state():
-    current_datetime = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
-       
-    # Get the selected files for each sensor
-    files_songA = selected_files_dict.get("SongA", [])
-    files_songB = selected_files_dict.get("SongB", [])
-    files_songC = selected_files_dict.get("SongC", [])
-    files_songD = selected_files_dict.get("SongD", [])
-    
-    log_entry = (f"{current_datetime}\nExperiment name: {experiment_name.get()}\nSpecies tested: {species_var.get()}\nStarting position: {switch_selection_vars[0].get()}\
-                \nPerch timeout(ms): {button_delay.get()}\
-                \nThe files selected for Song A are: {', '.join(files_songA)}\nThe files selected for Song C are: {', '.join(files_songB)}\
-                \nThe files selected for Song C are: {', '.join(files_songC)}\nThe files selected for Song D are: {', '.join(files_songD)}\
-                \nStart time setted for {start_time_spinbox.get()} & End time setted for {end_time_spinbox.get()}")
-    log_data.append(log_entry)
-    log_text.insert(tk.END, log_entry + "\n")
-    log_text.see(tk.END)
-
-#LOG Ending function
-def log_ending_state():
-    current_datetime = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
+#The count boxes show the counts of the active section again, after they were cleared
+def show_active_counts():
+    sections = engine.active_sections
+    ui_updates.call(show_section_counts, sections[0] if sections else None)
 
-    log_entry = f"{current_datetime}\nExperiment name: {experiment_name.get()}\nSpecies tested: {species_var.get()}\n"
+on_clear()
 
-    # List of comboboxes for easier management
-    switch_comboboxes = [
-        switch_selection0,
-        switch_selection2,
-        switch_selection3,
-        switch_selection4,
-        switch_selection5,
-        switch_selection6,
-    ]
+#Session start: the engine sets the perch timeout, logs the starting state and runs the box (same path as headless.py)
+def start_session():
+    snapshot_session_labels()
+    engine.start_session(button_delay_std.get(), start_time_spinbox.get(), end_time_spinbox.get())
+    show_active_counts()
 
-    # Iterate over each combobox and its index
-    for i, combobox in enumerate(switch_comboboxes):
-        selected_value = combobox.get()  # Get the selected value from the combobox
-        
-        log_entry += (f"Switch {i}, Position ({selected_value}): \n")
-    
-    for selection, counts in store_count.items():
-        log_entry += (f"Section {selection}: Song A: {counts['A_position']}, "
-                      f"Song B: {counts['B_position']}, Song C: {counts['C_position']}, "
-                      f"Song D: {counts['D_position']}\n")   
-             
-    log_data.append(log_entry)
-    log_text.insert(tk.END, log_entry + "\n")
-    log_text.see(tk.END)
+#Session end: the engine stops the box, logs the ending state and closes the speakers
+def stop_session():
+    snapshot_session_labels()
+    engine.stop_session()
     
 #Variable of timing
 Save_at_state = tk.BooleanVar(value=True) #Initially ON
@@ -661,6 +427,10 @@ log_text = tk.Text(
 )
 log_text.pack(fill="both", expand=True)
 
+#Only the last lines stay in the widget, the full history is in log_data
+LOG_VIEW_LINES = 2000
+log_view = LogView(log_text, log_data, max_lines=LOG_VIEW_LINES)
+
 # Configure the horizontal scrollbar to control the log text widget
 log_x_scrollbar.config(command=log_text.xview)
 
@@ -675,6 +445,14 @@ export_button.pack(side="right", pady=10)
 export_button2 = tk.Button(log_frame, text="Export as CSV", command=export_to_csv, bg="blue", fg="white", font=("Times New Roman", 12, "bold"))
 export_button2.pack(side="right", pady=10)
 
+#Export the typed records in the binary columnar format
+export_button3 = tk.Button(log_frame, text="Export Columnar", command=export_to_columnar, bg="blue", fg="white", font=("Times New Roman", 12, "bold"))
+export_button3.pack(side="right", pady=10)
+
+#Page through the full log
+history_button = tk.Button(log_frame, text="Full Log", command=log_view.open_history, bg="gray", fg="white", font=("Times New Roman", 12, "bold"))
+history_button.pack(side="right", padx=5, pady=10)
+
 #Clear the log
 clear_log_button = tk.Button(log_frame, text="Clear Log", command=clear_log, bg="red", fg="white", font=("Times New Roman", 12, "bold"))
 clear_log_button.pack(side="right", padx=5, pady=10)
@@ -729,29 +507,29 @@ other1_entry.place(x=950, y=90)
 
 #Switching
 switch_selection_vars = {
-    0: tk.StringVar(value="A-1, B-2, C-3, D-4"),
-    2: tk.StringVar(value="A-1, B-2, C-3, D-4"),
-    3: tk.StringVar(value="A-1, B-2, C-3, D-4"),
-    4: tk.StringVar(value="A-1, B-2, C-3, D-4"),
-    5: tk.StringVar(value="A-1, B-2, C-3, D-4"),
-    6: tk.StringVar(value="A-1, B-2, C-3, D-4"),
+    0: tk.StringVar(value=arena.default_label),
+    2: tk.StringVar(value=arena.default_label),
+    3: tk.StringVar(value=arena.default_label),
+    4: tk.StringVar(value=arena.default_label),
+    5: tk.StringVar(value=arena.default_label),
+    6: tk.StringVar(value=arena.default_label),
 }
 
 #START AND END OPTIONS
 start_time1_var =tk.StringVar(value="08:00:00")
 start_time_label = tk.Label(first_frame, text="Start time")
 start_time_label.place(x=580, y=140)
-start_time_spinbox = ttk.Spinbox(first_frame, textvariable=start_time1_var, values=create_time_values(), wrap="True", width= 10)
+start_time_spinbox = create_time_spinbox(first_frame, start_time1_var)
 start_time_spinbox.place(x=650, y=140)
 
 end_time_var =tk.StringVar(value="16:00:00")
 end_time_label = tk.Label(first_frame, text="End time")
 end_time_label.place(x=750, y=140)
-end_time_spinbox = ttk.Spinbox(first_frame, textvariable=end_time_var, values=create_time_values(), wrap="True", width= 10)
+end_time_spinbox = create_time_spinbox(first_frame, end_time_var)
 end_time_spinbox.place(x=820, y=140)
 
 # Create a Checkbutton widget
-Save_at = ttk.Checkbutton(first_frame, text="Save at 00:00:00 hour", variable=Save_at_state, command=save_at_00())
+Save_at = ttk.Checkbutton(first_frame, text="Save at 00:00:00 hour", variable=Save_at_state, command=toggle_daily_save)
 Save_at.place(x=935, y=140)
 #--------------------------------------------------------------
 ## SONG FRAME [1]
@@ -771,7 +549,7 @@ selected_files_label.place(x=550, y=50)
 #---------------------------------------------------------------------------------------------
 # SONG A
 # Label
-song1_label = tk.Button(song_frame, text="Song A", font=("Times New Roman", 12), command=lambda: [send_command("sa11 r/n"), play_sounds("SongA", selected_files_dict["SongA"]), send_command("sa10 r/n")])
+song1_label = tk.Button(song_frame, text="Song A", font=("Times New Roman", 12), command=lambda: [send_command("sa11 r/n"), engine.play("A", 1)])
 song1_label.place(x=40, y=85)
 # Selection and Button
 select_file_button1 = ttk.Button(song_frame, text="Select File for Song A", command=lambda: select_audio_files("SongA"))
@@ -799,7 +577,7 @@ countA_textbox.place(x=1000, y=90)
 #---------------------------------------------------------------------------------------------
 # SONG B
 # Label
-song2_label = tk.Button(song_frame, text="Song B", font=("Times New Roman", 12), command=lambda: [send_command("sa21 r/n"), play_sounds("SongB", selected_files_dict["SongB"]), send_command("sa20 r/n")])
+song2_label = tk.Button(song_frame, text="Song B", font=("Times New Roman", 12), command=lambda: [send_command("sa21 r/n"), engine.play("B", 2)])
 song2_label.place(x=40, y=140)
 # Selection and Button
 select_file_button2 = ttk.Button(song_frame, text="Select File for Song B", command=lambda: select_audio_files("SongB"))
@@ -827,7 +605,7 @@ countB_textbox.place(x=1000, y=140)
 #---------------------------------------------------------------------------------------------
 # SONG C
 # Label
-song3_label = tk.Button(song_frame, text="Song C", font=("Times New Roman", 12), command=lambda: [send_command("sa31 r/n"), play_sounds("SongC", selected_files_dict["SongC"]), send_command("sa30 r/n")])
+song3_label = tk.Button(song_frame, text="Song C", font=("Times New Roman", 12), command=lambda: [send_command("sa31 r/n"), engine.play("C", 3)])
 song3_label.place(x=40, y=190)
 # Selection and Button
 select_file_button3 = ttk.Button(song_frame, text="Select File for Song C", command=lambda: select_audio_files("SongC"))
@@ -856,7 +634,7 @@ countC_textbox.place(x=1000, y=190)
 #---------------------------------------------------------------------------------------------
 # SONG D
 # Label
-song4_label = tk.Button(song_frame, text="Song D", font=("Times New Roman", 12), command=lambda: [send_command("sa41 r/n"), play_sounds("SongD", selected_files_dict["SongD"]), send_command("sa40 r/n")])
+song4_label = tk.Button(song_frame, text="Song D", font=("Times New Roman", 12), command=lambda: [send_command("sa41 r/n"), engine.play("D", 4)])
 song4_label.place(x=40, y=240)
 # Selection and Button
 select_file_button4 = ttk.Button(song_frame, text="Select File for Song D", command=lambda: select_audio_files("SongD"))
@@ -889,6 +667,10 @@ selected_file_labels = {
     "SongB": selected_files_textbox2,
     "SongC": selected_files_textbox3,
     "SongD": selected_files_textbox4}
+#Count textbox of each stimulus
+count_textboxes = {"A": countA_textbox, "B": countB_textbox, "C": countC_textbox, "D": countD_textbox}
+for count_textbox in count_textboxes.values():
+    count_textbox.bind("<Key>", lambda event: "break")  # read-only, filled from engine.counts
 #---------------------------------------------------------------------------------------------
 #Switch frame
 switch_frame = tk.Frame(main_frame, width=1138, height=350)
@@ -915,21 +697,18 @@ end_switch_label.place(x=790, y=50)
 switch1_label = tk.Label(switch_frame, text="Start position", font=("Times New Roman", 12))
 switch1_label.place(x=230, y=90)
 # Selection
-switch_selection0 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                  "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                  "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                  "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
+switch_selection0 = ttk.Combobox(switch_frame, values=arena.labels,
                               textvariable=switch_selection_vars[0], width=20, state="readonly", justify="center")
 switch_selection0.place(x=320, y=90)
 
 switch_selection0.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 0))
 
 # Start time
-start_time1_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time1_var, values=create_time_values(), wrap="True", width= 10)
+start_time1_spinbox = create_time_spinbox(switch_frame, start_time1_var)
 start_time1_spinbox.place(x=480, y=90)
 # End time
 end_time1_var = tk.StringVar(value="12:00:00")
-end_time1_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time1_var, values=create_time_values(), wrap="True", width= 10)
+end_time1_spinbox = create_time_spinbox(switch_frame, end_time1_var)
 end_time1_spinbox.place(x=580, y=90)
 #First switch button
 first_switch_button1 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state1,
@@ -949,22 +728,19 @@ last_switch_button1.place(x=810, y=90)
 switch2_label = tk.Label(switch_frame, text="1st switch", font=("Times New Roman", 12))
 switch2_label.place(x=230, y=130)
 # Selection
-switch_selection2 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                 "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                 "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                 "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
-                             textvariable=switch_selection_vars[2], width=20, state="readonly", justify="center")
+switch_selection2 = ttk.Combobox(switch_frame, values=arena.labels,
+                              textvariable=switch_selection_vars[2], width=20, state="readonly", justify="center")
 switch_selection2.place(x=320, y=130)
 
 switch_selection2.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 2))
 
 # Start time
 start_time2_var = end_time1_var
-start_time2_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time2_var, values=create_time_values(), wrap="True", width= 10)
+start_time2_spinbox = create_time_spinbox(switch_frame, start_time2_var)
 start_time2_spinbox.place(x=480, y=130)
 # End time
 end_time2_var = tk.StringVar(value="16:00:00")
-end_time2_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time2_var, values=create_time_values(), wrap="True", width= 10)
+end_time2_spinbox = create_time_spinbox(switch_frame, end_time2_var)
 end_time2_spinbox.place(x=580, y=130)
 #First switch button
 first_switch_button2 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state2,
@@ -984,22 +760,19 @@ last_switch_button2.place(x=810, y=130)
 switch3_label = tk.Label(switch_frame, text="2nd switch", font=("Times New Roman", 12))
 switch3_label.place(x=230, y=170)
 # Selection
-switch_selection3 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                 "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                 "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                 "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
-                             textvariable=switch_selection_vars[3], width=20, state="readonly", justify="center")
+switch_selection3 = ttk.Combobox(switch_frame, values=arena.labels,
+                              textvariable=switch_selection_vars[3], width=20, state="readonly", justify="center")
 switch_selection3.place(x=320, y=170)
 
 switch_selection3.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 3))
 
 # Start time
 start_time3_var = end_time2_var
-start_time3_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time3_var, values=create_time_values(), wrap="True", width= 10)
+start_time3_spinbox = create_time_spinbox(switch_frame, start_time3_var)
 start_time3_spinbox.place(x=480, y=170)
 # End time
 end_time3_var = tk.StringVar(value="00:00:00")
-end_time3_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time3_var, values=create_time_values(), wrap="True", width= 10)
+end_time3_spinbox = create_time_spinbox(switch_frame, end_time3_var)
 end_time3_spinbox.place(x=580, y=170)
 #First switch button
 first_switch_button3 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state3,
@@ -1019,22 +792,19 @@ last_switch_button3.place(x=810, y=170)
 switch4_label = tk.Label(switch_frame, text="3rd switch", font=("Times New Roman", 12))
 switch4_label.place(x=230, y=210)
 # Selection
-switch_selection4 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                 "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                 "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                 "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
-                             textvariable=switch_selection_vars[4], width=20, state="readonly", justify="center")
+switch_selection4 = ttk.Combobox(switch_frame, values=arena.labels,
+                              textvariable=switch_selection_vars[4], width=20, state="readonly", justify="center")
 switch_selection4.place(x=320, y=210)
 
 switch_selection4.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 4))
 
 # Start time
 start_time4_var = end_time3_var
-start_time4_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time4_var, values=create_time_values(), wrap="True", width= 10)
+start_time4_spinbox = create_time_spinbox(switch_frame, start_time4_var)
 start_time4_spinbox.place(x=480, y=210)
 # End time
 end_time4_var = tk.StringVar(value="00:00:00")
-end_time4_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time4_var, values=create_time_values(), wrap="True", width= 10)
+end_time4_spinbox = create_time_spinbox(switch_frame, end_time4_var)
 end_time4_spinbox.place(x=580, y=210)
 #First switch button
 first_switch_button4 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state4,
@@ -1054,22 +824,19 @@ last_switch_button4.place(x=810, y=210)
 switch5_label = tk.Label(switch_frame, text="4th switch", font=("Times New Roman", 12))
 switch5_label.place(x=230, y=250)
 # Selection
-switch_selection5 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                 "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                 "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                 "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
-                             textvariable=switch_selection_vars[5], width=20, state="readonly", justify="center")
+switch_selection5 = ttk.Combobox(switch_frame, values=arena.labels,
+                              textvariable=switch_selection_vars[5], width=20, state="readonly", justify="center")
 switch_selection5.place(x=320, y=250)
 
 switch_selection5.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 5))
 
 # Start time
 start_time5_var = end_time4_var
-start_time5_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time5_var, values=create_time_values(), wrap="True", width= 10)
+start_time5_spinbox = create_time_spinbox(switch_frame, start_time5_var)
 start_time5_spinbox.place(x=480, y=250)
 # End time
 end_time5_var = tk.StringVar(value="00:00:00")
-end_time5_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time5_var, values=create_time_values(), wrap="True", width= 10)
+end_time5_spinbox = create_time_spinbox(switch_frame, end_time5_var)
 end_time5_spinbox.place(x=580, y=250)
 #First switch button
 first_switch_button5 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state5,
@@ -1089,22 +856,19 @@ last_switch_button5.place(x=810, y=250)
 switch6_label = tk.Label(switch_frame, text="5th switch", font=("Times New Roman", 12))
 switch6_label.place(x=230, y=290)
 # Selection
-switch_selection6 = ttk.Combobox(switch_frame, values=["A-1, B-2, C-3, D-4","A-1, B-2, C-4, D-3","A-1, B-4, C-3, D-2","A-1, B-4, C-2, D-3","A-1, B-3, C-2, D-4","A-1, B-3, C-4, D-2",
-                                                 "A-2, B-3, C-4, D-1","A-2, B-1, C-4, D-3","A-2, B-1, C-3, D-4","A-2, B-4, C-3, D-1","A-2, B-4, C-1, D-3","A-2, B-3, C-1, D-4",
-                                                 "A-3, B-4, C-1, D-2","A-3, B-4, C-2, D-1","A-3, B-1, C-2, D-4","A-3, B-1, C-4, D-2","A-3, B-2, C-1, D-4","A-3, B-2, C-4, D-1",  
-                                                 "A-4, B-1, C-2, D-3","A-4, B-1, C-3, D-2","A-4, B-3, C-2, D-1","A-4, B-3, C-1, D-2","A-4, B-2, C-1, D-3","A-4, B-2, C-3, D-1"],
-                             textvariable=switch_selection_vars[6], width=20, state="readonly", justify="center")
+switch_selection6 = ttk.Combobox(switch_frame, values=arena.labels,
+                              textvariable=switch_selection_vars[6], width=20, state="readonly", justify="center")
 switch_selection6.place(x=320, y=290)
 
 switch_selection6.bind("<<ComboboxSelected>>", lambda event: handle_songs_position(event, 6))
 
 # Start time
 start_time6_var = end_time5_var
-start_time6_spinbox = ttk.Spinbox(switch_frame, textvariable=start_time6_var, values=create_time_values(), wrap="True", width= 10)
+start_time6_spinbox = create_time_spinbox(switch_frame, start_time6_var)
 start_time6_spinbox.place(x=480, y=290)
 # End time
 end_time6_var = tk.StringVar(value="00:00:00")
-end_time6_spinbox = ttk.Spinbox(switch_frame, textvariable=end_time6_var, values=create_time_values(), wrap="True", width= 10)
+end_time6_spinbox = create_time_spinbox(switch_frame, end_time6_var)
 end_time6_spinbox.place(x=580, y=290)
 #First switch button
 first_switch_button6 = ttk.Checkbutton(switch_frame, text="", variable=first_switch_state6,
@@ -1119,6 +883,16 @@ last_switch_button6 = ttk.Checkbutton(switch_frame, text="", variable=last_switc
                                                                                 last_switch_button4, last_switch_button5, last_switch_button1),
                                                       check_end_time(last_switch_state6, end_time6_var)])
 last_switch_button6.place(x=810, y=290)
+#---------------------------------------------------------------------------------------------
+#Latency panel: live p50/p95/max per perch of the latency telemetry (see telemetry.py)
+latency_label = tk.Label(switch_frame, text="Latency (ms)", font=("Times New Roman", 12))
+latency_label.place(x=880, y=50)
+latency_text = tk.Label(switch_frame, text="", font=("Courier New", 8), justify="left", anchor="nw")
+latency_text.place(x=870, y=80)
+
+def refresh_latency_panel():
+    latency_text.config(text=engine.telemetry.panel_text())
+    root.after(LATENCY_REFRESH_MS, refresh_latency_panel)
 #------------------------------------------------------------------------------
 #FINAL FRAME
 #Frame
@@ -1127,41 +901,36 @@ final_frame.place(x=00, y=800)
 
 #START BUTTON
 start_button = tk.Button(final_frame, text="START", bg="green", fg="white", font=("Times New Roman", 12, "bold"),
-                          command=lambda: [start_timer(), on_select(), log_variable_state(), on_run()])
+                          command=lambda: [start_timer(), start_session()])
 start_button.place(x=960, y=15)
 
 #END BUTTON
 end_button = tk.Button(final_frame, text="END", bg="red", fg="white", font=("Times New Roman", 12, "bold"),
-                       command=lambda: [stop_timer(), export_to_txt(), on_pause(), on_clear(), on_reset(), log_ending_state(), close_speakers()])
+                       command=lambda: [export_to_txt(), stop_session(), on_clear(), on_reset()])
 end_button.place(x=1060, y=15)
 
 #------------------------------------------------------------------------------
 #Log action and decode of the response
 
-#Function to close the serial port if it's open
-def close_serial_port_if_open():
-    global ser
-    if ser is not None:
-        try:
-            ser.close()
-        except AttributeError:
-            print("Failed to close the serial port.")
-
 #Function to handle window close event
 def on_closing():
-    close_serial_port_if_open()
+    engine.close()
     root.destroy()
 
-update_speaker_info()
+snapshot_session_labels()
+ui_updates.on_tick(snapshot_session_labels)
 
-# Start a background thread to read from Arduino
-thread = threading.Thread(target=read_from_arduino)
-thread.daemon = True
-thread.start()
+toggle_daily_save()
+refresh_latency_panel()
 
-initialize_store_count()
+for section in switch_selection_vars:
+    handle_songs_position(None, section)
+compile_schedule()
+for time_var in (start_time1_var, end_time1_var, end_time2_var, end_time3_var, end_time4_var, end_time5_var, end_time6_var):
+    time_var.trace_add("write", on_schedule_edit)
 
-Count_storage()
+# Start handling the perch events and following the schedule
+engine.start()
 
 #Bind the window close event to the on_closing function
 root.protocol("WM_DELETE_WINDOW", on_closing)
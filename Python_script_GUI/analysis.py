@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+Analysis of exported 4CT logs:
+    python analysis.py exports/*.csv old_runs/*.txt --by section,stimulus
+
+Reads, one line at a time, every kind of log the software writes:
+- text logs (Export as TXT, and the old Export as CSV which wrote the same lines): one
+  "n_experiment_species_YYYY-mm-dd_HH:MM:SS.fff_action" entry per line, mixed with the multi-line
+  start and end blocks of the sessions
+- session journals (4CT/sessions)
+- CSV exports and daily files with one column per field, and columnar .4ctcol exports
+The events go into NumPy columns, the tables (perch events per section, stimulus, perch, day...)
+are computed on whole columns at once, so a month of logs takes seconds.
+
+The text lines do not say the section or the position of an event: the stimulus of a perch event
+is the song started right after it ("SongB on speaker 2: started", or "SongB played this file" in
+older logs), else the last song that perch started, else the one of the starting position of the
+session; the section is unknown (-1). The CSV and columnar exports have both.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from event_records import CSV_HEADER, EVENT_TYPES, read_columnar
+from log_writer import JOURNAL_SUFFIX
+
+#"n_experiment_species_" of a log entry, the names may hold "_" too: the date tells where they end
+ENTRY = re.compile(r"(\d+_.*?)_\d{4}-\d\d-\d\d_\d\d:\d\d:\d\d\.\d{3}_")
+BLOCK_START = re.compile(r"^\d{2}:\d{2}:\d{2} \d{2}/\d{2}/\d{4}$")   # first line of a start or end block
+POSITION = re.compile(r"([A-Z])-(\d+)")
+SECTION_COUNTS = re.compile(r"^(?:Section (-?\d+)|Outside the sections): (.*)$")
+SONG_COUNT = re.compile(r"Song ([A-Z]): (\d+)")
+CHUNK = 100000   # events converted to NumPy at once
+
+COLUMNS = (                 # name, array typecode; -1 (0 for the stimulus, NaN for the value) when unknown
+    ("event", "B"),        # index in EVENT_TYPES
+    ("perch", "b"),
+    ("stimulus", "B"),     # letter code, "A" = 65
+    ("section", "h"),
+    ("count", "i"),
+    ("value", "d"),
+    ("source", "H"),       # index of the file in Events.sources
+)
+
+
+#Events of a set of log files, one NumPy array per column
+class Events:
+    def __init__(self):
+        self.chunks = {name: [] for name, _ in COLUMNS}
+        self.chunks["time"] = []
+        self.sources = []
+        self.summaries = []     # (source, section, stimulus, count) of the end blocks
+        self.columns = None
+
+    #rows: ("YYYY-mm-ddTHH:MM:SS.fff", event, perch, stimulus, section, count, value) of the current source
+    def extend(self, rows):
+        if not rows:
+            return
+        values = list(zip(*rows))
+        self.chunks["time"].append(np.array(values[0], dtype="datetime64[ms]"))
+        for (name, typecode), column in zip(COLUMNS[:-1], values[1:]):
+            self.chunks[name].append(np.array(column, dtype=typecode))
+        self.chunks["source"].append(np.full(len(rows), len(self.sources) - 1, dtype=np.uint16))
+
+    #Columns already converted (columnar files)
+    def extend_columns(self, columns):
+        for name, column in columns.items():
+            self.chunks[name].append(column)
+
+    #Columns as NumPy arrays: time (datetime64[ms]) and the COLUMNS
+    def finish(self):
+        dtypes = dict(COLUMNS, time="datetime64[ms]")
+        self.columns = {name: np.concatenate(chunks) if chunks else np.array([], dtype=dtypes[name])
+                        for name, chunks in self.chunks.items()}
+        return self
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["event"])
+
+
+#------------------------------------------------------------------------------
+#Readers, each one adds the events of a file
+#The lines of a session share the experiment and species names, so the entries are split with
+#str.split at the date found in the first one; the regular expression only runs when that changes
+def read_text_lines(lines, events):
+    perch_stimulus = {}   # perch -> stimulus, from the starting position then from the songs played
+    last_perch = None     # row of the last perch event, until the song it started is known
+    in_block = False
+    date_field = 3        # index of the date among the "_" separated fields
+    codes = {name: code for code, name in enumerate(EVENT_TYPES)}
+    nan = float("nan")
+    rows = []
+    for line in lines:
+        if len(rows) >= CHUNK:
+            events.extend(rows)
+            rows, last_perch = [], None
+        fields = line.split("_", date_field + 2)
+        if len(fields) < date_field + 3 or fields[date_field][4:5] != "-" or fields[date_field + 1][8:9] != ".":
+            entry = ENTRY.match(line)
+            if entry is not None:
+                date_field = entry.group(1).count("_") + 1
+                fields = line.split("_", date_field + 2)
+            else:
+                # Line of a start or end block
+                line = line.strip()
+                if BLOCK_START.match(line):
+                    in_block = True
+                elif in_block and line.startswith("Starting position:"):
+                    perch_stimulus = {int(perch): ord(stimulus) for stimulus, perch in POSITION.findall(line)}
+                elif in_block:
+                    counts = SECTION_COUNTS.match(line)
+                    if counts:
+                        section = int(counts.group(1)) if counts.group(1) is not None else -1
+                        for stimulus, count in SONG_COUNT.findall(counts.group(2)):
+                            events.summaries.append((len(events.sources) - 1, section, ord(stimulus), int(count)))
+                continue
+        in_block = False
+        time = f"{fields[date_field]}T{fields[date_field + 1]}"
+        action = fields[date_field + 2]
+        if action.startswith("Perch "):
+            perch, separator, count = action[6:].partition(", count: ")
+            if separator and perch.isdigit():
+                perch = int(perch)
+                count = count.split(",", 1)[0].strip()
+                rows.append((time, codes["perch"], perch, perch_stimulus.get(perch, 0), -1,
+                             int(count) if count.lstrip("-").isdigit() else -1, nan))
+                last_perch = len(rows) - 1
+                continue
+        elif action.startswith("Song"):
+            stimulus, speaker = ord(action[4]), None
+            if action[5:17] == " on speaker ":
+                speaker = action[17:].partition(":")[0]
+                speaker = int(speaker) if speaker.isdigit() else None
+                code = codes["message"]
+            elif action[5:25] == " played this file: ":
+                code = codes["playback"]
+            else:
+                code = None
+            if code is not None:
+                # The perch just before started this song: perch n is in front of speaker n
+                if last_perch is not None and speaker in (None, rows[last_perch][2]):
+                    speaker = rows[last_perch][2]
+                    rows[last_perch] = rows[last_perch][:3] + (stimulus,) + rows[last_perch][4:]
+                if speaker is not None:
+                    perch_stimulus[speaker] = stimulus
+                last_perch = None
+                rows.append((time, code, -1, stimulus, -1, -1, nan))
+                continue
+        elif action.startswith("No sound selected for Song"):
+            if last_perch is not None:
+                rows[last_perch] = rows[last_perch][:3] + (ord(action[26]),) + rows[last_perch][4:]
+                perch_stimulus[rows[last_perch][2]] = ord(action[26])
+                last_perch = None
+            rows.append((time, codes["no_sound"], -1, ord(action[26]), -1, -1, nan))
+            continue
+        elif action.startswith("File not found:"):
+            rows.append((time, codes["missing_file"], -1, 0, -1, -1, nan))
+            continue
+        rows.append((time, codes["message"], -1, 0, -1, -1, nan))
+    events.extend(rows)
+
+def read_csv_export(file, events):
+    codes = {name: code for code, name in enumerate(EVENT_TYPES)}
+    rows = []
+    for row in csv.DictReader(file):
+        code = codes.get(row["event"])
+        if code is None:
+            continue
+        rows.append((row["wall_time"][:23], code,
+                     int(row["perch"]) if row["perch"] else -1,
+                     ord(row["stimulus"]) if row["stimulus"] else 0,
+                     int(row["section"]) if row["section"] else -1,
+                     int(row["count"]) if row["count"] else -1,
+                     float(row["value"]) if row.get("value") else float("nan")))
+        if len(rows) >= CHUNK:
+            events.extend(rows)
+            rows = []
+    events.extend(rows)
+
+def read_columnar_export(path, events):
+    columns, _, event_types = read_columnar(path)
+    codes = np.array([EVENT_TYPES.index(name) if name in EVENT_TYPES else 255 for name in event_types] or [255],
+                     dtype=np.uint8)[np.frombuffer(columns["event"], dtype=np.uint8)]
+    keep = codes != 255
+    wall = np.frombuffer(columns["wall"], dtype=np.float64)[keep]
+    # Local time like the other logs, with the UTC offset of the first event
+    offset = datetime.fromtimestamp(wall[0]).astimezone().utcoffset().total_seconds() if len(wall) else 0
+    converted = {"time": np.round((wall + offset) * 1000).astype(np.int64).astype("datetime64[ms]"),
+                 "event": codes[keep], "source": np.full(len(wall), len(events.sources) - 1, dtype=np.uint16)}
+    for name, typecode in COLUMNS:
+        if name not in converted:
+            converted[name] = np.frombuffer(columns[name], dtype=columns[name].typecode)[keep].astype(typecode)
+    events.extend_columns(converted)
+
+#Read the log files (text, journal, CSV or columnar, found from their content), returns the Events
+def read_logs(paths):
+    events = Events()
+    for path in paths:
+        events.sources.append(path)
+        if path.endswith(".4ctcol"):
+            read_columnar_export(path, events)
+            continue
+        with open(path, encoding="utf-8", errors="replace", newline="") as file:
+            first = file.readline()
+            file.seek(0)
+            if first.startswith(",".join(CSV_HEADER[:4])):  # also the exports written before the value column
+                read_csv_export(file, events)
+            elif path.endswith(JOURNAL_SUFFIX):
+                read_text_lines((line for entry in map(json.loads, file) for line in entry.split("\n")), events)
+            else:
+                read_text_lines(file, events)
+    return events.finish()
+
+
+#------------------------------------------------------------------------------
+#Tables
+TABLE_KEYS = ("section", "stimulus", "perch", "day", "source")
+
+def key_column(events, key):
+    if key == "day":
+        return events["time"].astype("datetime64[D]")
+    return events[key]
+
+#Number of events of one type for every combination of keys, as {key: values, ..., "events": counts}
+def counts_by(events, keys, event="perch"):
+    mask = events["event"] == EVENT_TYPES.index(event)
+    columns = [key_column(events, key)[mask] for key in keys]
+    # Each key coded by the index of its value, the combinations counted with one bincount
+    values, codes = zip(*(np.unique(column, return_inverse=True) for column in columns)) if keys else ((), ())
+    shape = tuple(len(value) for value in values)
+    combined = np.ravel_multi_index(codes, shape) if mask.any() else np.array([], dtype=np.int64)
+    counts = np.bincount(combined, minlength=int(np.prod(shape)))
+    present = np.flatnonzero(counts)
+    indexes = np.unravel_index(present, shape)
+    return {**{key: value[index] for key, value, index in zip(keys, values, indexes)}, "events": counts[present]}
+
+#Latency records: count, median, 95th percentile and maximum (ms) of a metric for every value of key
+def latency_by(events, key="perch", metric=None):
+    mask = (events["event"] == EVENT_TYPES.index("latency")) & ~np.isnan(events["value"])
+    keys, values = key_column(events, key)[mask], events["value"][mask]
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    ends = starts + counts - 1
+    return {key: unique, "events": counts, "p50": values[starts + (counts - 1) // 2],
+            "p95": values[starts + np.minimum(counts - 1, (counts * 0.95).astype(np.int64))], "max": values[ends]}
+
+#Counts of the end blocks of the text logs summed over the sessions of a file, {source, section, stimulus, count}
+def summary_table(events):
+    rows = np.array(events.summaries, dtype=np.int64).reshape(-1, 4)
+    keys, codes = np.unique(rows[:, :3], axis=0, return_inverse=True)
+    totals = np.bincount(codes.ravel(), weights=rows[:, 3], minlength=len(keys)).astype(np.int64)
+    return {"source": keys[:, 0], "section": keys[:, 1], "stimulus": keys[:, 2], "count": totals}
+
+#A table as a pandas DataFrame (pandas is only needed here)
+def to_dataframe(table):
+    import pandas
+    return pandas.DataFrame(table)
+
+def cell(key, value, sources):
+    if key == "stimulus":
+        return chr(value) if value else "-"
+    if key == "source":
+        return os.path.basename(sources[value])
+    if key in ("section", "perch") and value < 0:
+        return "-"
+    if isinstance(value, (float, np.floating)):
+        return f"{value:.1f}"
+    return str(value)
+
+def format_table(table, sources=()):
+    names = list(table)
+    rows = [[cell(name, table[name][i], sources) for name in names] for i in range(len(table[names[-1]]))]
+    widths = [max([len(name)] + [len(row[n]) for row in rows]) for n, name in enumerate(names)]
+    lines = ["  ".join(name.rjust(width) for name, width in zip(names, widths))]
+    lines += ["  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tables of perch events from 4CT logs")
+    parser.add_argument("logs", nargs="+", help="text logs, journals, CSV or .4ctcol exports")
+    parser.add_argument("--by", default="section,stimulus",
+                        help=f"comma-separated keys of the count table, among {', '.join(TABLE_KEYS)}")
+    parser.add_argument("--csv", help="write the count table to this CSV file")
+    args = parser.parse_args(argv)
+    keys = tuple(args.by.split(","))
+    unknown = set(keys) - set(TABLE_KEYS)
+    if unknown:
+        parser.error(f"unknown keys: {', '.join(sorted(unknown))}")
+    events = read_logs(args.logs)
+    table = counts_by(events, keys)
+    print(f"{len(events)} events, {len(table['events'])} rows\n")
+    print(format_table(table, events.sources))
+    if len(events.summaries):
+        print("\nCounts of the end blocks\n" + format_table(summary_table(events), events.sources))
+    latency = latency_by(events)
+    if len(latency["events"]):
+        print("\nLatency per perch (ms)\n" + format_table(latency))
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(list(table))
+            writer.writerows(zip(*([cell(name, value, events.sources) for value in column] for name, column in table.items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
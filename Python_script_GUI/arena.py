@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+N-choice arena: as many perches as speakers, one stimulus (song) per speaker.
+
+The possible positions of the stimuli are generated from the number of choices instead of being
+listed by hand. A position is kept as a flat list, the stimulus played by each speaker, so a perch
+event is resolved with one index: perch n sits in front of speaker n.
+"""
+from itertools import permutations
+
+STIMULUS_LETTERS = "ABCDEFGH"  # the firmware reports perch n as the n-th letter
+MAX_CHOICES = len(STIMULUS_LETTERS)
+
+
+#Perch number (1...) of a perch event letter, the firmware sends "A<count>" for perch 1
+def perch_number(letter):
+    return ord(letter) - ord("A") + 1
+
+
+class Arena:
+    def __init__(self, choices=4):
+        if not 2 <= choices <= MAX_CHOICES:
+            raise ValueError(f"An arena has 2 to {MAX_CHOICES} choices, not {choices}")
+        self.choices = choices
+        self.stimuli = list(STIMULUS_LETTERS[:choices])
+        self.speakers = list(range(1, choices + 1))
+        #Label of a position, "A-1, B-2, ...": the speaker of each stimulus. Grouped by the speaker of A
+        self.labels = []
+        self.layouts = {}
+        for speakers in permutations(self.speakers):
+            label = ", ".join(f"{stimulus}-{speaker}" for stimulus, speaker in zip(self.stimuli, speakers))
+            layout = [None] * choices
+            for stimulus, speaker in zip(self.stimuli, speakers):
+                layout[speaker - 1] = stimulus
+            self.labels.append(label)
+            self.layouts[label] = layout
+
+    #Position where stimulus n plays on speaker n
+    @property
+    def default_label(self):
+        return self.labels[0]
+
+    #Stimulus of each speaker for a position label, layout[speaker - 1]; raises KeyError on an unknown label
+    def layout_of(self, label):
+        return list(self.layouts[label])
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Playback engine for the song files.
+
+The mixer is initialised once, the files are decoded to PCM buffers (pygame Sound) when they are
+selected and kept in a memory-bounded cache, and every speaker plays on its own mixer channel. Playback never blocks the caller: the end
+of each file is detected by a watcher thread that calls back the owner, and a file that is not in
+the cache is decoded on the prefetch thread, the sequence goes on from there once it is ready.
+What happens to a trigger on a busy speaker is the policy of that speaker: "interrupt" stops the
+sequence playing and starts the new one, "queue" plays it once the current sequence (and the ones
+queued before it) has ended, "drop" ignores it. Other speakers are never affected.
+"""
+import heapq
+from collections import deque
+from concurrent.futures import CancelledError
+import itertools
+import threading
+import time
+
+import pygame
+
+from stimulus_cache import StimulusCache, DEFAULT_BUDGET_MB
+from tracing import TRACER
+
+MIXER_FREQUENCY = 44100
+MIXER_BUFFER = 512       # samples, small output buffer to keep the onset latency low
+END_POLL = 0.005         # seconds between checks once a file should have ended
+PLAYBACK_POLICIES = ("interrupt", "queue", "drop")
+QUEUE_LIMIT = 4          # sequences waiting on a speaker under the queue policy, later triggers are dropped
+ONSET_HISTORY = 100000   # onset latencies kept for the summaries, the oldest are dropped
+
+
+#Files played on one speaker after a single trigger
+class Sequence:
+    def __init__(self, speaker, song_name, files, on_start, on_done, received_at):
+        self.speaker = speaker
+        self.song_name = song_name
+        self.files = list(files)
+        self.on_start = on_start
+        self.on_done = on_done
+        self.received_at = received_at
+        self.onset_at = None      # perf_counter when the first file started
+        self.position = -1
+        self.sound = None
+        self.cancelled = False
+        self.decision = None      # "started", "interrupted", "queued" or "dropped"
+
+
+class AudioEngine:
+    #device: name of the sound card output, None = the default one (one device per process)
+    #policy: what a trigger on a busy speaker does, see PLAYBACK_POLICIES
+    def __init__(self, speakers=4, cache_budget_mb=DEFAULT_BUDGET_MB, device=None, policy="interrupt"):
+        pygame.mixer.pre_init(frequency=MIXER_FREQUENCY, size=-16, channels=2, buffer=MIXER_BUFFER, devicename=device)
+        pygame.mixer.init()
+        self.format = pygame.mixer.get_init()  # (frequency, size, channels) the device gave
+        pygame.mixer.set_num_channels(speakers)
+        pygame.mixer.set_reserved(speakers)
+        self.channels = {speaker: pygame.mixer.Channel(speaker - 1) for speaker in range(1, speakers + 1)}
+        self.cache = StimulusCache(cache_budget_mb)
+        self.active = {}          # speaker -> Sequence currently playing
+        self.waiting = {speaker: deque() for speaker in self.channels}  # sequences queued behind it
+        self.policies = {speaker: policy for speaker in self.channels}
+        self.onset_latencies = deque(maxlen=ONSET_HISTORY)  # ms between the perch line and the start of the first file
+        self.onsets = 0           # onset latencies recorded in all
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.deadlines = []       # heap of (time, tie, Sequence)
+        self.tie = itertools.count()
+        self.closed = False
+        self.set_policy(policy)
+        self.watcher = threading.Thread(target=self.watch_loop, name="audio-watcher", daemon=True)
+        self.watcher.start()
+
+    #Decode the selected files (one list per speaker sequence) as far as the cache budget allows.
+    #The first file of every sequence goes first, then the second ones, and so on.
+    #Returns the files that could not be loaded.
+    def load(self, sequences):
+        self.cache.retain([file_path for files in sequences for file_path in files])
+        order = []
+        for position in range(max((len(files) for files in sequences), default=0)):
+            order += [files[position] for files in sequences if position < len(files)]
+        return self.cache.preload(order)
+
+    #Policy of a speaker, or of every speaker when speaker is None; raises ValueError on an unknown policy
+    def set_policy(self, policy, speaker=None):
+        if policy not in PLAYBACK_POLICIES:
+            raise ValueError(f"Unknown playback policy {policy!r}, expected one of {', '.join(PLAYBACK_POLICIES)}")
+        with self.lock:
+            if speaker is None:
+                self.policies = {speaker: policy for speaker in self.channels}
+            else:
+                self.policies[speaker] = policy
+
+    #Start playing the files one after the other on the speaker channel and return immediately.
+    #on_decision(decision) is called first, on_start(file_path, found) for every file, on_done() once the
+    #speaker is silent again. On a busy speaker the policy decides (sequence.decision); an interrupted
+    #sequence calls no callback any more, a dropped one only on_decision.
+    def play(self, speaker, song_name, files, on_start=None, on_done=None, received_at=None, on_decision=None):
+        sequence = Sequence(speaker, song_name, files, on_start, on_done, received_at)
+        with self.lock:
+            previous = self.active.get(speaker)
+            waiting = self.waiting[speaker]
+            policy = self.policies[speaker]
+            if previous is None:
+                sequence.decision = "started"
+            elif policy == "interrupt":
+                previous.cancelled = True
+                waiting.clear()
+                self.channels[speaker].stop()  # even if none of the new files can be played
+                sequence.decision = "interrupted"
+            elif policy == "queue" and len(waiting) < QUEUE_LIMIT:
+                waiting.append(sequence)
+                sequence.decision = "queued"
+            else:
+                sequence.decision = "dropped"
+            starts = sequence.decision in ("started", "interrupted")
+            if starts:
+                self.active[speaker] = sequence
+        if on_decision:
+            on_decision(sequence.decision)
+        if starts:
+            self.advance(sequence)
+        return sequence
+
+    def stop(self, speaker):
+        with self.lock:
+            sequence = self.active.pop(speaker, None)
+            if sequence is not None:
+                sequence.cancelled = True
+            self.waiting[speaker].clear()
+        self.channels[speaker].stop()
+
+    #Play the next file of the sequence, or finish it. A file not in the cache is decoded on the
+    #prefetch thread and played from there, the caller (serial or watcher thread) never waits for it.
+    @TRACER.traced("audio.advance", depth=lambda self, sequence: len(self.deadlines))
+    def advance(self, sequence):
+        sequence.position += 1
+        if sequence.cancelled:
+            return
+        if sequence.position >= len(sequence.files):
+            self.finish(sequence)
+            return
+        file_path = sequence.files[sequence.position]
+        try:
+            sound = self.cache.lookup(file_path)
+        except OSError:
+            self.skip(sequence, file_path)
+            return
+        if sound is None:
+            try:
+                decoding = self.cache.load(file_path)
+            except RuntimeError:
+                return  # closed
+            decoding.add_done_callback(lambda decoding: self.decoded(sequence, file_path, decoding))
+            return
+        self.start(sequence, file_path, sound)
+
+    def decoded(self, sequence, file_path, decoding):
+        try:
+            sound = decoding.result()
+        except CancelledError:
+            return  # closed
+        except (pygame.error, OSError):
+            self.skip(sequence, file_path)
+            return
+        self.start(sequence, file_path, sound)
+
+    #A file that cannot be played: reported, the sequence goes on with the next one
+    def skip(self, sequence, file_path):
+        if sequence.on_start:
+            sequence.on_start(file_path, False)
+        self.advance(sequence)
+
+    def start(self, sequence, file_path, sound):
+        # Checked under the lock: an interrupt or a stop between the decision and here keeps the sound off
+        with self.lock:
+            if sequence.cancelled:
+                return
+            self.channels[sequence.speaker].play(sound)
+        # The next file of the sequence, or the first one for the next trigger
+        self.cache.prefetch(sequence.files[(sequence.position + 1) % len(sequence.files)])
+        if sequence.onset_at is None:
+            sequence.onset_at = time.perf_counter()
+            if sequence.received_at is not None and sequence.decision != "queued":
+                self.onset_latencies.append((sequence.onset_at - sequence.received_at) * 1000)
+                self.onsets += 1
+        sequence.sound = sound
+        if sequence.on_start:
+            sequence.on_start(file_path, True)
+        with self.wakeup:
+            heapq.heappush(self.deadlines, (time.monotonic() + sound.get_length(), next(self.tie), sequence))
+            self.wakeup.notify()
+
+    #The next queued sequence goes on at once (the speaker stays busy), else the speaker is done
+    def finish(self, sequence):
+        following = None
+        with self.lock:
+            if self.active.get(sequence.speaker) is sequence:
+                waiting = self.waiting[sequence.speaker]
+                if waiting:
+                    following = self.active[sequence.speaker] = waiting.popleft()
+                else:
+                    del self.active[sequence.speaker]
+        if following is not None:
+            self.advance(following)
+        elif sequence.on_done:
+            sequence.on_done()
+
+    #Sleep until the next file should end, then move its sequence on
+    def watch_loop(self):
+        while True:
+            with self.wakeup:
+                while not self.deadlines and not self.closed:
+                    self.wakeup.wait()
+                if self.closed:
+                    return
+                deadline, _, sequence = self.deadlines[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.wakeup.wait(delay)
+                    continue
+                heapq.heappop(self.deadlines)
+            if sequence.cancelled:
+                continue
+            channel = self.channels[sequence.speaker]
+            if channel.get_busy() and channel.get_sound() is sequence.sound:
+                with self.wakeup:
+                    heapq.heappush(self.deadlines, (time.monotonic() + END_POLL, next(self.tie), sequence))
+                continue
+            self.advance(sequence)
+
+    #Median, 95th percentile and maximum of the perch-to-onset latency in ms, over the last ONSET_HISTORY
+    def latency_summary(self):
+        values = sorted(self.onset_latencies)
+        if not values:
+            return None
+        return (values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.95))], values[-1])
+
+    #Stop the watcher before the mixer goes, it would still ask the channels
+    def close(self):
+        with self.wakeup:
+            self.closed = True
+            self.wakeup.notify()
+        self.watcher.join(timeout=1)
+        self.cache.close()
+        pygame.mixer.stop()
+        pygame.mixer.quit()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the perch-to-onset latency: time between a perch line received from the serial port and
+the start of the song, with perch hits arriving while other songs are still playing.
+
+Uses SDL's dummy audio driver and pyserial's loop:// port, no sound card or Arduino needed:
+    python benchmarks/bench_audio_latency.py
+"""
+import os
+import sys
+import math
+import struct
+import tempfile
+import threading
+import time
+import wave
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serial_link import SerialTransport
+from audio_engine import AudioEngine, MIXER_BUFFER, MIXER_FREQUENCY
+
+TRIGGERS = 20
+TRIGGER_INTERVAL = 0.25   # seconds between perch hits, shorter than a song
+SONG_SECONDS = 1.0
+
+#Write a sine tone as a 16 bit stereo WAV file
+def write_tone(path, seconds, frequency=440, rate=44100):
+    frames = bytearray()
+    for n in range(int(seconds * rate)):
+        value = int(12000 * math.sin(2 * math.pi * frequency * n / rate))
+        frames += struct.pack("<hh", value, value)
+    with wave.open(path, "wb") as song:
+        song.setnchannels(2)
+        song.setsampwidth(2)
+        song.setframerate(rate)
+        song.writeframes(bytes(frames))
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(len(values) * q))]
+    return f"p50 {pick(0.5):7.2f} ms, p95 {pick(0.95):7.2f} ms, p99 {pick(0.99):7.2f} ms, max {values[-1]:7.2f} ms"
+
+#Perch lines arrive at a fixed rate on the four perches, each one starts a song when it is handled
+def run(start_song, files):
+    transport = SerialTransport(serial.serial_for_url("loop://"))
+
+    def perches():
+        for n in range(TRIGGERS):
+            transport.ser.write(f"{'ABCD'[n % 4]}{n + 1}\r\n".encode())
+            time.sleep(TRIGGER_INTERVAL)
+    threading.Thread(target=perches, daemon=True).start()
+
+    latencies = []
+    for n in range(TRIGGERS):
+        received_at, line = transport.events.get(timeout=60)
+        speaker = "ABCD".index(line[0]) + 1
+        transport.send(f"sa{speaker}1 r/n")
+        latencies.append(start_song(speaker, files, received_at))
+    transport.close()
+    return latencies
+
+#Old path: initialise the mixer, load every file from disk and wait for it on the calling thread
+def legacy_start(speaker, files, received_at):
+    pygame.mixer.init()
+    onset = None
+    for file_path in files:
+        pygame.mixer.music.load(file_path)
+        pygame.mixer.music.play()
+        onset = onset or (time.perf_counter() - received_at) * 1000
+        while pygame.mixer.music.get_busy():
+            pygame.time.Clock().tick(10)
+            time.sleep(0.5)
+    return onset
+
+def engine_start(speaker, files, received_at):
+    engine.play(speaker, f"Song{'ABCD'[speaker - 1]}", files, received_at=received_at)
+    return engine.onset_latencies[-1]
+
+
+if __name__ == "__main__":
+    folder = tempfile.mkdtemp()
+    files = []
+    for n in range(3):
+        path = os.path.join(folder, f"song{n}.wav")
+        write_tone(path, SONG_SECONDS, 440 + 110 * n)
+        files.append(path)
+
+    legacy = run(legacy_start, files)
+    pygame.mixer.quit()
+    print(f"  legacy (init + load + play): {percentiles(legacy)}")
+
+    engine = AudioEngine(speakers=4)
+    failed = engine.load([files])  # one list of files per speaker
+    assert not failed, f"could not decode {failed}"
+    print(f"  engine (decoded buffers):    {percentiles(run(engine_start, files))}")
+    stats = engine.cache.stats()
+    print(f"  stimulus cache: hits {stats['hits']}, misses {stats['misses']}")
+    print(f"  the mixer output buffer adds {1000 * MIXER_BUFFER / MIXER_FREQUENCY:.1f} ms on the sound card")
+    engine.close()
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end benchmark of the host: the experiment engine against the Virtual Perch Detector
+(perch_emulator.py, on a pty) and SDL's dummy audio driver, no Arduino or sound card needed:
+    python benchmarks/bench_end_to_end.py [--quick] [--no-save]
+
+- latency of every perch event, p50/p95/p99: line sent by the box -> received by the host,
+  -> saX1 received back by the box (relay open), -> song started
+- sustained rate handled without losing lines and with p99 onset under LAG_LIMIT_MS, and bursts
+- CPU and memory of the host over a simulated 24 h: a day of perch events played fast, plus the
+  measured idle cost for the rest of the day (the emulator's own threads are not counted)
+
+Every run is repeated (--repeats, 5 by default), each time in a new process so that the repeats do
+not share their memory, and the medians are compared with the last saved run of a clean tree. The
+noise of a metric is the median absolute deviation of its repeats (relative to the median, scaled to
+a standard deviation), which an outlying repeat does not move. A change counts as a regression when
+it is over REGRESSION and over NOISE_FACTOR standard errors of the difference of the two medians.
+The p95 latencies vary by a few % from run to run, the p99 ones (a handful of events) by tens of %.
+The results are saved as JSON in benchmarks/results/. POSIX only, like the emulator.
+"""
+import argparse
+import collections
+import contextlib
+import glob
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench_audio_latency import write_tone
+from discovery import BAUDRATE
+from engine import ExperimentEngine
+from event_records import EVENT_TYPES
+from headless import DEFAULTS, configure
+from perch_emulator import VirtualPerchDetector, random_hits, scripted_hits, to_int
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+LATENCY_RATE = 20.0                  # hits per second, songs of different perches overlap
+LATENCY_SECONDS = 60.0               # 1200 events, the p99 is not a handful of them
+SUSTAINED_RATES = (100, 250, 500, 1000, 2000, 5000)
+SUSTAINED_SECONDS = 3.0
+BURST_SIZES = (100, 1000, 5000)
+BURST_SPREAD = 0.01                  # seconds a burst lasts
+DRAIN_TIMEOUT = 15.0                 # seconds to handle the lines still queued after the hits
+LAG_LIMIT_MS = 100.0                 # p99 onset allowed for a rate to count as sustained
+DAY_EVENTS = 20000                   # perch events of a busy day
+DAY_RATE = 500.0                     # hits per second used to play the day
+IDLE_SECONDS = 5.0
+SONG_SECONDS = 0.5
+REGRESSION = 0.1                     # relative change reported as a regression, at least
+REPEATS = 5
+NOISE_FACTOR = 3.0                   # a regression is also over this many standard errors
+MAD_SCALE = 1.4826                   # median absolute deviation -> standard deviation of a normal noise
+MEDIAN_ERROR = 1.2533                # standard error of a median = MEDIAN_ERROR * deviation / sqrt(repeats)
+#Compared metrics, True when higher is better
+METRICS = (("latency.total_ms.p95", False), ("latency.onset_ms.p95", False), ("latency.relay_ms.p95", False),
+           ("latency.total_ms.p99", False), ("latency.onset_ms.p99", False), ("latency.relay_ms.p99", False),
+           ("throughput.sustained_hz", True), ("day.cpu_seconds", False), ("day.rss_end_mb", False),
+           ("day.bytes_per_event", False))
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))], 3)
+    return {"p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": round(values[-1], 3), "n": len(values)}
+
+#Resident memory of the process in MB
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10  # peak, kB on Linux
+
+def thread_cpu(threads):
+    total = 0.0
+    for thread in threads:
+        try:
+            total += time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (AttributeError, OSError, TypeError):
+            pass
+    return total
+
+
+#The engine on an emulated box, in run mode with a song on every stimulus
+class Rig:
+    def __init__(self, files, folder):
+        self.sent = []                               # (perf_counter, line) written by the box
+        self.relays = collections.defaultdict(list)  # perch -> perf_counter of its saX1 at the box
+        self.detector = VirtualPerchDetector(boot_banner=False, on_event=self.on_event, on_command=self.on_command)
+        self.detector.start()
+        self.engine = ExperimentEngine(serial.Serial(self.detector.port, BAUDRATE, timeout=1),
+                                       session_folder=folder, daily_folder=folder, on_message=lambda message: None,
+                                       stimulus_folder=None)  # the test songs are already in the mixer format
+        configure(self.engine, {**DEFAULTS, "daily_save": False,
+                                "songs": dict(zip(self.engine.arena.stimuli, ([path] for path in files))),
+                                "sections": [{"section": 1, "start": "00:00:00", "end": "23:59:59",
+                                              "position": self.engine.arena.default_label}]})
+        self.engine.audio.load([[path] for path in files])
+        self.engine.start()
+        self.engine.run().result(timeout=5)
+
+    def on_event(self, sent_at, line):
+        self.sent.append((sent_at, line))
+
+    def on_command(self, received_at, line):
+        if line.startswith("sa") and len(line) > 2 and to_int(line[3:]) == 1:
+            self.relays[to_int(line[2])].append(received_at)
+
+    #Perch events handled by the engine: (received_at, perch, count)
+    def handled(self):
+        columns, _ = self.engine.records.snapshot()
+        perch_event = EVENT_TYPES.index("perch")
+        return [(received_at, perch, count) for event, received_at, perch, count in
+                zip(columns["event"], columns["monotonic"], columns["perch"], columns["count"]) if event == perch_event]
+
+    #Queue every hit now, at its time from "start" (no feeding thread, so the emulator CPU is all in its threads)
+    def schedule(self, hits, delay=0.2):
+        start = time.perf_counter() + delay
+        for offset, perch in hits:
+            self.detector.hit(perch, at=start + offset)
+        return start
+
+    #Wait until the box has sent everything and the engine has handled as many events
+    def drain(self, timeout=DRAIN_TIMEOUT):
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if not self.detector.pending and self.engine.audio.onsets >= self.detector.sent_events:
+                break
+            time.sleep(0.05)
+
+    #Latency of each stage in ms and the lines lost
+    def measure(self):
+        sent_at = {(ord(line[0]) - ord("A") + 1, int(line[1:])): at for at, line in self.sent}
+        relay_index = collections.Counter()
+        stages = {"transit_ms": [], "relay_ms": [], "onset_ms": [], "total_ms": []}
+        for (received_at, perch, count), onset in zip(self.handled(), self.engine.audio.onset_latencies):
+            transit = (received_at - sent_at[(perch, count)]) * 1000
+            stages["transit_ms"].append(transit)
+            relays = self.relays[perch]
+            if relay_index[perch] < len(relays):
+                stages["relay_ms"].append((relays[relay_index[perch]] - received_at) * 1000)
+            relay_index[perch] += 1
+            stages["onset_ms"].append(onset)
+            stages["total_ms"].append(transit + onset)
+        stats = {stage: percentiles(values) for stage, values in stages.items()}
+        stats["sent"] = self.detector.sent_events
+        stats["lost"] = self.detector.sent_events - self.engine.audio.onsets
+        return stats
+
+    def close(self):
+        self.engine.close()
+        self.detector.close()
+
+
+def bench_latency(files, folder):
+    rig = Rig(files, folder)
+    rig.schedule(random_hits(LATENCY_RATE, duration=LATENCY_SECONDS, seed=1))
+    time.sleep(LATENCY_SECONDS)
+    rig.drain()
+    stats = rig.measure()
+    rig.close()
+    return stats
+
+def bench_throughput(files, folder):
+    rates, bursts = [], []
+    for rate in SUSTAINED_RATES:
+        rig = Rig(files, folder)
+        rig.schedule(random_hits(rate, duration=SUSTAINED_SECONDS, seed=rate))
+        time.sleep(SUSTAINED_SECONDS)
+        rig.drain()
+        stats = rig.measure()
+        rig.close()
+        stats["rate_hz"] = rate
+        stats["sustained"] = stats["lost"] == 0 and stats["onset_ms"].get("p99", 0) <= LAG_LIMIT_MS
+        rates.append(stats)
+    for size in BURST_SIZES:
+        rig = Rig(files, folder)
+        start = rig.schedule(scripted_hits([(n * BURST_SPREAD / size, n % 4 + 1) for n in range(size)]))
+        time.sleep(max(0.0, start - time.perf_counter()) + BURST_SPREAD)
+        rig.drain()
+        stats = rig.measure()
+        onsets = [received_at + onset / 1000 for (received_at, _, _), onset in
+                  zip(rig.handled(), rig.engine.audio.onset_latencies)]
+        stats["size"] = size
+        stats["drain_ms"] = round((max(onsets) - start) * 1000, 3) if onsets else None
+        rig.close()
+        bursts.append(stats)
+    sustained = [stats["rate_hz"] for stats in rates if stats["sustained"]]
+    return {"sustained_hz": max(sustained, default=0), "rates": rates, "bursts": bursts}
+
+#CPU and memory of a day: DAY_EVENTS played at DAY_RATE, the rest of the day at the idle cost
+def bench_day(files, folder, day_events):
+    rig = Rig(files, folder)
+    emulator_threads = list(rig.detector.threads)
+    cpu, emulator_cpu = time.process_time(), thread_cpu(emulator_threads)
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = (time.process_time() - cpu) - (thread_cpu(emulator_threads) - emulator_cpu)
+    rss_start = rss_mb()
+    cpu, emulator_cpu = time.process_time(), thread_cpu(emulator_threads)
+    busy = day_events / DAY_RATE
+    rig.schedule(random_hits(DAY_RATE, duration=busy, seed=24))
+    time.sleep(busy)
+    rig.drain(timeout=DRAIN_TIMEOUT + busy)
+    events_cpu = (time.process_time() - cpu) - (thread_cpu(emulator_threads) - emulator_cpu)
+    handled = len(rig.handled())
+    rss_end = rss_mb()
+    rig.close()
+    return {
+        "events": handled,
+        "cpu_per_event_ms": round(events_cpu / max(handled, 1) * 1000, 4),
+        "idle_cpu_percent": round(idle_cpu / IDLE_SECONDS * 100, 3),
+        "cpu_seconds": round(events_cpu + idle_cpu / IDLE_SECONDS * (86400 - busy), 2),
+        "rss_start_mb": round(rss_start, 1),
+        "rss_end_mb": round(rss_end, 1),
+        "bytes_per_event": round((rss_end - rss_start) * 2 ** 20 / max(handled, 1), 1),
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def metric(results, path):
+    value = results
+    for key in path.split("."):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+#Median, range and relative noise (scaled median absolute deviation / median) of every compared metric over the runs
+def summarise(runs):
+    metrics = {}
+    for key, _ in METRICS:
+        values = sorted(value for value in (metric(run, key) for run in runs) if value is not None)
+        if not values:
+            continue
+        middle = median(values)
+        deviation = MAD_SCALE * median([abs(value - middle) for value in values])
+        metrics[key] = {"median": round(middle, 3), "min": values[0], "max": values[-1],
+                        "noise": round(deviation / middle, 3) if middle else 0.0}
+    return metrics
+
+#Last saved run of the same kind (quick or full) made from a committed tree
+def previous_results(quick):
+    for path in sorted(glob.glob(os.path.join(RESULTS_FOLDER, "e2e_*.json")), reverse=True):
+        with open(path, encoding="utf-8") as file:
+            results = json.load(file)
+        if (results.get("quick") == quick and "noise" in next(iter(results.get("metrics", {}).values()), {})
+                and not results["version"].endswith("-dirty")):
+            return path, results
+    return None
+
+#Details of one run
+def report_run(results):
+    latency = results["latency"]
+    print(f"Latency over {latency['sent']} perch events ({LATENCY_RATE:g} per second), ms:")
+    for stage, label in (("transit_ms", "line sent -> received"), ("relay_ms", "received -> saX1 at box"),
+                         ("onset_ms", "received -> song started"), ("total_ms", "line sent -> song started")):
+        stats = latency[stage]
+        print(f"  {label:26} p50 {stats['p50']:8.3f}  p95 {stats['p95']:8.3f}  p99 {stats['p99']:8.3f}")
+    print("Throughput:")
+    for stats in results["throughput"]["rates"]:
+        print(f"  {stats['rate_hz']:5} Hz: {stats['sent']:6} sent, {stats['lost']:5} lost, "
+              f"onset p99 {stats['onset_ms'].get('p99', float('nan')):9.2f} ms {'ok' if stats['sustained'] else ''}")
+    print(f"  sustained: {results['throughput']['sustained_hz']} Hz")
+    for stats in results["throughput"]["bursts"]:
+        print(f"  burst of {stats['size']:5} in {BURST_SPREAD * 1000:g} ms: {stats['lost']} lost, all songs started after "
+              f"{stats['drain_ms']} ms")
+    day = results["day"]
+    print(f"Simulated day ({day['events']} events): {day['cpu_seconds']} CPU seconds, idle {day['idle_cpu_percent']} %, "
+          f"{day['cpu_per_event_ms']} ms per event, memory {day['rss_start_mb']} -> {day['rss_end_mb']} MB "
+          f"({day['bytes_per_event']} bytes per event)")
+
+def report(results, previous):
+    print(f"Medians of {len(results['runs'])} runs (min..max):")
+    for key, stats in results["metrics"].items():
+        print(f"  {key:28} {stats['median']:12.3f} ({stats['min']:g}..{stats['max']:g}, noise {stats['noise']:.0%})")
+    if previous:
+        path, old = previous
+        print(f"Compared with {os.path.basename(path)} ({old.get('version')}):")
+        for key, higher_is_better in METRICS:
+            before, now = old["metrics"].get(key), results["metrics"].get(key)
+            if not before or not before["median"] or now is None:
+                continue
+            change = (now["median"] - before["median"]) / before["median"]
+            worse = -change if higher_is_better else change
+            error = math.hypot(MEDIAN_ERROR * before["noise"] / math.sqrt(len(old["runs"])),
+                               MEDIAN_ERROR * now["noise"] / math.sqrt(len(results["runs"])))
+            threshold = max(REGRESSION, NOISE_FACTOR * error)
+            print(f"  {key:28} {before['median']:12.3f} -> {now['median']:12.3f} ({change:+.0%}, threshold {threshold:.0%})"
+                  f"{'  REGRESSION' if worse > threshold else ''}")
+
+
+#One repeat of every bench, in a process of its own
+def single_run(day_events):
+    folder = tempfile.mkdtemp()
+    files = []
+    for n in range(4):
+        path = os.path.join(folder, f"song{n}.wav")
+        write_tone(path, SONG_SECONDS, 440 + 110 * n)
+        files.append(path)
+    run = {}
+    #The engine prints every line it receives
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        run["latency"] = bench_latency(files, folder)
+        run["throughput"] = bench_throughput(files, folder)
+        run["day"] = bench_day(files, folder, day_events)
+    return run
+
+
+def main(argv=None):
+    global LATENCY_SECONDS, SUSTAINED_RATES, BURST_SIZES
+    parser = argparse.ArgumentParser(description="End-to-end latency, throughput and resource benchmark")
+    parser.add_argument("--quick", action="store_true", help="shorter runs, fewer rates")
+    parser.add_argument("--no-save", action="store_true", help="do not store the results")
+    parser.add_argument("--day-events", type=int, default=DAY_EVENTS)
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="runs of every bench, the medians are compared")
+    parser.add_argument("--single-run", action="store_true", help=argparse.SUPPRESS)  # one repeat, JSON on stdout
+    args = parser.parse_args(argv)
+    if args.quick:
+        LATENCY_SECONDS, SUSTAINED_RATES, BURST_SIZES = 5.0, (100, 1000), (1000,)
+        args.day_events = min(args.day_events, 2000)
+    if args.single_run:
+        print(json.dumps(single_run(args.day_events)))
+        return 0
+
+    results = {"version": git_version(), "date": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "platform": platform.platform(), "machine": platform.machine(),
+               "quick": args.quick}
+    results["runs"] = []
+    command = [sys.executable, os.path.abspath(__file__), "--single-run", "--day-events", str(args.day_events)]
+    for repeat in range(max(1, args.repeats)):
+        child = subprocess.run(command + (["--quick"] if args.quick else []), stdout=subprocess.PIPE, text=True, check=True)
+        run = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"Run {repeat + 1}:")
+        report_run(run)
+        results["runs"].append(run)
+    results["metrics"] = summarise(results["runs"])
+    report(results, previous_results(args.quick))
+    if results["version"].endswith("-dirty"):
+        print("The tree has uncommitted changes: these results are never used as the baseline")
+    if not args.no_save:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        path = os.path.join(RESULTS_FOLDER, f"e2e_{datetime.now():%Y%m%d_%H%M%S}_{results['version']}.json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=1)
+        print(f"Saved to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
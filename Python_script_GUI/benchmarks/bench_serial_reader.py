@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the serial reader: CPU used while the box is idle and lines lost during bursts.
+
+Runs against pyserial's loop:// port, no Arduino needed:
+    python benchmarks/bench_serial_reader.py
+"""
+import os
+import sys
+import threading
+import time
+import random
+
+import serial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serial_link import LineReader
+
+IDLE_SECONDS = 3.0
+BURST_LINES = 20000
+
+#Old reader loop: spins on in_waiting without sleeping
+def busy_spin_reader(ser, on_line, stop):
+    while not stop.is_set():
+        if ser and ser.in_waiting > 0:
+            on_line(ser.readline().decode().strip())
+
+#New reader loop: blocking read, all complete lines per wake-up
+def blocking_reader(ser, on_line, stop):
+    reader = LineReader(ser)
+    while not stop.is_set():
+        for line in reader.read_lines():
+            on_line(line)
+
+#CPU seconds used by the reader thread while nothing is sent
+def measure_idle_cpu(reader_loop):
+    ser = serial.serial_for_url("loop://", timeout=1)
+    stop = threading.Event()
+    cpu = {}
+
+    def run():
+        start = time.thread_time()
+        reader_loop(ser, lambda line: None, stop)
+        cpu["seconds"] = time.thread_time() - start
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    time.sleep(IDLE_SECONDS)
+    stop.set()
+    thread.join(5)
+    ser.close()
+    return cpu.get("seconds", float("nan"))
+
+#Send a burst of perch lines in random chunks and check none is lost or reordered
+def measure_burst(reader_loop):
+    ser = serial.serial_for_url("loop://", timeout=1)
+    stop = threading.Event()
+    received = []
+    thread = threading.Thread(target=reader_loop, args=(ser, received.append, stop), daemon=True)
+    thread.start()
+
+    expected = [f"{random.choice('ABCD')}{n}" for n in range(1, BURST_LINES + 1)]
+    payload = "".join(line + "\r\n" for line in expected).encode()
+    start = time.perf_counter()
+    position = 0
+    while position < len(payload):
+        size = random.randint(1, 64)
+        ser.write(payload[position:position + size])
+        position += size
+    while len(received) < BURST_LINES and time.perf_counter() - start < 30:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    thread.join(5)
+    ser.close()
+    return received == expected, len(received), elapsed
+
+
+if __name__ == "__main__":
+    for name, loop in (("busy-spin", busy_spin_reader), ("blocking", blocking_reader)):
+        idle_cpu = measure_idle_cpu(loop)
+        lossless, count, elapsed = measure_burst(loop)
+        print(f"{name:>10}: idle CPU {100 * idle_cpu / IDLE_SECONDS:5.1f}% of a core, "
+              f"burst {count}/{BURST_LINES} lines in {elapsed:.2f}s, lossless={lossless}")
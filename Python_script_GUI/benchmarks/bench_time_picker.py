@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Startup cost of the 14 time of day spinboxes: one 86,400-entry list per spinbox (old) against the
+arithmetic time picker (new).
+
+With a display the real ttk widgets are built, without one the values are handed to a bare Tcl
+interpreter, which is the conversion Tk does when a spinbox gets its values:
+    python benchmarks/bench_time_picker.py
+"""
+import os
+import sys
+import time
+import tkinter as tk
+from tkinter import ttk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from time_picker import create_time_spinbox
+
+SPINBOXES = 14
+ROUNDS = 3
+
+#Old list of values, built again for every spinbox
+def create_time_values():
+    time_values = []
+    for hour in range(24):
+        for minute in range(60):
+            for second in range(60):
+                time_values.append(f"{hour:02d}:{minute:02d}:{second:02d}")
+    return time_values
+
+def legacy_widgets(root):
+    for n in range(SPINBOXES):
+        variable = tk.StringVar(root, value="08:00:00")
+        ttk.Spinbox(root, textvariable=variable, values=create_time_values(), wrap="True", width=10)
+
+def picker_widgets(root):
+    for n in range(SPINBOXES):
+        create_time_spinbox(root, tk.StringVar(root, value="08:00:00"))
+
+def legacy_values(tcl):
+    for n in range(SPINBOXES):
+        tcl.call("set", f"values{n}", tcl.call("list", *create_time_values()))
+
+def picker_values(tcl):
+    for n in range(SPINBOXES):
+        tcl.call("set", f"value{n}", "08:00:00")
+
+def best_of(build, target):
+    timings = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        build(target)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+if __name__ == "__main__":
+    try:
+        target = tk.Tk()
+        legacy, picker, mode = legacy_widgets, picker_widgets, "ttk widgets"
+    except tk.TclError:
+        target = tk.Tcl()
+        legacy, picker, mode = legacy_values, picker_values, "Tcl values, no display"
+    print(f"{SPINBOXES} time spinboxes ({mode}):")
+    print(f"  86,400-entry lists: {best_of(legacy, target):8.1f} ms")
+    print(f"  time picker:        {best_of(picker, target):8.1f} ms")
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Find the Perch Detector among the serial ports.
+
+All candidate ports are probed at the same time, so the startup does not grow with the number of
+ports. A port is a Perch Detector when it prints the boot banner of the firmware ("Perch Detector
+V0 starting...") or answers the "l" command with its state list; other devices (Bluetooth modems...)
+are left alone. The port and USB serial number of the last box found are remembered in the 4CT
+folder, the next launch tries that box first.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import serial
+import serial.tools.list_ports   #ARDUINO
+
+from serial_link import PERCH_EVENT, UNSOLICITED_PREFIXES, LineReader
+
+BAUDRATE = 115200
+IDENTITY_FILE = os.path.join(os.path.expanduser("~"), "4CT", "perch_detector.json")
+BANNER = "Perch Detector V0 starting"
+INIT_DONE = "Perch Detector init done"
+PROBE_TIMEOUT = 3.0      # seconds a port gets to answer, the Mega restarts (about 1.5 s) when the port opens
+HANDSHAKE_RETRY = 2.0    # seconds before "l" is sent again, the first one may have reached the boot loader
+INIT_TIMEOUT = 1.0       # seconds to wait for the end of the boot messages after the banner
+QUIET = 0.1              # seconds without data that end the state list
+OPEN_GRACE = 1.0         # extra seconds for ports slow to open, ports still stuck after that are left behind
+READ_TIMEOUT = 0.05
+
+
+def list_serial_ports():
+    ports = serial.tools.list_ports.comports()
+    return [port.device for port in ports]
+
+def port_info(port):
+    for info in serial.tools.list_ports.comports():
+        if info.device == port:
+            return info
+    return None
+
+#Reply of "l": RUNMODE (0/1), the delay, then a 0/1 state for every switch and every relay
+def is_state_list(lines):
+    values = [line for line in lines if line]
+    states = values[2:]
+    return (len(values) >= 4 and values[0] in ("0", "1") and values[1].isdigit() and len(states) % 2 == 0
+            and all(state in ("0", "1") for state in states))
+
+
+#Open a port and wait for the banner or the answer to "l", returns the open port or None
+def probe(port, timeout=PROBE_TIMEOUT):
+    ser = serial.Serial()
+    ser.port, ser.baudrate, ser.timeout = port, BAUDRATE, READ_TIMEOUT
+    ser.dtr = False  # no restart of the Arduino where the driver allows it, then "l" answers at once
+    try:
+        ser.open()
+        ser.write(b"l\r\n")
+    except (serial.SerialException, OSError, ValueError):
+        ser.close()
+        return None
+    reader = LineReader(ser)
+    start = time.monotonic()
+    deadline = start + timeout
+    last_line = start
+    state_lines = []
+    retried = False
+    try:
+        while time.monotonic() < deadline:
+            lines = reader.read_lines()
+            now = time.monotonic()
+            for line in lines:
+                if line.startswith(INIT_DONE):
+                    return ready(ser)
+                if line.startswith(BANNER):
+                    deadline = now + INIT_TIMEOUT   # restarted: identified, wait for the end of the boot
+                    state_lines = None
+                elif state_lines is not None and not PERCH_EVENT.match(line) and not line.startswith(UNSOLICITED_PREFIXES):
+                    state_lines.append(line)
+                    last_line = now  # perch events of a running box do not delay the end of the list
+            if state_lines is None:
+                continue
+            if is_state_list(state_lines) and now - last_line >= QUIET:
+                return ready(ser)
+            if not retried and now - start >= HANDSHAKE_RETRY:
+                retried = True
+                state_lines = []
+                ser.write(b"l\r\n")
+        if state_lines is None:
+            return ready(ser)  # banner without the end of the boot messages
+    except (serial.SerialException, OSError):
+        pass
+    ser.close()
+    return None
+
+def ready(ser):
+    ser.reset_input_buffer()
+    ser.timeout = 1
+    return ser
+
+#Probe the ports at the same time, returns [(port, open port)] of the Perch Detectors found,
+#only the first one (as soon as it answers) when first is set
+def probe_all(ports, first=True, timeout=PROBE_TIMEOUT):
+    found = queue.Queue()
+    done = threading.Event()
+
+    def run(port):
+        ser = probe(port, timeout)
+        found.put((port, ser))
+        if done.is_set() and ser is not None:
+            ser.close()  # answered after the search ended
+
+    for port in ports:
+        threading.Thread(target=run, args=(port,), name=f"probe-{port}", daemon=True).start()
+    boxes = []
+    deadline = time.monotonic() + timeout + OPEN_GRACE
+    for _ in ports:
+        try:
+            port, ser = found.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        if ser is not None:
+            boxes.append((port, ser))
+            if first:
+                break
+    done.set()
+    while True:
+        try:
+            _, ser = found.get_nowait()
+        except queue.Empty:
+            break
+        if ser is not None:
+            ser.close()
+    return boxes
+
+#Ports of every Perch Detector connected (the ports are closed again)
+def find_boxes(ports=None):
+    boxes = probe_all(list_serial_ports() if ports is None else ports, first=False)
+    for _, ser in boxes:
+        ser.close()
+    return sorted(port for port, _ in boxes)
+
+
+def load_identity():
+    try:
+        with open(IDENTITY_FILE, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_identity(port):
+    info = port_info(port)
+    identity = {"port": port, "serial_number": info and info.serial_number, "vid": info and info.vid,
+                "pid": info and info.pid, "description": info and info.description,
+                "last_seen": datetime.now().isoformat(timespec="seconds")}
+    try:
+        os.makedirs(os.path.dirname(IDENTITY_FILE), exist_ok=True)
+        with open(IDENTITY_FILE, "w", encoding="utf-8") as file:
+            json.dump(identity, file, indent=1)
+    except OSError as e:
+        print(f"Could not remember the Perch Detector port: {e}")
+
+#Port of the box found last time: same USB serial number (the port name may have changed), else same name
+def cached_port(candidates):
+    identity = load_identity()
+    if identity.get("serial_number"):
+        for info in serial.tools.list_ports.comports():
+            if info.serial_number == identity["serial_number"] and info.device in candidates:
+                return info.device
+    return identity.get("port") if identity.get("port") in candidates else None
+
+#Open the Perch Detector: the given port, else the box found last time, else the first box that answers
+def open_serial_port(port=None):
+    if port:
+        ser = probe(port)
+        if ser is None:
+            print(f"No answer from a Perch Detector on {port}, using the port anyway.")
+            return serial.Serial(port, baudrate=BAUDRATE, timeout=1)
+        save_identity(port)
+        return ser
+    candidates = list_serial_ports()
+    cached = cached_port(candidates)
+    if cached:
+        ser = probe(cached)
+        if ser is not None:
+            save_identity(cached)
+            return ser
+        candidates.remove(cached)
+    if not candidates:
+        raise serial.SerialException("No serial ports available.")
+    boxes = probe_all(candidates)
+    if not boxes:
+        raise serial.SerialException(f"No Perch Detector found on {', '.join(candidates)}.")
+    port, ser = boxes[0]
+    save_identity(port)
+    return ser
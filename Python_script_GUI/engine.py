@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Experiment engine: serial link, switching schedule, playback and logging, without any GUI.
+
+The Tk window (4CT.py) and the headless runner (headless.py) are two front-ends over the same
+ExperimentEngine. They hear about new log entries, counts and switches through the on_log,
+on_count and on_switch callbacks, which are called from the engine threads.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from arena import Arena, perch_number
+from audio_engine import AudioEngine
+from event_counts import EventCounter
+from event_records import EventRecords
+from log_writer import SESSION_FOLDER, StreamingLogWriter
+from playback_plan import PLAN_MODES, PlaybackPlan, new_seed
+from rotation import DAILY_FOLDER, DailyRotation
+from schedule import CompiledSchedule, seconds_of_day
+from serial_link import SerialTransport
+from stimulus_cache import DEFAULT_BUDGET_MB
+from stimulus_import import STIMULUS_FOLDER, import_stimuli
+from stimulus_registry import StimulusRegistry
+from telemetry import LatencyTelemetry, parse_latency_line
+from tracing import TRACER
+
+
+def parse_single_response(response):
+    if len(response) < 2:
+        return "Invalid response format", 0
+    try:
+        action = response[0]
+        count = int(response[1:])
+        return action, count
+    except (IndexError, ValueError):
+        return "Parsing error", 0
+
+#Text of a command reply, or the reason it is missing
+def reply_text(reply):
+    if reply.cancelled():
+        return "cancelled"
+    error = reply.exception()
+    return str(error) if error else reply.result()
+
+
+class ExperimentEngine:
+    def __init__(self, ser, choices=4, cache_budget_mb=DEFAULT_BUDGET_MB, session_folder=SESSION_FOLDER,
+                 daily_folder=DAILY_FOLDER, on_log=None, on_count=None, on_switch=None, on_message=None,
+                 audio_device=None, playback_policy="interrupt", stimulus_folder=STIMULUS_FOLDER, normalise_dbfs=None,
+                 plan_mode="sequence", plan_seed=None, on_rejected=None):
+        self.arena = Arena(choices)
+        self.on_log = on_log          # on_log(entry) after every log entry
+        self.on_rejected = on_rejected  # on_rejected(stimulus, message) when a song selection is refused in the background
+        self.on_count = on_count      # on_count(section, stimulus, count) after every perch event
+        self.on_switch = on_switch    # on_switch(sections) when the active sections change
+        self.labels = {"experiment": "", "species": ""}
+        self.songs = {stimulus: [] for stimulus in self.arena.stimuli}
+        self.rejected = {}            # stimulus -> why its last selection was refused in the background
+        self.plan_mode = plan_mode    # order of the files trigger after trigger, see playback_plan.py
+        self.plan_seed = new_seed() if plan_seed is None else plan_seed
+        self.plans = {stimulus: PlaybackPlan([], plan_mode, self.plan_seed, stimulus) for stimulus in self.arena.stimuli}
+        self.stimulus_folder = stimulus_folder  # prepared copies of the songs, None = play the files as they are
+        self.normalise_dbfs = normalise_dbfs    # RMS level of the prepared copies, None = level unchanged
+        self.import_lock = threading.Lock()
+        self.registry = StimulusRegistry(stimulus_folder, on_hashed=self.on_song_hashed,   # content hash of the songs
+                                         on_duplicates=self.on_song_duplicates)
+        self.position_labels = {}     # section -> position label ("A-1, B-2, ...")
+        self.positions = {}           # section -> stimulus of each speaker
+        self.schedule = CompiledSchedule([])
+        self.active_sections = None
+        self.active_layout = []       # layout of the last active section, kept in the gaps
+        self.recording = False        # between start_session and stop_session
+        #Log: text lines (log_data, journal on disk) and the same entries as typed records
+        self.log_data = []
+        self.action_count = 0
+        self.log_lock = threading.Lock()
+        self.session_log = StreamingLogWriter(session_folder)
+        self.records = EventRecords()
+        self.counts = EventCounter()  # perch events per (section, stimulus, perch)
+        self.day_counts = EventCounter()  # the same since the last daily rotation, for the summary of the day
+        self.daily_rotation = DailyRotation(self.session_log, folder=daily_folder, summary=self.daily_summary,
+                                            on_saved=self.on_daily_files_saved, records=self.records)
+        self.audio = AudioEngine(speakers=choices, cache_budget_mb=cache_budget_mb, device=audio_device,
+                                 policy=playback_policy)
+        #The transport is the only owner of the port: commands are queued, replies come back as Futures
+        self.on_message = on_message or (lambda message: print(f"Received: {message}"))
+        self.telemetry = LatencyTelemetry()
+        self.latency_event = None     # perch event whose saX1 reply came last, its "Latency SWn" line follows
+        self.transport = SerialTransport(ser, on_message=self.handle_message, channels=choices)
+        self.closed = threading.Event()
+        self.schedule_changed = threading.Event()
+        self.threads = []
+
+    #Start handling the perch events and following the schedule, once the front-end is ready
+    def start(self):
+        self.threads = [threading.Thread(target=self.read_loop, name="perch-events", daemon=True),
+                        threading.Thread(target=self.schedule_loop, name="schedule", daemon=True)]
+        for thread in self.threads:
+            thread.start()
+
+    #------------------------------------------------------------------------------
+    #Log
+    #Log an entry; event and the keyword fields (perch, stimulus, section, count, file, monotonic, detail)
+    #go to the typed record of the entry, see event_records.py
+    @TRACER.traced("engine.log", depth=lambda self, *args, **kwargs: self.session_log.queue.qsize())
+    def log(self, action, event="message", **fields):
+        experiment, species = self.labels["experiment"], self.labels["species"]
+        if "section" not in fields:
+            sections = self.schedule.at()
+            fields["section"] = sections[0] if sections else None
+        with self.log_lock:
+            now = datetime.now()
+            current_time = now.strftime("%Y-%m-%d_%H:%M:%S.%f")[:-3]
+            self.action_count += 1
+            log_entry = f"{self.action_count}_{experiment}_{species}_{current_time}_{action}"
+            self.log_data.append(log_entry)
+            self.session_log.write(log_entry)
+            fields.setdefault("detail", action if event == "message" else "")
+            self.records.append(event, experiment=experiment, species=species, wall=now.timestamp(), **fields)
+        if self.on_log:
+            self.on_log(log_entry)
+        return log_entry
+
+    #Multi-line block (start and end state) written as it is
+    def log_block(self, text):
+        with self.log_lock:
+            self.log_data.append(text)
+            self.session_log.write(text)
+        if self.on_log:
+            self.on_log(text)
+
+    def clear_log(self):
+        with self.log_lock:
+            self.log_data.clear()
+            self.session_log.clear()
+            self.records.clear()
+
+    def set_labels(self, experiment, species):
+        self.labels["experiment"] = experiment
+        self.labels["species"] = species
+
+    #Files of the day written by the midnight rotation
+    def on_daily_files_saved(self, paths):
+        for path in paths:
+            self.log(f"Data saved to {path}")
+
+    #Count summary written with the data of each day: the events of that day only, like its data file
+    def daily_summary(self):
+        current_datetime = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
+        return (f"{current_datetime}\nExperiment name: {self.labels['experiment']}\nCounts of the day:\n"
+                + self.section_count_lines(self.day_counts.take()))
+
+    #Save the data of the day at 00:00:00 and continue in a new file
+    def set_daily_save(self, enabled):
+        if enabled:
+            self.daily_rotation.start()
+        else:
+            self.daily_rotation.stop()
+
+    #------------------------------------------------------------------------------
+    #Songs and playback
+    #Files played for a stimulus, raises ValueError if one of them is already used by another stimulus.
+    #Reads no file: a copy with the same content is found in the background, the selection is then
+    #cleared and reported to on_rejected (see check_songs).
+    def set_songs(self, stimulus, files):
+        for other, other_files in self.songs.items():
+            if other != stimulus and set(files) & set(other_files):
+                raise ValueError(f"Files in Song{stimulus} should be different from files selected in Song{other}.")
+        self.rejected.pop(stimulus, None)
+        self.songs[stimulus] = list(files)
+        self.plans[stimulus] = PlaybackPlan(files, self.plan_mode, self.plan_seed, stimulus)
+        self.registry.set_group(stimulus, files)
+        for file_name in files:
+            self.log(f"Selected audio file for Song{stimulus}: {os.path.basename(file_name)}")
+        self.preload_sounds()
+
+    #Copies of files of another stimulus in a selection (registry thread): the selection is cleared,
+    #unless it was replaced meanwhile
+    def on_song_duplicates(self, stimulus, files, duplicates):
+        if self.songs[stimulus] != files:
+            return
+        file_path, other, other_path = duplicates[0]
+        message = (f"Files in Song{stimulus} should be different from files selected in Song{other}: "
+                   f"{os.path.basename(file_path)} has the same content as {other_path}.")
+        self.songs[stimulus] = []
+        self.plans[stimulus] = PlaybackPlan([], self.plan_mode, self.plan_seed, stimulus)
+        self.rejected[stimulus] = message
+        self.log(f"{message} The selection of Song{stimulus} is cleared.")
+        if self.on_rejected:
+            self.on_rejected(stimulus, message)
+
+    #Wait for the background check of the songs selected so far, raises ValueError if a selection was
+    #refused (not from the GUI thread)
+    def check_songs(self):
+        self.registry.wait()
+        for message in self.rejected.values():
+            raise ValueError(message)
+
+    #Content hash of a selected file, from the registry thread
+    def on_song_hashed(self, stimulus, file_path, digest):
+        self.log(f"SHA-256 of {os.path.basename(file_path)} (Song{stimulus}): {digest}", stimulus=stimulus, file=file_path)
+
+    # Prepare and decode the selected files in the background so they are ready before the first perch hit
+    def preload_sounds(self):
+        sequences = [list(files) for files in self.songs.values()]
+        def load():
+            if self.stimulus_folder:
+                self.registry.wait()  # the hashes are in the index, the import does not read the files again for them
+                self.import_songs([file_path for files in sequences for file_path in files])
+            for file_path, error in self.audio.load(sequences):
+                print(f"Could not decode {file_path}: {error}")
+        threading.Thread(target=load, daemon=True).start()
+
+    # Resample the files to the mixer format (and normalise them) once, in worker processes, see stimulus_import.py
+    def import_songs(self, files):
+        frequency, _, channels = self.audio.format
+        # Dates of the originals before the import: a file edited since is decoded from itself, not from its copy
+        modified = {}
+        for file_path in files:
+            try:
+                modified[file_path] = os.stat(file_path).st_mtime_ns
+            except OSError:
+                pass
+        with self.import_lock:
+            prepared, failed = import_stimuli(files, self.stimulus_folder, frequency, channels, self.normalise_dbfs)
+            previous = self.audio.cache.sources
+            self.audio.cache.set_sources({file_path: (target, modified.get(file_path))
+                                          for file_path, (target, levels) in prepared.items()})
+        for file_path, (target, levels) in prepared.items():
+            if levels and previous.get(file_path, (None,))[0] != target:
+                self.log(f"Prepared {os.path.basename(file_path)}: peak {levels['peak_dbfs']:.1f} dBFS, "
+                         f"RMS {levels['rms_dbfs']:.1f} dBFS, gain {levels['gain_db']:+.1f} dB")
+        # In the log, so the user sees that these songs are played from the originals (not normalised)
+        normalised = "" if self.normalise_dbfs is None else ", without normalisation"
+        for file_path, error in failed:
+            self.log(f"Could not prepare {os.path.basename(file_path)}, played from the original file{normalised}: {error}",
+                     file=file_path)
+
+    #RMS level the songs are normalised to, None to keep their level; the songs are prepared again
+    def set_normalisation(self, normalise_dbfs):
+        self.normalise_dbfs = normalise_dbfs
+        self.log(f"Song normalisation: {'off' if normalise_dbfs is None else f'{normalise_dbfs:g} dBFS RMS'}")
+        self.preload_sounds()
+
+    #Order of the files of every song ("sequence", "shuffle", "latin_square" or "rotate"), the plans are
+    #computed again from the seed (a new one if None), which is logged to repeat the session
+    def set_playback_plan(self, mode, seed=None):
+        if mode not in PLAN_MODES:
+            raise ValueError(f"Unknown playback plan {mode!r}, expected one of {', '.join(PLAN_MODES)}")
+        self.plan_mode = mode
+        self.plan_seed = new_seed() if seed is None else seed
+        self.reset_plans()
+        self.log(f"Playback plan: {mode}, seed {self.plan_seed}")
+
+    def reset_plans(self):
+        self.plans = {stimulus: PlaybackPlan(files, self.plan_mode, self.plan_seed, stimulus)
+                      for stimulus, files in self.songs.items()}
+
+    # Start the files of a stimulus on the speaker without waiting for them, the relay is closed when the speaker is silent.
+    # A busy speaker follows its playback policy, the decision is logged before the first file starts.
+    # event: the perch event that triggered it, its onset latency is recorded when the first file starts
+    @TRACER.traced("engine.play")
+    def play(self, stimulus, speaker, received_at=None, event=None):
+        song_name = f"Song{stimulus}"
+        plan = self.plans[stimulus]
+        if self.songs[stimulus]:
+            onset = {"decision": None, "recorded": False}
+
+            def on_decision(decision):
+                onset["decision"] = decision
+                policy = "" if decision == "started" else f" (speaker busy, {self.audio.policies[speaker]} policy)"
+                self.log(f"{song_name} on speaker {speaker}: {decision}{policy}", event="playback_decision",
+                         perch=speaker, stimulus=stimulus, detail=decision, monotonic=time.perf_counter())
+
+            def on_start(file_path, found):
+                # Queued and dropped songs start late or never on purpose, they are left out of the onset latency.
+                # A file decoded after a cache miss starts here too, from the prefetch thread.
+                if (found and event is not None and received_at is not None and not onset["recorded"]
+                        and onset["decision"] in ("started", "interrupted")):
+                    onset["recorded"] = True
+                    self.record_latency("onset", event, (time.perf_counter() - received_at) * 1000)
+                if found:
+                    self.log(f"{song_name} played this file: {os.path.basename(file_path)}",
+                             event="playback", perch=speaker, stimulus=stimulus, file=file_path)
+                else:
+                    self.log(f"File not found: {file_path}", event="missing_file", perch=speaker,
+                             stimulus=stimulus, file=file_path)
+            sequence = self.audio.play(speaker, song_name, plan.next(), on_start=on_start, on_decision=on_decision,
+                                       on_done=lambda: self.send(f"sa{speaker}0 r/n"), received_at=received_at)
+            self.audio.cache.prefetch(plan.peek()[0] if plan.files else None)  # first file of the next trigger
+            plan.refill()
+            return sequence
+        self.log(f"No sound selected for {song_name}", event="no_sound", perch=speaker, stimulus=stimulus)
+        self.send(f"sa{speaker}0 r/n")
+        return None
+
+    #------------------------------------------------------------------------------
+    #Switching schedule
+    #entries: (section, "HH:MM:SS" start, "HH:MM:SS" end), raises ValueError on a bad time
+    def set_schedule(self, entries):
+        self.schedule = CompiledSchedule(entries)
+        self.schedule_changed.set()
+
+    #Position (arena label) used during a section
+    def set_position(self, section, label):
+        self.positions[section] = self.arena.layout_of(label)
+        self.position_labels[section] = label
+        if self.active_sections and self.active_sections[0] == section:
+            self.active_layout = self.positions[section]
+
+    #Follow the schedule: sleep until the next change, or until the schedule is edited
+    def schedule_loop(self):
+        while not self.closed.is_set():
+            now = seconds_of_day(datetime.now())
+            sections = self.schedule.lookup(now)
+            if sections != self.active_sections:
+                self.switch(sections, now)
+            delay = self.schedule.seconds_to_next_change(now)
+            self.schedule_changed.wait(None if delay is None else delay + 0.005)
+            self.schedule_changed.clear()
+
+    @TRACER.traced("engine.switch")
+    def switch(self, sections, now):
+        self.active_sections = sections
+        if len(sections) != 1 and self.recording:
+            self.log(self.schedule.describe(sections, now))
+        if sections and sections[0] in self.positions:
+            self.active_layout = self.positions[sections[0]]
+        if self.on_switch:
+            self.on_switch(sections)
+
+    #------------------------------------------------------------------------------
+    #Perch events
+    # Perch events are routed by the transport to its events queue, handle them in order
+    def read_loop(self):
+        while self.transport.running:
+            received_at, response = self.transport.events.get()
+            self.handle_perch(response, received_at)
+
+    @TRACER.traced("engine.handle_perch", depth=lambda self, *args: self.transport.events.qsize())
+    def handle_perch(self, response, received_at=None):
+        print(f"Received: {response}")
+        action, count = parse_single_response(response)
+
+        # Section of the event, found in the compiled schedule
+        now = seconds_of_day(datetime.now())
+        sections = self.schedule.lookup(now)
+        if len(sections) != 1:
+            self.log(f"Perch event {response}: {self.schedule.describe(sections, now)}")
+
+        # Perch n is in front of speaker n, the layout gives the stimulus that speaker plays
+        perch = perch_number(action[0])
+        if len(action) != 1 or not 1 <= perch <= self.arena.choices:
+            self.log(f"Unknown perch in {response}")
+            return
+        section = sections[0] if sections else None
+        layout = self.positions.get(section) or self.active_layout
+        stimulus = layout[perch - 1] if layout else None
+        if stimulus is None:
+            self.log(f"Perch {perch}, count: {count}, no switching position active")
+            return
+        # Counted now, under the section of the event
+        event = (perch, stimulus, section, count, received_at)
+        self.send(f"sa{perch}1 r/n", event=event)
+        self.log(f"Perch {perch}, count: {count}", event="perch", perch=perch, stimulus=stimulus,
+                 section=section, count=count, monotonic=received_at)
+        self.play(stimulus, perch, received_at, event)
+        section_count = self.counts.record(section, stimulus, perch)
+        self.day_counts.record(section, stimulus, perch)
+        if self.on_count:
+            self.on_count(section, stimulus, section_count)
+
+    #------------------------------------------------------------------------------
+    #Commands
+    #event: the perch event a saX1 answers, for the latency telemetry
+    @TRACER.traced("engine.send", depth=lambda self, *args, **kwargs: self.transport.commands.qsize())
+    def send(self, command, event=None):
+        reply = self.transport.send(command)
+        if command.startswith("sa"):
+            reply.add_done_callback(lambda reply: self.relay_replied(reply, event))
+        return reply
+
+    #------------------------------------------------------------------------------
+    #Latency telemetry
+    #Reply to a sa command (serial reader thread): the latency lines printed after it belong to this command
+    def relay_replied(self, reply, event):
+        self.latency_event = event
+        if event is not None and not reply.cancelled() and reply.exception() is None and event[4] is not None:
+            self.record_latency("ack", event, (time.perf_counter() - event[4]) * 1000)
+
+    #Lines of the box that answer no command
+    def handle_message(self, line):
+        latency = parse_latency_line(line)
+        event = self.latency_event
+        if latency and event is not None and latency[0] == event[0]:
+            self.latency_event = None
+            self.record_latency("firmware", event, latency[1])
+        self.on_message(line)
+
+    def record_latency(self, metric, event, value_ms):
+        perch, stimulus, section, count, received_at = event
+        self.telemetry.record(metric, perch, value_ms)
+        self.records.append("latency", detail=metric, perch=perch, stimulus=stimulus, section=section, count=count,
+                            experiment=self.labels["experiment"], species=self.labels["species"], value=value_ms)
+
+    #What a hit on a busy speaker does ("interrupt", "queue" or "drop"), for one speaker or all of them
+    def set_playback_policy(self, policy, speaker=None):
+        self.audio.set_policy(policy, speaker)
+        self.log(f"Playback policy of {f'speaker {speaker}' if speaker else 'all speakers'}: {policy}")
+
+    def set_perch_delay(self, milliseconds):
+        command = f"sd{milliseconds} r/n"
+        self.send(command).add_done_callback(
+            lambda reply: self.log(f"Perch timeout of {command}, Received Action: {reply_text(reply)}"))
+
+    def run(self):
+        reply = self.send("n r/n")
+        reply.add_done_callback(lambda reply: print(f"Progam is starting with {reply_text(reply)}"))
+        return reply
+
+    def pause(self):
+        reply = self.send("p r/n")
+        reply.add_done_callback(lambda reply: print(f"Program is stopping with {reply_text(reply)}"))
+        return reply
+
+    def reset(self):
+        self.send("r r/n").add_done_callback(lambda reply: print(f"Program is reset with {reply_text(reply)}"))
+
+    #The counts of the box and the in-memory ones start again from zero
+    def clear_counters(self):
+        self.counts.clear()
+        self.send("c r/n").add_done_callback(lambda reply: print(f"Counter is clear with {reply_text(reply)}"))
+
+    def close_speakers(self):
+        return [self.send(f"sa{speaker}0 r/n") for speaker in self.arena.speakers]
+
+    #------------------------------------------------------------------------------
+    #Session
+    def start_session(self, perch_delay, start_time, end_time):
+        self.recording = True
+        self.telemetry.clear()
+        self.counts.clear()
+        self.reset_plans()  # the session follows the plans from their start, as the seed gives them
+        self.set_perch_delay(perch_delay)
+        self.log_block(self.start_state_text(perch_delay, start_time, end_time))
+        self.run()
+
+    #Stop the box and log the counts, returns the replies of the commands sent
+    def stop_session(self):
+        self.recording = False
+        replies = [self.pause()]
+        self.log_block(self.ending_state_text())
+        return replies + self.close_speakers()
+
+    def start_state_text(self, perch_delay, start_time, end_time):
+        current_datetime = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
+        selected_files_lines = "".join(f"\nThe files selected for Song {stimulus} are: {', '.join(files)}"
+                                       for stimulus, files in self.songs.items())
+        selected_files_lines += f"\nPlayback plan: {self.plan_mode}, seed {self.plan_seed}"
+        # Only the hashes already computed, a file still hashed in the background gets its log line when done
+        selected_files_lines += "".join(f"\nSHA-256 of {os.path.basename(file_path)}: {digest or 'pending, logged when computed'}"
+                                        for file_path, digest in self.registry.selected_hashes().items())
+        starting_position = self.position_labels.get(0, self.arena.default_label)
+        return (f"{current_datetime}\nExperiment name: {self.labels['experiment']}\nSpecies tested: {self.labels['species']}"
+                f"\nStarting position: {starting_position}\nPerch timeout(ms): {perch_delay}{selected_files_lines}"
+                f"\nStart time setted for {start_time} & End time setted for {end_time}")
+
+    #Counts of every section, one line each, from the counts of the session or the given EventCounter
+    def section_count_lines(self, counter=None):
+        counter = counter or self.counts
+        lines = ""
+        selections = [selection for selection, _, _ in self.schedule.entries]
+        selections += [section for section in counter.sections() if section not in selections]
+        for selection in selections:
+            counts = counter.section_totals(selection, self.arena.stimuli)
+            name = f"Section {selection}" if selection is not None else "Outside the sections"
+            lines += f"{name}: " + ", ".join(f"Song {stimulus}: {counts[stimulus]}" for stimulus in self.arena.stimuli) + "\n"
+        return lines
+
+    def ending_state_text(self):
+        current_datetime = datetime.now().strftime("%H:%M:%S %d/%m/%Y")
+        text = f"{current_datetime}\nExperiment name: {self.labels['experiment']}\nSpecies tested: {self.labels['species']}\n"
+        for i, (selection, _, _) in enumerate(self.schedule.entries):
+            text += f"Switch {i}, Position ({self.position_labels.get(selection, '')}): \n"
+        text += self.section_count_lines()
+        latency = self.audio.latency_summary()
+        if latency:
+            text += "Perch-to-onset latency (ms): median {:.1f}, p95 {:.1f}, max {:.1f}\n".format(*latency)
+        text += self.telemetry.report_lines()
+        cache = self.audio.cache.stats()
+        text += (f"Stimulus cache: hits {cache['hits']}, misses {cache['misses']}, "
+                 f"evictions {cache['evictions']}, prefetches {cache['prefetches']}\n")
+        return text
+
+    def close(self):
+        self.closed.set()
+        self.schedule_changed.set()
+        self.transport.close()
+        self.audio.close()
+        self.registry.close()
+        self.daily_rotation.stop()
+        try:
+            self.session_log.close()
+        except OSError as e:
+            print(f"Could not close the session log: {e}")
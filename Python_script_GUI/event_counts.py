@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Perch event counters.
+
+Every perch event is counted when it arrives, under the switching section active at that moment,
+the stimulus that was played and the perch that was hit. The count boxes of the GUI and the section
+totals of the log are read from here, so a switch between two events cannot move counts to the
+wrong section.
+"""
+import threading
+from collections import Counter
+
+
+class EventCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()  # (section, stimulus, perch) -> events
+        self.totals = Counter()  # (section, stimulus) -> events
+
+    #Count one event, returns the new count of the stimulus in that section
+    def record(self, section, stimulus, perch):
+        with self.lock:
+            self.counts[(section, stimulus, perch)] += 1
+            self.totals[(section, stimulus)] += 1
+            return self.totals[(section, stimulus)]
+
+    #Events of each stimulus in a section, {stimulus: count} for the given stimuli
+    def section_totals(self, section, stimuli):
+        with self.lock:
+            return {stimulus: self.totals[(section, stimulus)] for stimulus in stimuli}
+
+    #Sections with at least one event
+    def sections(self):
+        with self.lock:
+            return sorted({section for section, _, _ in self.counts}, key=lambda section: (section is None, str(section)))
+
+    #Copy of the counters, {(section, stimulus, perch): count}
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    #Counter holding the events counted so far, this one starts again from zero
+    def take(self):
+        taken = EventCounter()
+        with self.lock:
+            taken.counts, self.counts = self.counts, Counter()
+            taken.totals, self.totals = self.totals, Counter()
+        return taken
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+            self.totals.clear()
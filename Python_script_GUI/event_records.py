@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Typed event records.
+
+Every log entry is also kept as a record with typed fields (sequence number, monotonic and wall
+clock times, event type, perch, stimulus, section, file, measured value...). The records are stored by column in
+compact `array` buffers, texts (files, names, messages) as indexes into a table of strings, so a
+long session costs about 50 bytes per event. The exporters write the columns in one pass:
+a real CSV file, or a binary columnar file that read_columnar loads back without parsing text.
+"""
+import csv
+import json
+import math
+import struct
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+
+EVENT_TYPES = ("message", "perch", "playback", "missing_file", "no_sound", "latency", "playback_decision")
+COLUMNS = (                # name, array typecode; -1 (0 for the stimulus, NaN for the value) when the field is empty
+    ("seq", "Q"),
+    ("monotonic", "d"),    # time.perf_counter() seconds, same clock as the perch events
+    ("wall", "d"),         # time.time() seconds
+    ("event", "B"),        # index in EVENT_TYPES
+    ("perch", "b"),
+    ("stimulus", "B"),     # letter code, "A" = 65
+    ("section", "b"),
+    ("count", "i"),        # perch count reported by the firmware
+    ("file", "i"),         # index in the string table
+    ("experiment", "i"),
+    ("species", "i"),
+    ("detail", "i"),
+    ("value", "d"),        # measured value, latency records: ms of the metric named in detail
+)
+CSV_HEADER = ["seq", "monotonic", "wall_time", "event", "perch", "stimulus", "section", "count",
+              "file", "experiment", "species", "detail", "value"]
+COLUMNAR_MAGIC = b"4CTCOL1\n"
+
+
+def optional(value, empty=-1):
+    return empty if value is None else value
+
+
+class EventRecords:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.strings = [""]          # string table, index 0 is the empty text
+        self.string_ids = {"": 0}
+        self.next_seq = 1
+        self.day_start = 0           # first record of the current day, see take_day
+
+    def __len__(self):
+        return len(self.columns["seq"])
+
+    def intern(self, text):
+        index = self.string_ids.get(text)
+        if index is None:
+            index = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return index
+
+    #Add a record, returns its sequence number
+    def append(self, event, detail="", perch=None, stimulus=None, section=None, count=None, file=None,
+               experiment="", species="", monotonic=None, wall=None, value=None):
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            row = (seq,
+                   time.perf_counter() if monotonic is None else monotonic,
+                   time.time() if wall is None else wall,
+                   EVENT_TYPES.index(event),
+                   optional(perch),
+                   ord(stimulus) if stimulus else 0,
+                   optional(section),
+                   optional(count),
+                   self.intern(file) if file else -1,
+                   self.intern(experiment),
+                   self.intern(species),
+                   self.intern(detail),
+                   optional(value, math.nan))
+            for (name, _), field in zip(COLUMNS, row):
+                self.columns[name].append(field)
+            return seq
+
+    #Copy of the rows [start, end) and of the string table, the recording continues meanwhile
+    def snapshot(self, start=0, end=None):
+        with self.lock:
+            return {name: column[start:end] for name, column in self.columns.items()}, list(self.strings)
+
+    #Rows of the day that ended, the next call starts after them
+    def take_day(self):
+        with self.lock:
+            start, self.day_start = self.day_start, len(self)
+            return {name: column[start:self.day_start] for name, column in self.columns.items()}, list(self.strings)
+
+    def clear(self):
+        with self.lock:
+            for column in self.columns.values():
+                del column[:]
+            self.day_start = 0
+
+    def write_csv(self, file_path):
+        write_csv(*self.snapshot(), file_path)
+
+    def write_columnar(self, file_path):
+        write_columnar(*self.snapshot(), file_path)
+
+
+#Rows of a snapshot as CSV fields
+def csv_rows(columns, strings):
+    for seq, monotonic, wall, event, perch, stimulus, section, count, file, experiment, species, detail, value in zip(
+            *(columns[name] for name, _ in COLUMNS)):
+        yield (seq, f"{monotonic:.6f}", datetime.fromtimestamp(wall).isoformat(timespec="milliseconds"),
+               EVENT_TYPES[event], perch if perch >= 0 else "", chr(stimulus) if stimulus else "",
+               section if section >= 0 else "", count if count >= 0 else "", strings[file] if file >= 0 else "",
+               strings[experiment], strings[species], strings[detail], "" if math.isnan(value) else f"{value:.3f}")
+
+def write_csv(columns, strings, file_path):
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(csv_rows(columns, strings))
+
+#Binary columnar file: magic, header length, JSON header (columns, string table), then each column
+def write_columnar(columns, strings, file_path):
+    header = json.dumps({
+        "rows": len(columns["seq"]),
+        "byteorder": sys.byteorder,
+        "columns": [[name, typecode, columns[name].itemsize] for name, typecode in COLUMNS],
+        "event_types": list(EVENT_TYPES),
+        "strings": strings,
+    }).encode("utf-8")
+    with open(file_path, "wb") as file:
+        file.write(COLUMNAR_MAGIC)
+        file.write(struct.pack("<I", len(header)))
+        file.write(header)
+        for name, _ in COLUMNS:
+            columns[name].tofile(file)
+
+#Load a columnar file, returns ({name: array}, strings, event types)
+def read_columnar(file_path):
+    with open(file_path, "rb") as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"{file_path} is not a 4CT columnar file")
+        header = json.loads(file.read(struct.unpack("<I", file.read(4))[0]))
+        columns = {}
+        for name, typecode, itemsize in header["columns"]:
+            column = array(typecode)
+            if column.itemsize != itemsize:
+                raise ValueError(f"Column {name} was written with {itemsize}-byte items")
+            column.fromfile(file, header["rows"])
+            if header["byteorder"] != sys.byteorder:
+                column.byteswap()
+            columns[name] = column
+    return columns, header["strings"], header["event_types"]
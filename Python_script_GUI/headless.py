@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Run an experiment without the GUI, e.g. on a lab mini-PC without display:
+    python headless.py experiment.json [--port COM3]
+
+The JSON config holds what is otherwise entered in the window (see experiment_example.json). The
+session starts at "start" (at once if that time is already running) and ends at "end", or on
+Ctrl+C; the log is then exported to the "output" folder as .txt, .csv and .4ctcol files.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import wait
+from datetime import datetime
+
+from discovery import open_serial_port
+from engine import ExperimentEngine
+from log_writer import SESSION_FOLDER, export_text
+from rotation import DAILY_FOLDER
+from schedule import SECONDS_PER_DAY, parse_time, seconds_of_day
+from stimulus_cache import DEFAULT_BUDGET_MB
+from tracing import TRACER
+
+DEFAULTS = {
+    "port": None,                # first serial port that opens
+    "choices": 4,
+    "experiment": "",
+    "species": "Zebra finch",
+    "perch_delay_ms": 250,
+    "start": None,               # "HH:MM:SS", None = now
+    "end": None,                 # "HH:MM:SS", None = until Ctrl+C
+    "songs": {},                 # stimulus letter -> list of files
+    "sections": [],              # {"section", "start", "end", "position"}
+    "daily_save": True,
+    "output": os.path.join(os.path.expanduser("~"), "4CT", "exports"),
+    "cache_budget_mb": DEFAULT_BUDGET_MB,
+    "audio_device": None,        # sound card output, None = the default one
+    "data_folder": None,         # session journals and daily files, None = the 4CT folder in the home directory
+    "normalise_dbfs": None,      # RMS level the songs are normalised to, e.g. -20, None = level unchanged
+    "playback_plan": "sequence",  # order of the files: "sequence", "shuffle", "latin_square" or "rotate"
+    "plan_seed": None,           # seed of the plans, None = a new one (logged)
+    "playback_policy": "interrupt",  # hit on a busy speaker: "interrupt", "queue" or "drop", or {"speaker": policy}
+    "trace": False,              # span tracing of the event path, dumped with the export (see tracing.py)
+}
+COMMAND_TIMEOUT = 5.0  # seconds to wait for the last commands before closing the port
+WAIT_SLICE = 1.0       # seconds, Ctrl+C is checked at least this often
+
+
+def load_config(path):
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    unknown = set(config) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown config keys: {', '.join(sorted(unknown))}")
+    return {**DEFAULTS, **config}
+
+#Apply the config to the engine, raises ValueError on a bad time, position or song selection
+def configure(engine, config):
+    engine.set_labels(config["experiment"], config["species"])
+    for entry in config["sections"]:
+        try:
+            engine.set_position(entry["section"], entry["position"])
+        except KeyError:
+            raise ValueError(f"Unknown position {entry.get('position')!r} in section {entry.get('section')}")
+    engine.set_schedule([(entry["section"], entry["start"], entry["end"]) for entry in config["sections"]])
+    for stimulus, files in config["songs"].items():
+        if stimulus not in engine.songs:
+            raise ValueError(f"No song {stimulus} in a {engine.arena.choices}-choice arena")
+        engine.set_songs(stimulus, files)
+    engine.check_songs()
+    engine.set_playback_plan(config["playback_plan"], config["plan_seed"])
+    policies = config["playback_policy"]
+    if isinstance(policies, dict):
+        for speaker, policy in policies.items():
+            engine.set_playback_policy(policy, int(speaker))
+    else:
+        engine.set_playback_policy(policies)
+    engine.set_daily_save(config["daily_save"])
+
+#Seconds to wait before the session and its duration (None = open ended), now in seconds of the day.
+#Without an end the window is open from the start until midnight, so a start already passed today runs now.
+def session_window(config, now):
+    start = parse_time(config["start"]) if config["start"] else None
+    end = parse_time(config["end"]) if config["end"] else None
+    delay = 0
+    if start is not None:
+        if end is None:
+            running = now >= start
+        else:
+            running = (now - start) % SECONDS_PER_DAY < (end - start) % SECONDS_PER_DAY
+        delay = 0 if running else (start - now) % SECONDS_PER_DAY
+    duration = (end - now - delay) % SECONDS_PER_DAY if end is not None else None
+    return delay, duration
+
+#Sleep for seconds (None = forever), returns True if stopped meanwhile
+def wait_or_stop(stopped, seconds):
+    remaining = float("inf") if seconds is None else seconds
+    while remaining > 0:
+        if stopped.wait(min(remaining, WAIT_SLICE)):
+            return True
+        remaining -= WAIT_SLICE
+    return False
+
+#Export the log of the session as text, CSV columns and the columnar file
+def export_session(engine, config):
+    os.makedirs(config["output"], exist_ok=True)
+    name = f"{config['experiment'] or 'session'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    base = os.path.join(config["output"], name)
+    export_text(engine.session_log.journals(), base + ".txt")
+    engine.records.write_csv(base + ".csv")
+    engine.records.write_columnar(base + ".4ctcol")
+    if TRACER.enabled:
+        TRACER.dump(base + ".trace.json")
+    return base
+
+#Write the spans traced so far to the output folder, returns the path
+def dump_trace(config):
+    os.makedirs(config["output"], exist_ok=True)
+    path = os.path.join(config["output"], f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    TRACER.dump(path)
+    return path
+
+
+#Run the session of a config until its end or until stopped (an Event) is set, returns the closed engine.
+#on_state(text) is told when the session waits, runs and is exported, on_engine(engine) gets the engine
+#once it is configured; on_log and on_count go to the engine.
+def run_experiment(config, stopped, on_log=print, on_count=None, on_state=print, on_engine=None):
+    if config["trace"]:
+        TRACER.enable()
+    ser = open_serial_port(config["port"])
+    folders = {}
+    if config["data_folder"]:
+        folders = {"session_folder": os.path.join(config["data_folder"], os.path.basename(SESSION_FOLDER)),
+                   "daily_folder": os.path.join(config["data_folder"], os.path.basename(DAILY_FOLDER))}
+    engine = ExperimentEngine(ser, choices=config["choices"], cache_budget_mb=config["cache_budget_mb"], on_log=on_log,
+                              on_count=on_count, audio_device=config["audio_device"],
+                              normalise_dbfs=config["normalise_dbfs"], **folders)
+    try:
+        configure(engine, config)
+        if on_engine:
+            on_engine(engine)
+        engine.start()
+        engine.clear_counters()
+        delay, duration = session_window(config, seconds_of_day(datetime.now()))
+        if delay:
+            on_state(f"Waiting {delay:.0f} s for the start at {config['start']}")
+        if not wait_or_stop(stopped, delay):
+            engine.start_session(config["perch_delay_ms"], config["start"] or "", config["end"] or "")
+            on_state("Running")
+            wait_or_stop(stopped, duration)
+            wait(engine.stop_session(), timeout=COMMAND_TIMEOUT)
+            on_state(f"Session exported to {export_session(engine, config)}.*")
+    finally:
+        engine.close()
+        ser.close()
+    return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a 4CT experiment without the GUI")
+    parser.add_argument("config", help="JSON experiment config")
+    parser.add_argument("--port", help="serial port of the Perch Detector, overrides the config")
+    args = parser.parse_args(argv)
+    config = load_config(args.config)
+    if args.port:
+        config["port"] = args.port
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    if hasattr(signal, "SIGUSR1"):
+        # kill -USR1 <pid> writes the trace of the running session
+        signal.signal(signal.SIGUSR1, lambda signum, frame: print(f"Trace written to {dump_trace(config)}"))
+    run_experiment(config, stopped)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
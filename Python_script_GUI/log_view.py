@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Experimental log shown on screen.
+
+The Text widget only keeps the last lines of the log so that appending stays cheap however long the
+run is. The whole history stays in the backing list and can be paged through in a separate window.
+"""
+import tkinter as tk
+from tkinter import Scrollbar
+
+DEFAULT_MAX_LINES = 2000
+HISTORY_PAGE_SIZE = 500
+
+
+class LogView:
+    def __init__(self, text_widget, history, max_lines=DEFAULT_MAX_LINES):
+        self.text = text_widget
+        self.history = history        # list with every log entry, owned by the caller
+        self.max_lines = max_lines
+
+    #Append lines at the bottom and drop the oldest ones beyond max_lines (Tk thread only)
+    def append(self, lines):
+        self.text.insert(tk.END, "\n".join(lines) + "\n")
+        # Text always ends with an empty line after the last newline
+        excess = int(self.text.index("end-1c").split(".")[0]) - 1 - self.max_lines
+        if excess > 0:
+            self.text.delete("1.0", f"{excess + 1}.0")
+        self.text.see(tk.END)
+
+    def clear(self):
+        self.text.delete("1.0", tk.END)
+
+    #Window to page through the whole history, newest page first
+    def open_history(self):
+        window = tk.Toplevel(self.text)
+        window.title("Full experimental log")
+        window.geometry("900x600")
+
+        buttons = tk.Frame(window)
+        buttons.pack(side="bottom", fill="x")
+        page_label = tk.Label(buttons, text="")
+        x_scrollbar = Scrollbar(window, orient=tk.HORIZONTAL)
+        x_scrollbar.pack(side="bottom", fill="x")
+        y_scrollbar = Scrollbar(window, orient=tk.VERTICAL)
+        y_scrollbar.pack(side="right", fill="y")
+        page_text = tk.Text(window, wrap=tk.NONE, xscrollcommand=x_scrollbar.set, yscrollcommand=y_scrollbar.set)
+        page_text.pack(fill="both", expand=True)
+        x_scrollbar.config(command=page_text.xview)
+        y_scrollbar.config(command=page_text.yview)
+
+        last_page = lambda: max(0, (len(self.history) - 1) // HISTORY_PAGE_SIZE)
+        state = {"page": last_page()}
+
+        def show(page):
+            page = min(max(page, 0), last_page())
+            state["page"] = page
+            start = page * HISTORY_PAGE_SIZE
+            entries = self.history[start:start + HISTORY_PAGE_SIZE]
+            page_text.configure(state=tk.NORMAL)
+            page_text.delete("1.0", tk.END)
+            page_text.insert(tk.END, "\n".join(entries))
+            page_text.configure(state=tk.DISABLED)
+            page_label.config(text=f"Entries {start + 1 if entries else 0}-{start + len(entries)} of {len(self.history)}")
+
+        tk.Button(buttons, text="<< First", command=lambda: show(0)).pack(side="left", padx=5, pady=5)
+        tk.Button(buttons, text="< Older", command=lambda: show(state["page"] - 1)).pack(side="left", padx=5, pady=5)
+        page_label.pack(side="left", padx=20)
+        tk.Button(buttons, text="Latest >>", command=lambda: show(last_page())).pack(side="right", padx=5, pady=5)
+        tk.Button(buttons, text="Newer >", command=lambda: show(state["page"] + 1)).pack(side="right", padx=5, pady=5)
+        show(state["page"])
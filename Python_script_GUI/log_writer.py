@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Crash-safe session log.
+
+Every log entry is appended to a journal file (one JSON string per line) by a background thread.
+Entries are written in batches and synced to disk at least every FSYNC_INTERVAL seconds or every
+FSYNC_RECORDS entries, so a crash loses at most that much. A journal cut in the middle of a line
+is repaired the next time the program starts. Exports are a conversion of the journal.
+A write that fails (full disk, unplugged drive) keeps the entries in memory and is tried again; the
+error is raised to whoever waits for the journal (flush, rotate, close) instead of hanging them.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+SESSION_FOLDER = os.path.join(os.path.expanduser("~"), "4CT", "sessions")
+FSYNC_INTERVAL = 1.0   # seconds
+FSYNC_RECORDS = 200    # entries
+JOURNAL_SUFFIX = ".jsonl"
+WAIT_TIMEOUT = 10.0    # seconds a flush, rotation or close waits for the writer thread
+
+
+#Offset of the first byte of the line that ends at end
+def last_line_start(journal, end):
+    position = end - 1  # skip the newline closing that line
+    while position > 0:
+        chunk_start = max(0, position - 4096)
+        journal.seek(chunk_start)
+        newline = journal.read(position - chunk_start).rfind(b"\n")
+        if newline >= 0:
+            return chunk_start + newline + 1
+        position = chunk_start
+    return 0
+
+#Cut a journal after its last complete entry, returns the number of bytes dropped
+def repair_journal(path):
+    with open(path, "rb+") as journal:
+        size = journal.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = last_line_start(journal, end)
+            journal.seek(start)
+            line = journal.read(end - start)
+            if line.endswith(b"\n"):
+                try:
+                    json.loads(line)
+                    break
+                except ValueError:
+                    pass
+            end = start
+        if end < size:
+            journal.truncate(end)
+    return size - end
+
+#Repair every journal left in the folder (e.g. by a crash during the last run)
+def repair_journals(folder):
+    repaired = []
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(JOURNAL_SUFFIX):
+            path = os.path.join(folder, name)
+            dropped = repair_journal(path)
+            if dropped:
+                repaired.append((path, dropped))
+    return repaired
+
+#Log entries stored in a journal
+def read_journal(path):
+    with open(path, encoding="utf-8") as journal:
+        for line in journal:
+            yield json.loads(line)
+
+#Write the entries of the journals as a text file, one entry per line
+def export_text(journal_paths, file_path, newline=None):
+    with open(file_path, "w", newline=newline) as file:
+        for journal_path in journal_paths:
+            for entry in read_journal(journal_path):
+                file.write(entry + "\n")
+
+
+class StreamingLogWriter:
+    def __init__(self, folder=SESSION_FOLDER, fsync_interval=FSYNC_INTERVAL, fsync_records=FSYNC_RECORDS):
+        self.folder = folder
+        self.fsync_interval = fsync_interval
+        self.fsync_records = fsync_records
+        os.makedirs(folder, exist_ok=True)
+        for path, dropped in repair_journals(folder):
+            print(f"Repaired truncated session log {path} ({dropped} bytes dropped)")
+        self.path = self.new_path()
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.segments = [self.path]      # journals written since the log was last cleared
+        self.day_segments = [self.path]  # journals written since the last daily rotation
+        self.queue = queue.Queue()
+        self.unsynced = 0                # entries written since the last sync
+        self.error = None                # last write error, None once a write succeeds again
+        self.thread = threading.Thread(target=self.write_loop, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def new_path(self, label=None):
+        label = label or datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return os.path.join(self.folder, f"session_{label}{JOURNAL_SUFFIX}")
+
+    #Queue an entry, it reaches the disk within the fsync interval
+    def write(self, entry):
+        self.queue.put(("entry", entry))
+
+    #Ask the writer thread and wait for it, raises the OSError it met (TimeoutError if it does not answer)
+    def request(self, kind, label=None):
+        done, result = threading.Event(), {}
+        self.queue.put((kind, (label, done, result)))
+        if not done.wait(WAIT_TIMEOUT):
+            raise TimeoutError(f"The session log writer did not answer within {WAIT_TIMEOUT:g} s")
+        if "error" in result:
+            raise result["error"]
+        return result
+
+    #Wait until every entry queued so far is on disk
+    def flush(self):
+        self.request("flush")
+
+    #Close the current journal and continue in a new one, returns the path of the closed journal.
+    #Runs in the writer thread, so the entries queued before stay in the old journal.
+    def rotate(self, label=None):
+        return self.request("rotate", label)["closed"]
+
+    #Close the journals of the day that ended, returns their paths
+    def rotate_day(self):
+        self.rotate()
+        closed, self.day_segments = self.day_segments[:-1], [self.path]
+        return closed
+
+    #Start a new journal that the next exports begin from (the old ones stay on disk)
+    def clear(self):
+        self.rotate()
+        self.segments = [self.path]
+
+    #Journals of the session since the last clear, synced to disk
+    def journals(self):
+        self.flush()
+        return list(self.segments)
+
+    def close(self):
+        self.request("close")
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    #Write the lines (emptied once written) and sync if asked; an OSError is recorded, returned and
+    #printed once, the lines stay for the next try
+    def store(self, lines, sync):
+        try:
+            if lines:
+                self.file.write("".join(lines))
+                self.unsynced += len(lines)
+                lines.clear()
+            if sync and self.unsynced:
+                self.sync()
+                self.unsynced = 0
+        except OSError as e:
+            if self.error is None:
+                print(f"Could not write the session log {self.path}: {e}")
+            self.error = e
+            return e
+        self.error = None
+        return None
+
+    def write_loop(self):
+        lines = []   # entries not written yet
+        last_sync = time.monotonic()
+        while True:
+            pending = self.unsynced or lines
+            timeout = max(0.0, last_sync + self.fsync_interval - time.monotonic()) if pending else None
+            try:
+                batch = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            # Take everything already waiting in a single write
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for kind, value in batch:
+                if kind == "entry":
+                    lines.append(json.dumps(value) + "\n")
+                    continue
+                # flush, rotate or close: the entries queued before go to disk first
+                label, done, result = value
+                error = self.store(lines, sync=True)
+                last_sync = time.monotonic()
+                if error is not None:
+                    result["error"] = error
+                if kind == "rotate":
+                    result["closed"] = self.path
+                    if error is None:
+                        self.open_next(label, result)
+                elif kind == "close":
+                    try:
+                        self.file.close()
+                    except OSError as e:
+                        result.setdefault("error", e)
+                    done.set()
+                    return
+                done.set()
+            if self.store(lines, sync=False) is None and self.unsynced and (
+                    self.unsynced >= self.fsync_records or time.monotonic() - last_sync >= self.fsync_interval):
+                self.store(lines, sync=True)
+                last_sync = time.monotonic()
+            elif self.error is not None and time.monotonic() - last_sync >= self.fsync_interval:
+                last_sync = time.monotonic()  # try again after the interval, not in a busy loop
+
+    #Continue in a new journal; if it cannot be opened the entries stay in the current one
+    def open_next(self, label, result):
+        path = self.new_path(label)
+        try:
+            file = open(path, "a", encoding="utf-8")
+        except OSError as e:
+            result["error"] = e
+            return
+        try:
+            self.file.close()
+        except OSError:
+            pass  # synced just before
+        self.path, self.file = path, file
+        self.segments.append(self.path)
+        self.day_segments.append(self.path)
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+Run several Perch Detector boxes (carousels) from one computer:
+    python multi_box.py boxes.json
+
+boxes.json holds a list of boxes, each one a headless experiment config (see headless.py and
+boxes_example.json) with a unique "name". Every box runs in its own worker process with its own
+engine: serial port, schedule, songs, counters, log and sound card output, so a busy box cannot
+delay the perch events of another one (separate processes share no lock and no interpreter).
+Boxes without a "port" get the Perch Detectors found on the ports no other box claims. The controller prints a combined
+status table every "status_interval" seconds, Ctrl+C stops every session and exports the logs.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+from discovery import find_boxes, list_serial_ports
+from headless import DEFAULTS, run_experiment
+
+BOXES_FOLDER = os.path.join(os.path.expanduser("~"), "4CT", "boxes")
+STATUS_INTERVAL = 10.0   # seconds between status tables
+JOIN_TIMEOUT = 30.0      # seconds for a worker to stop its session and export the log
+
+
+def load_boxes(path):
+    with open(path, encoding="utf-8") as file:
+        setup = json.load(file)
+    boxes = []
+    for box in setup["boxes"]:
+        unknown = set(box) - set(DEFAULTS) - {"name"}
+        if unknown:
+            raise ValueError(f"Unknown config keys in box {box.get('name')!r}: {', '.join(sorted(unknown))}")
+        if not box.get("name"):
+            raise ValueError("Every box needs a name")
+        folder = os.path.join(BOXES_FOLDER, box["name"])
+        boxes.append({**DEFAULTS, "data_folder": folder, "output": os.path.join(folder, "exports"), **box})
+    names = [box["name"] for box in boxes]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Box names should be different: {', '.join(duplicates)}")
+    return boxes, setup.get("status_interval", STATUS_INTERVAL)
+
+#Give the boxes without a port the Perch Detectors found on the ports no box claims, in port order
+def assign_ports(boxes, available=None):
+    claimed = {box["port"] for box in boxes if box["port"]}
+    if available is None and not all(box["port"] for box in boxes):
+        available = find_boxes([port for port in list_serial_ports() if port not in claimed])
+    free = [port for port in available or [] if port not in claimed]
+    for box in boxes:
+        if not box["port"]:
+            if not free:
+                raise ValueError(f"No serial port left for box {box['name']}")
+            box["port"] = free.pop(0)
+    return boxes
+
+
+#Worker process of one box: the session runs here, the status goes back on the queue as
+#(kind, name, *values) tuples, the console output of the engine goes to a file of the box
+def run_box(config, status, stopped, interval):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the controller stops the session through "stopped"
+    name = config["name"]
+    os.makedirs(config["data_folder"], exist_ok=True)
+    console = open(os.path.join(config["data_folder"], "console.txt"), "a", encoding="utf-8", buffering=1)
+    sys.stdout = sys.stderr = console
+
+    def report_latency(engine):
+        def loop():
+            while not stopped.wait(interval):
+                status.put(("latency", name, engine.audio.latency_summary()))
+        threading.Thread(target=loop, name="status", daemon=True).start()
+
+    try:
+        engine = run_experiment(config, stopped, on_log=print,
+                                on_count=lambda section, stimulus, count: status.put(("count", name, section, stimulus, count)),
+                                on_state=lambda text: status.put(("state", name, text)), on_engine=report_latency)
+        status.put(("latency", name, engine.audio.latency_summary()))
+        status.put(("state", name, "Done"))
+    except Exception as e:
+        status.put(("state", name, f"Error: {e}"))
+    finally:
+        console.close()
+
+
+#State of every box as the controller sees it
+class BoxStatus:
+    def __init__(self, config):
+        self.name = config["name"]
+        self.port = config["port"]
+        self.state = "Starting"
+        self.section = None    # section of the last event
+        self.counts = {}       # stimulus -> count in that section
+        self.events = 0
+        self.last_event = None
+        self.latency = None    # (median, p95, max) ms perch-to-onset
+
+    def update(self, kind, values):
+        if kind == "state":
+            self.state = values[0]
+        elif kind == "count":
+            section, stimulus, count = values
+            if section != self.section:
+                self.section, self.counts = section, {}
+            self.counts[stimulus] = count
+            self.events += 1
+            self.last_event = datetime.now()
+        elif kind == "latency":
+            self.latency = values[0]
+
+    def row(self):
+        counts = " ".join(f"{stimulus}:{count}" for stimulus, count in sorted(self.counts.items()))
+        counts = f"S{self.section} {counts}" if self.counts else "-"
+        last = self.last_event.strftime("%H:%M:%S") if self.last_event else "-"
+        latency = "-" if not self.latency else "/".join(f"{value:.1f}" for value in self.latency)
+        return f"{self.name:12} {self.port:14} {self.events:7} {last:>8} {latency:>17}  {counts:24} {self.state}"
+
+def status_table(statuses):
+    header = f"{'box':12} {'port':14} {'events':>7} {'last':>8} {'onset ms p50/95/max':>17}  {'counts':24} state"
+    return "\n".join([datetime.now().strftime("%H:%M:%S"), header] + [status.row() for status in statuses.values()])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run several 4CT boxes from one computer")
+    parser.add_argument("config", help="JSON file with the list of boxes")
+    args = parser.parse_args(argv)
+    boxes, interval = load_boxes(args.config)
+    assign_ports(boxes)
+
+    context = multiprocessing.get_context("spawn")  # a fresh interpreter and mixer for every box
+    status = context.Queue()
+    stopped = context.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    statuses = {box["name"]: BoxStatus(box) for box in boxes}
+    workers = [context.Process(target=run_box, args=(box, status, stopped, interval), name=f"box-{box['name']}")
+               for box in boxes]
+    for worker in workers:
+        worker.start()
+
+    next_table = time.monotonic()
+    while any(worker.is_alive() for worker in workers) or not status.empty():
+        try:
+            kind, name, *values = status.get(timeout=0.5)
+            statuses[name].update(kind, values)
+        except queue.Empty:
+            pass
+        if time.monotonic() >= next_table:
+            print(status_table(statuses), flush=True)
+            next_table = time.monotonic() + interval
+    for worker in workers:
+        worker.join(JOIN_TIMEOUT)
+    print(status_table(statuses))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+"""
+Virtual Perch Detector: a software stand-in for the Arduino box, for load and latency tests.
+
+It opens a pseudo-terminal and answers on it like the firmware (CheckSerial and ReadSensors of
+Perch_Detector_V0.ino): n/p/c/r/l/h, sdxxx, saxy with its "Latency SWx" lines, gcx, and sends the
+A<count>.. perch events of the hits it is fed, from a script or a random generator with bursts.
+Point the GUI or the headless runner at the printed port:
+    python perch_emulator.py --rate 5 --burst-every 60 --burst-size 200
+    python headless.py experiment.json --port /dev/pts/3
+POSIX only (pty module).
+"""
+import argparse
+import heapq
+import os
+import random
+import re
+import select
+import signal
+import sys
+import threading
+import time
+import tty
+
+N_CHANNELS = 4
+MAX_CHANNELS = 8
+DEFAULT_DEBOUNCE_MS = 250
+MAX_LATENCY_MS = 5000    # Max_Latency, longer latencies are not reported
+EEPROM_WRITE_MS = 10     # delay(10) after saving a count, the firmware does nothing else meanwhile
+RESET_MS = 500           # delay(500) before the reset
+EEPROM_SIZE = 4096
+NVM_CHK_ADR = 2
+NVM_ACT_DLY_ADR = 12
+LOOKAHEAD = 0.05         # seconds, hits are queued this long before they are due
+
+#Reply to "h": the switch and relay lines follow the channels, as in the firmware (20 + 2 * channels lines)
+def help_text(channels):
+    lines = [
+        "  *************************************  SERIAL (PC GUI/USB) COMMAND LIST:  ********************************************************8",
+        " (use 115200/8/N/1 + use [NL+CR] in the packet terminator)",
+        "",
+        " **** Single char commands ****",
+        " - h ==> Help/get command info",
+        " - n ==> Run mode  (disables actor action)",
+        " - l ==> list current state with thse parameters:",
+        " 1: RUNMODE ==> 0=OFF, 1 = ON",
+        " 2: SW Delay: xxx in mSecs",
+    ]
+    lines += [f" {ch + 3}: State SW{ch + 1} ==> 0=OFF, 1 = ON" for ch in range(channels)]
+    lines += [f" {ch + 3 + channels}: State Relay {ch + 1} ==> 0=OFF, 1 = ON" for ch in range(channels)]
+    return lines + [
+        " - p ==> Stop mode (enables actor action )",
+        " - c ==> Clear Arduino controller settings (revert to default values) and reset",
+        " - r ==> Reset controller, this restarts Arduino but keeps settings",
+        "",
+        " **** SETTERS ****",
+        " - [sdxxx] ==> Set Delay with xxx as timing in mSecs ==> sd210 = set delay to 120 mSecs",
+        f" - [saxy]  ==> Set audio channel, where [x] is channel (1-{channels}) and [y] is open/close with 0=open and 1=cose.",
+        "",
+        " **** GETTERS ****",
+        " - [gcx] ==> Get count x ==> gc3 = get count perch 3",
+        "",
+    ]
+
+LEADING_INT = re.compile(r"\s*([+-]?\d+)")
+
+
+#NVM address of the count of a channel (NVM_CNT_ADR in the firmware)
+def nvm_count_address(ch):
+    return 4 + 2 * ch if ch < 4 else 14 + 2 * (ch - 4)
+
+#Arduino String.toInt(): leading number of the text, 0 if there is none
+def to_int(text):
+    match = LEADING_INT.match(text)
+    return int(match.group(1)) if match else 0
+
+
+class VirtualPerchDetector:
+    """
+    Emulated box on a pty. hit(perch) presses a perch; with firmware_timing the event follows the
+    firmware's debounce (held longer than the delay, re-armed a delay after release) and the 10 ms
+    EEPROM write after each event, otherwise every hit is sent at once for load tests.
+    on_event(perf_counter, line) and on_command(perf_counter, line) see the traffic of the port.
+    """
+    def __init__(self, channels=N_CHANNELS, firmware_timing=False, hold_ms=400, boot_banner=True,
+                 on_event=None, on_command=None):
+        if not 1 <= channels <= MAX_CHANNELS:
+            raise ValueError(f"The firmware supports 1 to {MAX_CHANNELS} channels, not {channels}")
+        self.channels = channels
+        self.firmware_timing = firmware_timing
+        self.hold_ms = hold_ms
+        self.boot_banner = boot_banner
+        self.on_event = on_event
+        self.on_command = on_command
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # no echo and no newline translation, like a USB serial port
+        self.port = os.ttyname(self.slave)
+        self.eeprom = bytearray(b"\xff" * EEPROM_SIZE)  # erased EEPROM, the first boot stores defaults
+        self.lock = threading.Lock()        # device state
+        self.write_lock = threading.Lock()  # output of the port
+        self.due = threading.Condition(self.lock)
+        self.pending = []                   # heap of (time, order, channel) events to send
+        self.order = 0
+        self.running = False
+        self.threads = []
+        self.sent_events = 0
+        self.ignored_hits = 0               # hits while in stop mode, debouncing or rebooting
+        self.banner = self.boot()
+
+    # ---------------------------------------------------------------- firmware state
+
+    def eeprom_put16(self, address, value):
+        self.eeprom[address:address + 2] = (value & 0xFFFF).to_bytes(2, "little")
+
+    def eeprom_get16(self, address):
+        return int.from_bytes(self.eeprom[address:address + 2], "little")
+
+    #setup(): state after power-up or reset, returns the banner lines
+    def boot(self):
+        now = time.perf_counter()
+        self.runmode = False
+        self.switches_read = False          # Perch_SW_State is only read in run mode
+        self.relays = [0] * self.channels
+        self.latency_start = [now] * self.channels  # LAT_TMR counts from the boot
+        self.armed_at = [now] * self.channels
+        self.pressed_until = [now] * self.channels
+        self.busy_until = now
+        self.rebooting_until = now
+        lines = ["Perch Detector V0 starting..."]
+        if self.eeprom[NVM_CHK_ADR] == 2:
+            self.counts = [self.eeprom_get16(nvm_count_address(ch)) for ch in range(self.channels)]
+            self.debounce_ms = self.eeprom_get16(NVM_ACT_DLY_ADR)
+            lines += ["NVM DATA STORED...", "Fetched NVM data:"]
+            lines += [f"Perch_CH{ch + 1}_Count: {count}" for ch, count in enumerate(self.counts)]
+            lines.append(f"Debounce delay: {self.debounce_ms}")
+        else:
+            lines.append("NO NVM DATA STORED...")
+            self.eeprom[NVM_CHK_ADR] = 2
+            self.store_defaults()
+        lines.append("Perch Detector init done, starting in stopmode...")
+        return lines
+
+    #Defaults(): counts and delay back to the factory values, stored again at the next boot
+    def defaults(self):
+        self.eeprom[NVM_CHK_ADR] = 0
+        self.store_defaults()
+
+    def store_defaults(self):
+        self.debounce_ms = DEFAULT_DEBOUNCE_MS
+        self.counts = [0] * self.channels
+        for ch in range(self.channels):
+            self.eeprom_put16(nvm_count_address(ch), 0)
+        self.eeprom_put16(NVM_ACT_DLY_ADR, self.debounce_ms)
+
+    def latency_ms(self, ch, now):
+        return min(int((now - self.latency_start[ch]) * 1000), MAX_LATENCY_MS)
+
+    #CheckSerial(): reply lines of one command line (without the "\n")
+    def handle_command(self, text, now):
+        code = text[:1]
+        if code == "h":
+            return help_text(self.channels)
+        if code == "l":
+            switches = [int(self.switches_read and now >= self.pressed_until[ch]) for ch in range(self.channels)]
+            return ["", str(int(self.runmode)), str(self.debounce_ms)] + [str(s) for s in switches] + \
+                   [str(relay) for relay in self.relays]
+        if code == "n":
+            self.runmode = True
+            self.switches_read = True
+            return ["*", "RUNMODE"]
+        if code == "p":
+            self.runmode = False
+            self.relays = [0] * self.channels  # SetOutputs() opens the relays in stop mode
+            return ["*", "STOPMODE"]
+        if code == "c":
+            self.defaults()
+            return ["*", "CLEAR"]
+        if code == "r":
+            self.rebooting_until = now + RESET_MS / 1000
+            return ["*", "RESET"]
+        if text[:2] == "sd":
+            value = to_int(text[2:])
+            if 0 < value < 1000:
+                self.debounce_ms = value
+                self.eeprom_put16(NVM_ACT_DLY_ADR, value)
+                return ["", "*"]
+            return ["", "x"]
+        if text[:2] == "sa":
+            lines = [""]
+            for ch in range(self.channels):
+                latency = self.latency_ms(ch, now)
+                if latency < MAX_LATENCY_MS:
+                    lines.append(f"Latency SW{ch + 1}: {latency} mSecs")
+            ch = ord(text[2]) - ord("1") if len(text) > 2 else -1
+            if 0 <= ch < self.channels:
+                value = to_int(text[3:])
+                if value in (0, 1):
+                    if self.runmode:
+                        self.relays[ch] = value
+                else:
+                    lines.append("x")
+            return lines
+        if text[:2] == "gc":
+            ch = ord(text[2]) - ord("1") if len(text) > 2 else -1
+            if 0 <= ch < self.channels:
+                return [str(self.counts[ch])]
+        return []
+
+    #ReadSensors(): count an event, returns its line or None when the firmware would not see it
+    def count_event(self, ch, now):
+        if not self.runmode or now < self.rebooting_until:
+            self.ignored_hits += 1
+            return None
+        self.counts[ch] = (self.counts[ch] + 1) & 0xFFFF
+        self.latency_start[ch] = now
+        self.eeprom[nvm_count_address(ch)] = self.counts[ch] & 0xFF  # EEPROM.write keeps the low byte
+        self.sent_events += 1
+        return f"{chr(ord('A') + ch)}{self.counts[ch]}"
+
+    # ---------------------------------------------------------------- port
+
+    def write_lines(self, lines):
+        data = "".join(line + "\r\n" for line in lines).encode()
+        with self.write_lock:
+            while data:
+                try:
+                    data = data[os.write(self.master, data):]
+                except OSError:
+                    return  # closed
+
+    def start(self):
+        self.running = True
+        for target, name in ((self.read_loop, "emulator-reader"), (self.event_loop, "emulator-events")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        if self.boot_banner:
+            self.write_lines(self.banner)
+        return self
+
+    def read_loop(self):
+        buffer = bytearray()
+        while self.running:
+            try:
+                ready, _, _ = select.select([self.master], [], [], 0.1)
+                if not ready:
+                    continue
+                data = os.read(self.master, 4096)
+            except (OSError, ValueError):
+                return
+            now = time.perf_counter()
+            buffer += data
+            *lines, tail = buffer.split(b"\n")
+            buffer = bytearray(tail)
+            for line in lines:
+                text = line.decode(errors="replace")
+                if self.on_command:
+                    self.on_command(now, text)
+                with self.lock:
+                    if now < self.rebooting_until:
+                        continue  # input is lost while the Arduino restarts
+                    replies = self.handle_command(text, now)
+                    reboot_at = self.rebooting_until if text[:1] == "r" else None
+                self.write_lines(replies)
+                if reboot_at:
+                    threading.Timer(max(0.0, reboot_at - time.perf_counter()), self.reboot).start()
+
+    def reboot(self):
+        with self.lock:
+            lines = self.boot()
+            self.pending.clear()
+        self.write_lines(lines)
+
+    #Press a perch (1-based) now, or at the perf_counter time "at"
+    def hit(self, perch, at=None, hold_ms=None):
+        ch = perch - 1
+        if not 0 <= ch < self.channels:
+            raise ValueError(f"No perch {perch} on a {self.channels}-channel box")
+        at = time.perf_counter() if at is None else at
+        with self.lock:
+            if self.firmware_timing:
+                hold_ms = self.hold_ms if hold_ms is None else hold_ms
+                if at < self.armed_at[ch] or hold_ms <= self.debounce_ms:
+                    self.ignored_hits += 1
+                    return
+                # SW_ACC_TMR must pass the delay while held, and count back to 0 after release
+                self.armed_at[ch] = at + (hold_ms + self.debounce_ms) / 1000
+                self.pressed_until[ch] = at + hold_ms / 1000
+                at += (self.debounce_ms + 1) / 1000
+            heapq.heappush(self.pending, (at, self.order, ch))
+            self.order += 1
+            self.due.notify()
+
+    #Send the events that are due, all lines of one wake-up in a single write
+    def event_loop(self):
+        while self.running:
+            with self.lock:
+                now = time.perf_counter()
+                if not self.pending:
+                    self.due.wait(0.1)
+                    continue
+                if self.pending[0][0] > now:
+                    self.due.wait(self.pending[0][0] - now)
+                    continue
+                lines = []
+                while self.pending and self.pending[0][0] <= now:
+                    at, _, ch = heapq.heappop(self.pending)
+                    if self.firmware_timing:
+                        # the loop is stuck in the EEPROM delay of the previous event
+                        if at < self.busy_until:
+                            heapq.heappush(self.pending, (self.busy_until, self.order, ch))
+                            self.order += 1
+                            continue
+                        self.busy_until = now + EEPROM_WRITE_MS / 1000
+                    line = self.count_event(ch, now)
+                    if line:
+                        lines.append(line)
+            if lines:
+                self.write_lines(lines)
+                if self.on_event:
+                    sent = time.perf_counter()
+                    for line in lines:
+                        self.on_event(sent, line)
+
+    #Feed hits from an iterable of (seconds from now, perch), returns the feeding thread
+    def play(self, hits):
+        def feed():
+            start = time.perf_counter()
+            for offset, perch in hits:
+                wait = start + offset - LOOKAHEAD - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                if not self.running:
+                    return
+                self.hit(perch, at=start + offset)
+        thread = threading.Thread(target=feed, name="emulator-hits", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def close(self):
+        self.running = False
+        with self.lock:
+            self.due.notify_all()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        for fd in (self.master, self.slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+#Hits at the given times, an iterable of (seconds, perch) sorted by time
+def scripted_hits(script):
+    return iter(sorted(script))
+
+#Script file with one "seconds perch" pair per line, "#" starts a comment
+def load_script(path):
+    script = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            fields = line.split("#")[0].split()
+            if fields:
+                script.append((float(fields[0]), int(fields[1])))
+    return scripted_hits(script)
+
+#Random hits on random perches: a Poisson stream of "rate" hits per second, plus every
+#"burst_every" seconds (on average) a burst of "burst_size" hits within "burst_spread" seconds
+def random_hits(rate, perches=N_CHANNELS, duration=None, burst_every=0.0, burst_size=0, burst_spread=0.05, seed=None):
+    rng = random.Random(seed)
+
+    def poisson(events_per_second):
+        t = 0.0
+        while events_per_second > 0:
+            t += rng.expovariate(events_per_second)
+            yield t
+
+    def bursts():
+        for start in poisson(1 / burst_every if burst_every and burst_size else 0):
+            for t in sorted(start + rng.uniform(0, burst_spread) for _ in range(burst_size)):
+                yield t
+
+    for t in heapq.merge(poisson(rate), bursts()):
+        if duration is not None and t > duration:
+            return
+        yield t, rng.randint(1, perches)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Emulate the Perch Detector box on a pseudo-terminal")
+    parser.add_argument("--channels", type=int, default=N_CHANNELS)
+    parser.add_argument("--script", help='file of "seconds perch" lines, replaces the random hits')
+    parser.add_argument("--rate", type=float, default=1.0, help="random hits per second")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="mean seconds between bursts, 0 = none")
+    parser.add_argument("--burst-size", type=int, default=100, help="hits per burst")
+    parser.add_argument("--burst-spread", type=float, default=0.05, help="seconds a burst lasts")
+    parser.add_argument("--duration", type=float, help="seconds of hits, default until Ctrl+C")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--firmware-timing", action="store_true", help="apply the debounce and EEPROM delays")
+    parser.add_argument("--link", help="also make the port available under this path (symlink)")
+    args = parser.parse_args(argv)
+
+    detector = VirtualPerchDetector(args.channels, firmware_timing=args.firmware_timing)
+    if args.link:
+        if os.path.islink(args.link):
+            os.remove(args.link)
+        os.symlink(detector.port, args.link)
+    print(f"Virtual Perch Detector on {args.link or detector.port}", flush=True)
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    with detector:
+        if args.script:
+            feeder = detector.play(load_script(args.script))
+        else:
+            feeder = detector.play(random_hits(args.rate, args.channels, args.duration, args.burst_every,
+                                               args.burst_size, args.burst_spread, args.seed))
+        while not stopped.wait(1.0) and (feeder.is_alive() or detector.pending):
+            pass
+    if args.link and os.path.islink(args.link):
+        os.remove(args.link)
+    print(f"{detector.sent_events} events sent, {detector.ignored_hits} hits ignored")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
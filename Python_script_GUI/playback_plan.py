@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Playback plans: the order in which the files of a song are played, trigger after trigger.
+
+- sequence: every trigger plays all the files in the selected order (the original behaviour)
+- shuffle: every trigger plays all the files in a new random order
+- latin_square: every trigger plays all the files in the order of a row of a balanced Latin square
+  (Williams design), so every file is played equally often at every position and, with an even
+  number of files, after every other file; the rows are taken in a random order in each cycle
+- rotate: every trigger plays one file, drawn without replacement until all have been played,
+  never the same file twice in a row
+
+The orders are computed in advance from a seeded random generator, the same seed and files give the
+same plan. A trigger only takes the next entry of a deque; the plan is topped up after the song
+has started (refill), so the random draws never delay an onset.
+"""
+import random
+from collections import deque
+
+PLAN_MODES = ("sequence", "shuffle", "latin_square", "rotate")
+PLAN_BLOCK = 1000   # triggers planned ahead
+
+
+def new_seed():
+    return random.SystemRandom().randrange(1 << 31)
+
+#Balanced Latin square of n items: n rows (2n when n is odd), each a list of indexes
+def balanced_latin_square(n):
+    square = []
+    for row in range(n):
+        line = []
+        low, high = 0, 0
+        for position in range(n):
+            if position < 2 or position % 2:
+                value, low = low, low + 1
+            else:
+                value, high = n - high - 1, high + 1
+            line.append((value + row) % n)
+        square.append(line)
+    if n % 2:
+        square += [line[::-1] for line in square]
+    return square
+
+
+class PlaybackPlan:
+    #label: name of the song, mixed in the seed so that every song of a session gets its own order
+    def __init__(self, files, mode="sequence", seed=0, label=""):
+        if mode not in PLAN_MODES:
+            raise ValueError(f"Unknown playback plan {mode!r}, expected one of {', '.join(PLAN_MODES)}")
+        self.files = tuple(files)
+        self.mode = mode
+        self.rng = random.Random(f"{seed}:{label}")
+        self.entries = deque()   # tuple of files of every planned trigger
+        self.cycle = deque()     # rows of the Latin square or files of the rotation still to use
+        self.last = None
+        self.order = list(self.files)
+        if mode == "latin_square":
+            self.rng.shuffle(self.order)   # which file gets which index of the square
+            self.square = balanced_latin_square(len(self.files))
+        self.refill()
+
+    #Plan the triggers used since the last refill
+    def refill(self):
+        for _ in range(PLAN_BLOCK - len(self.entries)):
+            self.entries.append(self.plan_trigger())
+
+    def plan_trigger(self):
+        if not self.files or self.mode == "sequence":
+            return self.files
+        if self.mode == "shuffle":
+            return tuple(self.rng.sample(self.files, len(self.files)))
+        if not self.cycle:
+            self.cycle.extend(self.rng.sample(self.square, len(self.square)) if self.mode == "latin_square"
+                              else self.rng.sample(self.files, len(self.files)))
+            if self.mode == "rotate" and len(self.files) > 1 and self.cycle[0] == self.last:
+                self.cycle.rotate(-1)  # no repeat across two rotations
+        if self.mode == "latin_square":
+            return tuple(self.order[index] for index in self.cycle.popleft())
+        self.last = self.cycle.popleft()
+        return (self.last,)
+
+    #Files of the next trigger
+    def next(self):
+        if not self.entries:
+            self.refill()
+        return self.entries.popleft()
+
+    #Files of the trigger after that one, without using it
+    def peek(self):
+        if not self.entries:
+            self.refill()
+        return self.entries[0]
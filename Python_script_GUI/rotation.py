@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Daily rotation of the session log.
+
+A background thread sleeps until the next boundary (00:00:00 by default), then closes the journal of
+the day, continues in a new one and writes the data and the count summary of the day that ended.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from log_writer import export_text
+from event_records import write_csv
+
+DAILY_FOLDER = os.path.join(os.path.expanduser("~"), "4CT", "daily")
+MAX_SLEEP = 3600  # seconds, wake up at least hourly to follow changes of the system clock
+
+
+#Write a file next to its destination and move it in place, readers never see half a file
+def write_atomically(path, write):
+    temporary = path + ".tmp"
+    with open(temporary, "w", newline="") as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class DailyRotation:
+    #summary() returns the text of the count summary, on_saved(paths) is told about the new files.
+    #With records (EventRecords) the data of the day is written as CSV columns, else as the log lines
+    def __init__(self, writer, folder=DAILY_FOLDER, boundary="00:00:00", summary=None, on_saved=None, records=None):
+        self.writer = writer
+        self.records = records
+        self.folder = folder
+        self.boundary = datetime.strptime(boundary, "%H:%M:%S").time()
+        self.summary = summary
+        self.on_saved = on_saved
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(self.stopped,), name="daily-rotation", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def next_boundary(self, now):
+        boundary = datetime.combine(now.date(), self.boundary)
+        return boundary if boundary > now else boundary + timedelta(days=1)
+
+    def run(self, stopped):
+        target = self.next_boundary(datetime.now())
+        while True:
+            delay = (target - datetime.now()).total_seconds()
+            if delay > 0:
+                if stopped.wait(min(delay, MAX_SLEEP)):
+                    return
+                continue
+            try:
+                self.rotate(target - timedelta(days=1))
+            except OSError as e:
+                print(f"Could not save the data of the day: {e}")  # the entries stay in the session journal
+            target = self.next_boundary(datetime.now())
+
+    #Close the day that started at day and write its files
+    def rotate(self, day):
+        journals = self.writer.rotate_day()
+        os.makedirs(self.folder, exist_ok=True)
+        label = day.strftime("%Y%m%d")
+        data_path = os.path.join(self.folder, f"data_{label}.csv")
+        if self.records is not None:
+            write_csv(*self.records.take_day(), data_path + ".tmp")
+        else:
+            export_text(journals, data_path + ".tmp", newline="")
+        os.replace(data_path + ".tmp", data_path)
+        saved = [data_path]
+        if self.summary:
+            summary_path = os.path.join(self.folder, f"summary_{label}.txt")
+            text = self.summary()
+            write_atomically(summary_path, lambda file: file.write(text))
+            saved.append(summary_path)
+        if self.on_saved:
+            self.on_saved(saved)
+        return saved
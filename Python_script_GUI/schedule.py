@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled switching schedule.
+
+The sections (selection, start, end) are compiled once into a sorted list of time segments of the
+day, each holding the sections that cover it. A section whose end is not after its start runs past
+midnight, one whose start equals its end is empty. The section active at any time is found with a
+binary search, and the time of the next change is known in advance so a timer can be armed for it.
+"""
+from bisect import bisect_right
+from datetime import datetime
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+#"HH:MM:SS" -> seconds since midnight, raises ValueError on a bad time
+def parse_time(text):
+    hours, minutes, seconds = (int(part) for part in text.strip().split(":"))
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time of day: {text!r}")
+    return hours * 3600 + minutes * 60 + seconds
+
+def format_time(seconds):
+    seconds %= SECONDS_PER_DAY
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+#Seconds since midnight of a datetime, with the fraction
+def seconds_of_day(when):
+    return when.hour * 3600 + when.minute * 60 + when.second + when.microsecond / 1e6
+
+
+class CompiledSchedule:
+    #entries: list of (selection, "HH:MM:SS" start, "HH:MM:SS" end), raises ValueError on a bad time
+    def __init__(self, entries):
+        self.entries = [(selection, parse_time(start), parse_time(end)) for selection, start, end in entries]
+        intervals = []
+        for order, (selection, start, end) in enumerate(self.entries):
+            if start < end:
+                intervals.append((start, end, order))
+            elif start > end:  # runs past midnight
+                intervals.append((start, SECONDS_PER_DAY, order))
+                intervals.append((0, end, order))
+        boundaries = sorted({0, SECONDS_PER_DAY} | {start for start, _, _ in intervals} | {end for _, end, _ in intervals})
+        self.starts = []
+        self.covers = []
+        for start in boundaries[:-1]:
+            orders = sorted(order for begin, end, order in intervals if begin <= start < end)
+            cover = tuple(self.entries[order][0] for order in orders)
+            if self.covers and self.covers[-1] == cover:
+                continue  # same sections as the previous segment
+            self.starts.append(start)
+            self.covers.append(cover)
+
+    #Sections covering a time (seconds since midnight): () in a gap, several in an overlap
+    def lookup(self, seconds):
+        return self.covers[bisect_right(self.starts, seconds % SECONDS_PER_DAY) - 1]
+
+    #Sections covering a datetime (now by default)
+    def at(self, when=None):
+        return self.lookup(seconds_of_day(when or datetime.now()))
+
+    #Seconds from a time of the day to the next change of the active sections
+    def seconds_to_next_change(self, seconds):
+        seconds %= SECONDS_PER_DAY
+        index = bisect_right(self.starts, seconds)
+        if len(self.starts) == 1:
+            return None  # the same sections all day
+        if index < len(self.starts):
+            return self.starts[index] - seconds
+        return SECONDS_PER_DAY - seconds + self.starts[1 if self.covers[0] == self.covers[-1] else 0]
+
+    #Text for the log when a time is not covered by exactly one section
+    @staticmethod
+    def describe(cover, seconds):
+        moment = format_time(int(seconds))
+        if not cover:
+            return f"{moment} is not in any switching section"
+        return f"{moment} is in overlapping switching sections {', '.join(str(selection) for selection in cover)}, using section {cover[0]}"
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Serial link with the Perch Detector (Arduino) box.
+
+The reader blocks on the port instead of polling it, so an idle box costs no CPU.
+"""
+import collections
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+
+from tracing import TRACER
+
+#Split the bytes coming from the Arduino in complete lines
+class LineReader:
+    def __init__(self, ser):
+        self.ser = ser
+        self.buffer = bytearray()
+
+    #Block until data arrives (or the port timeout expires) and return every complete line
+    def read_lines(self):
+        data = self.ser.read(1)
+        if not data:
+            return []
+        waiting = self.ser.in_waiting
+        if waiting:
+            data += self.ser.read(waiting)
+        self.buffer += data
+        if b"\n" not in data:
+            return []
+        # Keep the incomplete tail in the buffer for the next wake-up
+        *lines, tail = self.buffer.split(b"\n")
+        self.buffer = bytearray(tail)
+        return [line.decode(errors="replace").strip() for line in lines]
+
+
+#Perch events sent by the firmware without being asked ("A12" = perch 1, count 12)
+PERCH_EVENT = re.compile(r"^[A-Z]\d+$")
+#Lines the firmware prints on its own (latency report, boot banner) that never answer a command
+UNSOLICITED_PREFIXES = ("Latency SW", "Perch Detector", "NVM DATA", "NO NVM DATA", "Fetched NVM data",
+                        "Perch_CH", "Debounce delay")
+
+READ_TIMEOUT = 0.1     # seconds, how often the reader checks for expired replies
+REPLY_TIMEOUT = 1.0    # seconds before a command without reply is given up
+RESET_SETTLE = 1.0     # seconds the Arduino needs after "c"/"r" before it accepts new commands
+N_CHANNELS = 4         # perch/speaker channels of the firmware (N_CHANNELS in the sketch)
+
+#Number of lines the firmware sends back for each command (see CheckSerial in the firmware)
+def expected_reply_lines(command, channels=N_CHANNELS):
+    code = command.split()[0] if command.split() else ""
+    if code in ("n", "p", "c", "r"):
+        return 2   # "*" + RUNMODE/STOPMODE/CLEAR/RESET
+    if code.startswith("sd"):
+        return 2   # spacer + "*" or "x"
+    if code.startswith("sa"):
+        return 1   # spacer, the latency lines that follow are unsolicited
+    if code.startswith("gc"):
+        return 1   # count
+    if code == "l":
+        return 3 + 2 * channels  # spacer, RUNMODE, delay, then every switch and every relay
+    if code == "h":
+        return 20 + 2 * channels  # help text, with a line per switch and per relay
+    return 0
+
+
+class PendingCommand:
+    def __init__(self, command, future, channels=N_CHANNELS):
+        self.command = command
+        self.future = future
+        self.needed = expected_reply_lines(command, channels)
+        self.lines = []
+        self.deadline = None
+
+
+#Single owner of the serial port.
+#A writer thread sends the queued commands without waiting for the previous reply, a reader thread
+#routes perch events to the events queue and matches every other line to the oldest pending command.
+class SerialTransport:
+    #channels: channels of the firmware on the other end, the length of its "l" reply depends on it
+    def __init__(self, ser, on_message=None, reply_timeout=REPLY_TIMEOUT, channels=N_CHANNELS):
+        self.ser = ser
+        self.channels = channels
+        self.ser.timeout = READ_TIMEOUT
+        self.on_message = on_message
+        self.reply_timeout = reply_timeout
+        self.events = queue.Queue()   # (perf_counter at reception, line)
+        self.commands = queue.Queue()
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.running = True
+        self.reader_thread = threading.Thread(target=self.read_loop, name="serial-reader", daemon=True)
+        self.writer_thread = threading.Thread(target=self.write_loop, name="serial-writer", daemon=True)
+        self.reader_thread.start()
+        self.writer_thread.start()
+
+    #Queue a command and return a Future resolved with the reply of the firmware
+    def send(self, command):
+        future = Future()
+        if not self.running:
+            future.set_exception(serial.SerialException("Serial port is closed."))
+            return future
+        self.commands.put(PendingCommand(command, future, self.channels))
+        return future
+
+    def write_loop(self):
+        while self.running:
+            pending = self.commands.get()
+            if pending is None:
+                break
+            with self.lock:
+                if pending.needed:
+                    pending.deadline = time.monotonic() + self.reply_timeout
+                    self.pending.append(pending)
+            try:
+                self.ser.write((pending.command + '\r\n').encode())
+            except (serial.SerialException, OSError) as e:
+                self.fail(pending, e)
+                continue
+            if not pending.needed:
+                pending.future.set_result("")
+            elif pending.command.split()[0] in ("c", "r"):
+                # The Arduino restarts: wait for its ACK and let it boot before the next command
+                try:
+                    pending.future.result(self.reply_timeout + READ_TIMEOUT)
+                except Exception:
+                    pass
+                time.sleep(RESET_SETTLE)
+
+    def read_loop(self):
+        reader = LineReader(self.ser)
+        while self.running:
+            try:
+                lines = reader.read_lines()
+            except (serial.SerialException, OSError, TypeError):
+                break  # Port closed
+            for line in lines:
+                self.route(line)
+            self.expire()
+        self.running = False
+
+    @TRACER.traced("serial.route", depth=lambda self, line: len(self.pending))
+    def route(self, line):
+        if PERCH_EVENT.match(line):
+            self.events.put((time.perf_counter(), line))
+            return
+        if not line.startswith(UNSOLICITED_PREFIXES):
+            with self.lock:
+                pending = self.pending[0] if self.pending else None
+                if pending is not None:
+                    pending.lines.append(line)
+                    if len(pending.lines) < pending.needed:
+                        return
+                    self.pending.popleft()
+            if pending is not None:
+                pending.future.set_result(" ".join(l for l in pending.lines if l))
+                return
+        if self.on_message:
+            self.on_message(line)
+
+    #Give up on commands whose reply did not arrive in time, so later replies stay aligned
+    def expire(self):
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.pending and self.pending[0].deadline < now:
+                expired.append(self.pending.popleft())
+        for pending in expired:
+            pending.future.set_exception(TimeoutError(f"No reply to {pending.command!r}"))
+
+    def fail(self, pending, error):
+        with self.lock:
+            if pending in self.pending:
+                self.pending.remove(pending)
+        if not pending.future.done():
+            pending.future.set_exception(error)
+
+    def close(self):
+        self.running = False
+        self.commands.put(None)
+        self.writer_thread.join(RESET_SETTLE + self.reply_timeout + 1)
+        try:
+            self.ser.close()
+        except (serial.SerialException, OSError, AttributeError):
+            print("Failed to close the serial port.")
+        self.reader_thread.join(READ_TIMEOUT * 10)
+        with self.lock:
+            leftover, self.pending = list(self.pending), collections.deque()
+        for pending in leftover:
+            if not pending.future.done():
+                pending.future.cancel()
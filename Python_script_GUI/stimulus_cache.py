@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-bounded cache of decoded song files.
+
+Buffers are keyed on path + modification time, so a file edited on disk is decoded again. When the
+decoded buffers go over the memory budget the least recently played ones are dropped. A file
+prepared by the import pipeline (stimulus_import.py) is decoded from its prepared copy instead, as
+long as the original has the modification time it had when it was imported.
+"""
+import collections
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import pygame
+
+DEFAULT_BUDGET_MB = 512
+
+
+#Bytes of PCM held by a decoded sound, in the format of the running mixer
+def sound_bytes(sound):
+    frequency, size, channels = pygame.mixer.get_init()
+    return int(sound.get_length() * frequency) * (abs(size) // 8) * channels
+
+
+class StimulusCache:
+    def __init__(self, budget_mb=DEFAULT_BUDGET_MB, loader=pygame.mixer.Sound, measure=sound_bytes):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.loader = loader
+        self.measure = measure
+        self.entries = collections.OrderedDict()  # (path, mtime) -> (sound, bytes), least recent first
+        self.keys = {}                            # path -> key in entries
+        self.loading = {}                         # key -> Future of a decode in progress
+        self.sources = {}                         # path -> (prepared file decoded in its place, mtime of the original)
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self.lock = threading.Lock()
+        self.prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stimulus-prefetch")
+
+    #Decoded sound of the file, decoding it now if it is not in memory (raises like the loader)
+    def get(self, path):
+        return self.fetch(path, count=True, recent=True)
+
+    #Decoded sound of the file if it is in memory (a hit), else None; never decodes (raises OSError if
+    #the file is missing)
+    def lookup(self, path):
+        key = (path, os.stat(path).st_mtime_ns)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    #Decode the file on the prefetch thread (a miss), returns the Future of the sound
+    def load(self, path):
+        return self.prefetcher.submit(self.fetch, path, True, True)
+
+    #Decode the file in the background so that the next get() is a hit
+    def prefetch(self, path):
+        if path is None:
+            return
+        self.prefetcher.submit(self.fetch_quietly, path, False, True)
+
+    #Decode the files, most important first, until the budget is used. Files loaded here are kept
+    #colder than anything already played, so they never push out buffers that are in use.
+    def preload(self, paths):
+        failed = []
+        for path in paths:
+            try:
+                self.fetch(path, count=False, recent=False)
+            except (pygame.error, OSError) as e:
+                failed.append((path, e))
+                continue
+            with self.lock:
+                if self.keys.get(path) not in self.entries:
+                    break  # Evicted straight away: the budget is full
+        return failed
+
+    def fetch_quietly(self, path, count, recent):
+        try:
+            self.fetch(path, count, recent)
+        except (pygame.error, OSError):
+            pass  # Reported when the file is actually played
+
+    def fetch(self, path, count, recent):
+        key = (path, os.stat(path).st_mtime_ns)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if recent:
+                    self.entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[0]
+            if count:
+                self.misses += 1
+            elif recent:
+                self.prefetches += 1
+            future = self.loading.get(key)
+            owner = future is None
+            if owner:
+                future = self.loading[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            sound = self.loader(self.source(path, key[1]))
+        except Exception as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            del self.loading[key]
+            self.insert(key, sound, recent)
+        future.set_result(sound)
+        return sound
+
+    def insert(self, key, sound, recent):
+        stale = self.keys.get(key[0])
+        if stale is not None and stale in self.entries:
+            self.total -= self.entries.pop(stale)[1]
+        size = self.measure(sound)
+        self.entries[key] = (sound, size)
+        self.entries.move_to_end(key, last=recent)
+        self.keys[key[0]] = key
+        self.total += size
+        while self.total > self.budget and len(self.entries) > 1:
+            old_key, (old_sound, old_size) = self.entries.popitem(last=False)
+            self.total -= old_size
+            self.evictions += 1
+            if self.keys.get(old_key[0]) == old_key:
+                del self.keys[old_key[0]]
+
+    #File decoded for path: its prepared copy, or the file itself if it changed since it was prepared
+    def source(self, path, mtime):
+        prepared, prepared_mtime = self.sources.get(path, (None, None))
+        return prepared if prepared is not None and prepared_mtime == mtime else path
+
+    #Decode the files from their prepared copies ({path: (prepared path, mtime_ns of the original when it was
+    #prepared)}), buffers decoded from another source are dropped
+    def set_sources(self, sources):
+        with self.lock:
+            changed = {path for path in set(sources) | set(self.sources) if sources.get(path) != self.sources.get(path)}
+            self.sources = dict(sources)
+            for key in [key for key in self.entries if key[0] in changed]:
+                self.total -= self.entries.pop(key)[1]
+                del self.keys[key[0]]
+
+    #Drop the files that are no longer selected
+    def retain(self, paths):
+        keep = set(paths)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] not in keep]:
+                self.total -= self.entries.pop(key)[1]
+                del self.keys[key[0]]
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "prefetches": self.prefetches, "files": len(self.entries),
+                    "mb": round(self.total / (1024 * 1024), 1)}
+
+    def close(self):
+        self.prefetcher.shutdown(wait=False, cancel_futures=True)
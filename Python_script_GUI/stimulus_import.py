@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Import pipeline of the song files.
+
+The selected files (WAV or MP3, any sample rate, any level) are prepared once in a pool of worker
+processes: decoded, resampled and converted to the mixer format, measured (peak and RMS with NumPy),
+optionally normalised to a target RMS level, and written as 16-bit PCM WAV files into an on-disk
+cache named after the SHA-256 of their content. Playback then only reads ready-to-play files.
+An index keeps the size, modification time and hash of every imported file, so re-importing an
+unchanged library opens no file at all. Also a command line tool to import a whole library:
+    python stimulus_import.py songs/*.wav songs/*.mp3 --normalise -20
+
+The GUI script cannot be imported again by the worker processes (its windows would open), so the
+engine runs the pool in a child interpreter through import_stimuli(). In the frozen build (PyInstaller)
+there is no interpreter to run this file with: the child is the program itself, started with
+IMPORT_COMMAND, which 4CT.py hands over to main() before it opens anything.
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+STIMULUS_FOLDER = os.path.join(os.path.expanduser("~"), "4CT", "stimuli")
+INDEX_FILE = "index.json"
+MIXER_FREQUENCY = 44100
+MIXER_CHANNELS = 2
+NORMALISE_DBFS = -20.0    # RMS level of the normalised files
+PEAK_CEILING_DBFS = -1.0  # the normalisation gain never brings a peak above this level
+HASH_CHUNK = 1 << 20
+IMPORT_TIMEOUT = 600.0    # seconds for the child interpreter to import a selection
+IMPORT_COMMAND = "--import-stimuli"  # first argument of the frozen program when it runs as the child
+
+
+def dbfs(level):
+    return 20 * math.log10(level) if level > 0 else -math.inf
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#Name of the prepared file: same content and same settings give the same file
+def prepared_name(digest, frequency, channels, normalise_dbfs):
+    level = "raw" if normalise_dbfs is None else f"{normalise_dbfs:g}dB"
+    return f"{digest[:32]}_{frequency}_{channels}_{level}.wav"
+
+
+def load_index(folder):
+    try:
+        with open(os.path.join(folder, INDEX_FILE), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"files": {}, "levels": {}}
+
+#Write a file through a temporary file of its own, so processes sharing the folder never write the same file
+def write_atomic(path, write, mode="w"):
+    temporary = tempfile.NamedTemporaryFile(mode, dir=os.path.dirname(path), suffix=".tmp", delete=False,
+                                            **({"encoding": "utf-8"} if "b" not in mode else {}))
+    try:
+        with temporary:
+            write(temporary)
+        os.replace(temporary.name, path)
+    except BaseException:
+        try:
+            os.remove(temporary.name)
+        except OSError:
+            pass
+        raise
+
+#The entries written meanwhile by another process (another box) are kept
+def save_index(folder, index):
+    current = load_index(folder)
+    current["files"].update(index["files"])
+    current["levels"].update(index["levels"])
+    try:
+        write_atomic(os.path.join(folder, INDEX_FILE), lambda file: json.dump(current, file, indent=1))
+    except OSError as e:
+        print(f"Could not save the stimulus index: {e}")
+
+
+#------------------------------------------------------------------------------
+#Worker processes
+decoder_format = None
+
+#The mixer of a worker only decodes: SDL converts every file to its format, which resamples it
+def init_decoder(frequency, channels):
+    global decoder_format
+    if decoder_format != (frequency, channels):
+        os.environ["SDL_AUDIODRIVER"] = "dummy"  # this process never plays anything
+        os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+        import pygame
+        pygame.mixer.quit()
+        pygame.mixer.init(frequency=frequency, size=-16, channels=channels)
+        decoder_format = (frequency, channels)
+
+#Samples of the file in the mixer format, int16 array (frames, channels)
+def decode(path, frequency, channels):
+    import pygame
+    init_decoder(frequency, channels)
+    samples = pygame.sndarray.array(pygame.mixer.Sound(path))
+    return samples.reshape(len(samples), channels)
+
+def write_wav(path, samples, frequency):
+    def write(file):
+        with wave.open(file, "wb") as wav:
+            wav.setnchannels(samples.shape[1])
+            wav.setsampwidth(2)
+            wav.setframerate(frequency)
+            wav.writeframes(samples.astype("<i2").tobytes())
+    write_atomic(path, write, "wb")
+
+#Prepare one file in a worker, returns (digest, prepared file name, levels or None if the prepared
+#file was already there and its levels are in known). digest: hash of the unchanged file from the index.
+def prepare(path, folder, frequency, channels, normalise_dbfs, known=(), digest=None):
+    import numpy as np   # only the workers need NumPy
+    digest = digest or file_digest(path)
+    name = prepared_name(digest, frequency, channels, normalise_dbfs)
+    target = os.path.join(folder, name)
+    if name in known and os.path.exists(target):
+        return digest, name, None
+    samples = decode(path, frequency, channels).astype(np.float64) / 32768
+    peak = float(np.max(np.abs(samples))) if samples.size else 0.0
+    rms = float(np.sqrt(np.mean(np.square(samples)))) if samples.size else 0.0
+    gain = 1.0
+    if normalise_dbfs is not None and rms > 0:
+        gain = min(10 ** ((normalise_dbfs - dbfs(rms)) / 20), 10 ** (PEAK_CEILING_DBFS / 20) / peak)
+    write_wav(target, np.clip(np.round(samples * gain * 32768), -32768, 32767).astype(np.int16), frequency)
+    levels = {"peak_dbfs": round(dbfs(peak), 2), "rms_dbfs": round(dbfs(rms), 2), "gain_db": round(dbfs(gain), 2),
+              "seconds": round(len(samples) / frequency, 3)}
+    return digest, name, levels
+
+
+#------------------------------------------------------------------------------
+#Prepare the files in a process pool, returns ({path: (prepared path, levels)}, [(path, error)]).
+#levels: peak and RMS of the original in dBFS, gain applied in dB, duration in seconds.
+def prepare_files(paths, folder=STIMULUS_FOLDER, frequency=MIXER_FREQUENCY, channels=MIXER_CHANNELS,
+                  normalise_dbfs=None, workers=None):
+    os.makedirs(folder, exist_ok=True)
+    index = load_index(folder)
+    prepared, failed, todo = {}, [], []
+    for path in dict.fromkeys(paths):
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            failed.append((path, str(e)))
+            continue
+        known = index["files"].get(path)
+        digest = None
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            digest = known["sha256"]  # also hashed by stimulus_registry.py when the song is selected
+            name = prepared_name(digest, frequency, channels, normalise_dbfs)
+            if name in index["levels"] and os.path.exists(os.path.join(folder, name)):
+                prepared[path] = (os.path.join(folder, name), index["levels"][name])
+                continue
+        todo.append((path, stat, digest))
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers or min(len(todo), os.cpu_count() or 1)) as pool:
+            known = tuple(index["levels"])
+            jobs = {pool.submit(prepare, path, folder, frequency, channels, normalise_dbfs, known, digest): (path, stat)
+                    for path, stat, digest in todo}
+            for job in as_completed(jobs):
+                path, stat = jobs[job]
+                try:
+                    digest, name, levels = job.result()
+                except Exception as e:
+                    failed.append((path, str(e)))
+                    continue
+                index["files"][path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+                if levels is not None:
+                    index["levels"][name] = levels
+                prepared[path] = (os.path.join(folder, name), index["levels"][name])
+        save_index(folder, index)
+    return prepared, failed
+
+#Command starting the child interpreter: this file, or the frozen program with IMPORT_COMMAND
+def child_command():
+    if getattr(sys, "frozen", False):
+        return [sys.executable, IMPORT_COMMAND]
+    return [sys.executable, os.path.abspath(__file__)]
+
+#Same as prepare_files, in a child interpreter (safe from the GUI script). If the child fails every
+#file is reported failed with the reason, the originals are then played as they are.
+def import_stimuli(paths, folder=STIMULUS_FOLDER, frequency=MIXER_FREQUENCY, channels=MIXER_CHANNELS,
+                   normalise_dbfs=None):
+    command = child_command() + ["--json", "--folder", folder, "--frequency", str(frequency),
+                                 "--channels", str(channels)]
+    if normalise_dbfs is not None:
+        command += ["--normalise", str(normalise_dbfs)]
+    try:
+        child = subprocess.run(command, input=json.dumps(list(paths)), capture_output=True, text=True,
+                               timeout=IMPORT_TIMEOUT, env={**os.environ, "PYGAME_HIDE_SUPPORT_PROMPT": "1"})
+        if child.returncode and not child.stdout.strip():
+            errors = child.stderr.strip().splitlines()
+            raise subprocess.SubprocessError(errors[-1] if errors else f"exit code {child.returncode}")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+    except (OSError, ValueError, IndexError, subprocess.SubprocessError) as e:
+        return {}, [(path, f"import failed: {e}") for path in paths]
+    return ({path: tuple(item) for path, item in result["prepared"].items()},
+            [tuple(item) for item in result["failed"]])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prepare song files for 4CT playback")
+    parser.add_argument("files", nargs="*", help="WAV/MP3 files")
+    parser.add_argument("--folder", default=STIMULUS_FOLDER, help="cache of the prepared files")
+    parser.add_argument("--frequency", type=int, default=MIXER_FREQUENCY)
+    parser.add_argument("--channels", type=int, default=MIXER_CHANNELS)
+    parser.add_argument("--normalise", type=float, metavar="DBFS", help="normalise the RMS level, e.g. -20")
+    parser.add_argument("--workers", type=int, help="worker processes, default one per CPU")
+    parser.add_argument("--json", action="store_true", help="read the files as a JSON list on stdin, print JSON")
+    args = parser.parse_args(argv)
+    files = json.load(sys.stdin) if args.json else args.files
+    prepared, failed = prepare_files(files, args.folder, args.frequency, args.channels, args.normalise, args.workers)
+    if args.json:
+        json.dump({"prepared": prepared, "failed": failed}, sys.stdout)
+        return 0
+    for path, (target, levels) in sorted(prepared.items()):
+        print(f"{os.path.basename(path)}: peak {levels['peak_dbfs']:.1f} dBFS, RMS {levels['rms_dbfs']:.1f} dBFS, "
+              f"gain {levels['gain_db']:+.1f} dB -> {target}")
+    for path, error in failed:
+        print(f"Could not import {path}: {error}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Registry of the song files by content.
+
+Every selected file is fingerprinted by the SHA-256 of its content, so a copy of the same recording
+under another name or in another folder is recognised as the same stimulus. The hashes are kept
+by (path, size, modification time) in the index of the import pipeline (stimulus_import.py), which
+then needs not hash the files again: re-selecting an unchanged library hashes nothing. Nothing is
+read when a group is selected: a background thread first compares it with the other groups (only
+the files with the same size as a file of another group are hashed for that) and reports a copy,
+then hashes the rest of the group one file after the other.
+"""
+import os
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from stimulus_import import STIMULUS_FOLDER, file_digest, load_index, save_index
+
+
+class StimulusRegistry:
+    #folder: stimulus folder whose index keeps the hashes between runs, None = only in memory.
+    #on_hashed(group, path, digest) is called from the background thread for every file of a group,
+    #on_duplicates(group, files, duplicates) when a group has copies of files of another group (see duplicates()).
+    def __init__(self, folder=STIMULUS_FOLDER, on_hashed=None, on_duplicates=None):
+        self.folder = folder
+        self.on_hashed = on_hashed
+        self.on_duplicates = on_duplicates
+        self.hashes = load_index(folder)["files"] if folder else {}  # path -> {size, mtime_ns, sha256}
+        self.unsaved = {}           # hashes computed since the last save
+        self.groups = {}            # group -> selected files
+        self.lock = threading.Lock()
+        self.hasher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stimulus-hash")
+        self.computed = 0           # files actually read and hashed
+
+    #The index is shared with the import child and the other boxes, only the new entries are merged in
+    def save(self):
+        with self.lock:
+            unsaved, self.unsaved = self.unsaved, {}
+        if self.folder is None or not unsaved:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+        except OSError as e:
+            print(f"Could not save the song hashes: {e}")
+            return
+        save_index(self.folder, {"files": unsaved, "levels": {}})
+
+    #Hash of the file if it did not change since it was hashed, else None (reads nothing)
+    def known(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            known = self.hashes.get(path)
+        if known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns:
+            return known["sha256"]
+        return None
+
+    #SHA-256 of the file, read only if the file changed since it was last hashed (raises OSError)
+    def digest(self, path):
+        digest = self.known(path)
+        if digest:
+            return digest
+        stat = os.stat(path)
+        digest = file_digest(path)
+        entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+        with self.lock:
+            self.hashes[path] = self.unsaved[path] = entry
+            self.computed += 1
+        return digest
+
+    #Files of other groups ({group: files}) with the same content as one of files: [(file, other group, other file)].
+    #Only the files whose size matches are hashed.
+    def duplicates(self, files, others):
+        sizes = {}
+        for other, path in [(other, path) for other, paths in others.items() for path in paths]:
+            try:
+                sizes.setdefault(os.path.getsize(path), []).append((other, path))
+            except OSError:
+                pass
+        found = []
+        for path in files:
+            try:
+                candidates = sizes.get(os.path.getsize(path), [])
+                if candidates:
+                    digest = self.digest(path)
+                    found += [(path, other, other_path) for other, other_path in candidates
+                              if other_path == path or self.digest(other_path) == digest]
+            except OSError:
+                pass  # Missing files are reported when they are played
+        if found:
+            self.save()
+        return found
+
+    #Files selected for a group; they are checked against the other groups and hashed in the background
+    def set_group(self, group, files):
+        with self.lock:
+            self.groups[group] = list(files)
+            others = {other: list(paths) for other, paths in self.groups.items() if other != group}
+        self.hasher.submit(self.check_group, group, list(files), others)
+
+    #A group with copies of files of another group is dropped and reported, the others are hashed
+    def check_group(self, group, files, others):
+        found = self.duplicates(files, others)
+        if not found:
+            self.hash_group(group, files)
+            return
+        with self.lock:
+            if self.groups.get(group) == files:
+                del self.groups[group]
+        if self.on_duplicates:
+            self.on_duplicates(group, files, found)
+
+    def hash_group(self, group, files):
+        for path in files:
+            try:
+                digest = self.digest(path)
+            except OSError:
+                continue
+            if self.on_hashed:
+                self.on_hashed(group, path, digest)
+        self.save()
+
+    #Wait until the files of every group selected so far are hashed (not from the GUI thread)
+    def wait(self):
+        try:
+            self.hasher.submit(lambda: None).result()
+        except (RuntimeError, CancelledError):
+            pass  # closed
+
+    #Hash of every selected file, None for a file not hashed yet; the files that cannot be read are left out.
+    #Reads no file, so it can be called from the GUI thread.
+    def selected_hashes(self):
+        hashes = {}
+        with self.lock:
+            groups = list(self.groups.values())
+        for files in groups:
+            for path in files:
+                try:
+                    hashes[path] = self.known(path)
+                except OSError:
+                    pass  # Missing files are reported when they are played
+        return hashes
+
+    def close(self):
+        self.hasher.shutdown(wait=False, cancel_futures=True)
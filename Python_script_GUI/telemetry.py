@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Latency telemetry of the perch events.
+
+For every perch event the engine measures, per perch:
+- firmware: "Latency SWn: X mSecs" printed by the box when it gets saX1, i.e. from the perch
+  event to the relay command as the firmware counts it (SHW_LATENCY on)
+- ack: from the perch line received to the reply of the box to saX1 (relay open acknowledged)
+- onset: from the perch line received to the start of the song
+A rolling window of the last samples gives the live p50/p95/max, the session totals (count, max,
+samples over the threshold) are kept for the whole experiment. The samples themselves are stored
+with the session as "latency" records (see event_records.py).
+"""
+import re
+import threading
+from collections import defaultdict, deque
+
+METRICS = ("firmware", "ack", "onset")
+ROLLING_WINDOW = 500          # samples per perch and metric in the live percentiles
+LATENCY_THRESHOLD_MS = 50.0   # latency the stimulus should stay under
+LATENCY_LINE = re.compile(r"^Latency SW(\d+): (\d+) mSecs$")
+
+
+#"Latency SW2: 14 mSecs" -> (2, 14.0), None for other lines
+def parse_latency_line(line):
+    match = LATENCY_LINE.match(line)
+    return (int(match.group(1)), float(match.group(2))) if match else None
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class LatencyTelemetry:
+    def __init__(self, window=ROLLING_WINDOW, threshold_ms=LATENCY_THRESHOLD_MS):
+        self.window = window
+        self.threshold_ms = threshold_ms
+        self.lock = threading.Lock()
+        self.recent = defaultdict(lambda: deque(maxlen=self.window))  # (metric, perch) -> last values
+        self.totals = defaultdict(lambda: [0, 0.0, 0])                # (metric, perch) -> [count, max, over]
+
+    def record(self, metric, perch, value_ms):
+        with self.lock:
+            self.recent[(metric, perch)].append(value_ms)
+            total = self.totals[(metric, perch)]
+            total[0] += 1
+            total[1] = max(total[1], value_ms)
+            total[2] += value_ms > self.threshold_ms
+
+    #Live percentiles, {perch: (p50, p95, max)} over the rolling window of a metric
+    def rolling(self, metric):
+        with self.lock:
+            windows = {perch: sorted(values) for (name, perch), values in self.recent.items() if name == metric and values}
+        return {perch: (percentile(values, 0.5), percentile(values, 0.95), values[-1])
+                for perch, values in sorted(windows.items())}
+
+    #Whole session, {(metric, perch): (samples, max, samples over the threshold)}
+    def session(self):
+        with self.lock:
+            return {key: tuple(total) for key, total in sorted(self.totals.items())}
+
+    def clear(self):
+        with self.lock:
+            self.recent.clear()
+            self.totals.clear()
+
+    #Text of the live panel: one row per perch, p50/p95/max of each metric
+    def panel_text(self):
+        rows = {metric: self.rolling(metric) for metric in METRICS}
+        perches = sorted({perch for values in rows.values() for perch in values})
+        lines = ["perch " + " ".join(f"{metric:>11}" for metric in METRICS)]
+        for perch in perches:
+            cells = []
+            for metric in METRICS:
+                stats = rows[metric].get(perch)
+                cells.append(f"{'/'.join(f'{value:.0f}' for value in stats):>11}" if stats else f"{'-':>11}")
+            lines.append(f"{perch:5} " + " ".join(cells))
+        over = sum(over for _, _, over in self.session().values())
+        lines.append(f"p50/p95/max ms, {over} over {self.threshold_ms:g} ms")
+        return "\n".join(lines)
+
+    #Lines for the end of the session log
+    def report_lines(self):
+        lines = ""
+        for (metric, perch), (count, maximum, over) in self.session().items():
+            lines += (f"Latency {metric} perch {perch}: {count} events, max {maximum:.1f} ms, "
+                      f"{over} over {self.threshold_ms:g} ms\n")
+        return lines
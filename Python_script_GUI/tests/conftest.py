@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Shared setup of the tests: the modules of Python_script_GUI are imported as in the scripts, pygame
+plays on SDL's dummy driver, and the engine runs against the Virtual Perch Detector.
+    python -m pytest -q
+"""
+import os
+import sys
+import wave
+
+import pytest
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+posix_only = pytest.mark.skipif(sys.platform == "win32", reason="the Virtual Perch Detector needs a pty")
+
+
+#Silent 16-bit stereo WAV file of the given length, returns its path
+def silent_wav(path, seconds):
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(2)
+        file.setsampwidth(2)
+        file.setframerate(44100)
+        file.writeframes(b"\0" * 4 * int(44100 * seconds))
+    return str(path)
+
+
+#Engine connected to a Virtual Perch Detector, its log lines in engine.lines
+@pytest.fixture
+def engine(tmp_path):
+    from discovery import open_serial_port
+    from engine import ExperimentEngine
+    from perch_emulator import VirtualPerchDetector
+
+    with VirtualPerchDetector() as box:
+        ser = open_serial_port(box.port)
+        lines = []
+        engine = ExperimentEngine(ser, on_log=lines.append, session_folder=str(tmp_path / "sessions"),
+                                  daily_folder=str(tmp_path / "daily"), stimulus_folder=None)
+        engine.box, engine.lines = box, lines
+        try:
+            yield engine
+        finally:
+            engine.close()
+            ser.close()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+import time
+from collections import deque
+
+import pygame
+import pytest
+
+from audio_engine import AudioEngine
+from conftest import silent_wav
+
+
+@pytest.fixture
+def audio():
+    audio = AudioEngine(speakers=2)
+    yield audio
+    audio.close()
+
+
+#Loader that takes its time, like a long MP3
+def slow_loader(started, release):
+    def load(path):
+        started.set()
+        release.wait(5)
+        return pygame.mixer.Sound(path)
+    return load
+
+
+def test_cache_miss_does_not_block_the_caller(audio, tmp_path):
+    song = silent_wav(tmp_path / "song.wav", 0.5)
+    started, release = threading.Event(), threading.Event()
+    audio.cache.loader = slow_loader(started, release)
+    played = []
+    begin = time.perf_counter()
+    audio.play(1, "SongA", [song], on_start=lambda file_path, found: played.append(found))
+    assert time.perf_counter() - begin < 0.1
+    assert started.wait(5) and played == []
+    release.set()
+    for _ in range(100):
+        if played:
+            break
+        time.sleep(0.01)
+    assert played == [True] and audio.channels[1].get_busy()
+
+
+def test_interrupt_during_a_decode_keeps_the_old_sound_off(audio, tmp_path):
+    slow, fast = silent_wav(tmp_path / "slow.wav", 1.0), silent_wav(tmp_path / "fast.wav", 1.2)
+    audio.load([[fast]])
+    started, release = threading.Event(), threading.Event()
+    audio.cache.loader = slow_loader(started, release)
+    first = audio.play(1, "SongA", [slow])
+    assert started.wait(5)
+    second = audio.play(1, "SongB", [fast])
+    assert second.decision == "interrupted" and first.cancelled
+    release.set()
+    time.sleep(0.2)
+    assert audio.channels[1].get_sound() is second.sound
+    assert first.sound is None
+
+
+def test_onset_history_is_bounded(audio, tmp_path):
+    song = silent_wav(tmp_path / "song.wav", 0.05)
+    audio.load([[song]])
+    audio.onset_latencies = deque(maxlen=3)
+    for _ in range(5):
+        audio.play(1, "SongA", [song], received_at=time.perf_counter())
+    assert len(audio.onset_latencies) == 3 and audio.onsets == 5
+
+
+def test_interrupt_by_unplayable_files_silences_the_speaker(audio, tmp_path):
+    song = silent_wav(tmp_path / "song.wav", 2.0)
+    audio.load([[song]])
+    audio.play(1, "SongA", [song])
+    assert audio.channels[1].get_busy()
+    done, found = [], []
+    second = audio.play(1, "SongB", [str(tmp_path / "missing.wav")], on_done=lambda: done.append(True),
+                        on_start=lambda file_path, ok: found.append(ok))
+    assert second.decision == "interrupted" and found == [False] and done == [True]
+    assert not audio.channels[1].get_busy()
+
+
+def test_original_edited_after_import_is_decoded_from_itself(audio, tmp_path):
+    original = silent_wav(tmp_path / "song.wav", 0.5)
+    prepared = silent_wav(tmp_path / "prepared.wav", 0.25)
+    audio.cache.set_sources({original: (prepared, os.stat(original).st_mtime_ns)})
+    assert audio.cache.get(original).get_length() == pytest.approx(0.25, abs=0.01)
+    silent_wav(original, 1.0)
+    os.utime(original, ns=(0, os.stat(original).st_mtime_ns + 1000))
+    assert audio.cache.get(original).get_length() == pytest.approx(1.0, abs=0.01)
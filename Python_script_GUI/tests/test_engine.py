@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import builtins
+import shutil
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from conftest import posix_only, silent_wav
+import stimulus_registry
+
+
+#Hits on perch 1, spaced over the perch timeout of the box
+def hit(engine, times):
+    for _ in range(times):
+        engine.box.hit(1)
+        time.sleep(0.3)
+    time.sleep(0.3)
+
+
+@posix_only
+def test_second_session_counts_from_zero(engine, tmp_path):
+    engine.set_position(1, engine.arena.default_label)
+    engine.set_schedule([(1, "00:00:00", "23:59:59")])
+    engine.set_songs("A", [silent_wav(tmp_path / "song.wav", 0.02)])
+    engine.start()
+    engine.start_session(250, "", "")
+    time.sleep(0.2)
+    hit(engine, 3)
+    engine.stop_session()
+    assert engine.counts.section_totals(1, ["A"]) == {"A": 3}
+    assert "Section 1: Song A: 3," in engine.lines[-1]
+
+    engine.start_session(250, "", "")
+    time.sleep(0.2)
+    hit(engine, 2)
+    engine.stop_session()
+    assert engine.counts.section_totals(1, ["A"]) == {"A": 2}
+    assert "Section 1: Song A: 2," in engine.lines[-1]
+
+
+#A song decoded after a cache miss starts from the prefetch thread, its onset is recorded all the same
+@posix_only
+def test_onset_of_a_cache_miss_is_recorded(engine, tmp_path):
+    engine.set_position(1, engine.arena.default_label)
+    engine.set_schedule([(1, "00:00:00", "23:59:59")])
+    engine.set_songs("A", [silent_wav(tmp_path / "song.wav", 0.02)])
+    engine.start()
+    engine.start_session(250, "", "")
+    time.sleep(0.2)
+    loader = engine.audio.cache.loader
+
+    def slow_loader(path):
+        time.sleep(0.2)
+        return loader(path)
+    engine.audio.cache.retain([])
+    engine.audio.cache.loader = slow_loader
+    hit(engine, 1)
+    engine.stop_session()
+    assert engine.audio.cache.stats()["misses"] == 1 and engine.audio.onsets == 1
+    samples = engine.telemetry.session()[("onset", 1)][0]
+    assert samples == 1 and engine.telemetry.rolling("onset")[1][0] >= 200
+
+
+#A copy of a song selected for another stimulus is found on the hash thread, set_songs opens no file
+@posix_only
+def test_set_songs_reads_no_file(engine, tmp_path, monkeypatch):
+    song = silent_wav(tmp_path / "song.wav", 0.5)
+    copy = shutil.copy(song, tmp_path / "copy.wav")
+    hashed_on, opened = [], []
+
+    def slow_digest(path):
+        hashed_on.append(threading.current_thread())
+        time.sleep(0.3)
+        return digest(path)
+    digest = stimulus_registry.file_digest
+    monkeypatch.setattr(stimulus_registry, "file_digest", slow_digest)
+
+    def watched_open(file, *args, **kwargs):
+        if threading.current_thread() is threading.main_thread():
+            opened.append(file)
+        return real_open(file, *args, **kwargs)
+    real_open = builtins.open
+    rejected = []
+    engine.on_rejected = lambda stimulus, message: rejected.append(stimulus)
+    begin = time.perf_counter()
+    monkeypatch.setattr(builtins, "open", watched_open)
+    engine.set_songs("A", [song])
+    engine.set_songs("B", [str(copy)])
+    monkeypatch.setattr(builtins, "open", real_open)
+    assert time.perf_counter() - begin < 0.2 and opened == []
+
+    with pytest.raises(ValueError, match="same content"):
+        engine.check_songs()
+    assert rejected == ["B"] and engine.songs == {"A": [song], "B": [], "C": [], "D": []}
+    assert hashed_on and threading.main_thread() not in hashed_on
+
+
+#The summary of each day counts the events of that day, the session counts go on
+@posix_only
+def test_daily_summary_counts_one_day(engine, tmp_path):
+    engine.set_position(1, engine.arena.default_label)
+    engine.set_schedule([(1, "00:00:00", "23:59:59")])
+    engine.set_songs("A", [silent_wav(tmp_path / "song.wav", 0.02)])
+    engine.start()
+    engine.start_session(250, "", "")
+    time.sleep(0.2)
+    hit(engine, 3)
+    first = engine.daily_rotation.rotate(datetime(2026, 10, 17))[1]
+    hit(engine, 2)
+    second = engine.daily_rotation.rotate(datetime(2026, 10, 18))[1]
+    engine.stop_session()
+    assert "Section 1: Song A: 3," in open(first).read()
+    assert "Section 1: Song A: 2," in open(second).read()
+    assert "Section 1: Song A: 5," in engine.lines[-1]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from headless import DEFAULTS, session_window
+from schedule import parse_time
+
+
+def window(start, end, now):
+    return session_window({**DEFAULTS, "start": start, "end": end}, parse_time(now))
+
+
+def test_no_end_starts_now_once_the_start_has_passed():
+    assert window("08:00:00", None, "10:00:00") == (0, None)
+    assert window("08:00:00", None, "08:00:00") == (0, None)
+    assert window("08:00:00", None, "07:00:00") == (3600, None)
+
+
+def test_window_with_an_end():
+    assert window("08:00:00", "18:00:00", "10:00:00") == (0, 8 * 3600)
+    assert window("08:00:00", "18:00:00", "19:00:00") == (13 * 3600, 10 * 3600)
+    assert window("22:00:00", "02:00:00", "01:00:00") == (0, 3600)
+    assert window(None, None, "10:00:00") == (0, None)
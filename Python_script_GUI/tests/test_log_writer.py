@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+import errno
+import time
+
+import pytest
+
+import log_writer
+from log_writer import StreamingLogWriter, read_journal
+
+
+#Journal file whose writes fail as on a full disk
+class FullDisk:
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, text):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_failing_write_is_raised_to_the_waiters_and_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_writer, "WAIT_TIMEOUT", 2.0)
+    writer = StreamingLogWriter(str(tmp_path), fsync_interval=0.05)
+    writer.write("before")
+    writer.flush()
+    real = writer.file
+    writer.file = FullDisk(real)
+    writer.write("during")
+    begin = time.monotonic()
+    with pytest.raises(OSError) as error:
+        writer.flush()
+    assert error.value.errno == errno.ENOSPC and time.monotonic() - begin < 2.0
+    assert writer.thread.is_alive()
+    writer.file = real  # space again: the entry kept in memory is written
+    writer.write("after")
+    assert list(read_journal(writer.journals()[0])) == ["before", "during", "after"]
+    writer.close()
+
+
+def test_waiters_time_out_when_the_writer_is_gone(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_writer, "WAIT_TIMEOUT", 0.2)
+    writer = StreamingLogWriter(str(tmp_path))
+    writer.close()
+    with pytest.raises(TimeoutError):
+        writer.flush()
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+import re
+import time
+
+from conftest import posix_only, silent_wav
+from playback_plan import PlaybackPlan, balanced_latin_square
+
+
+def test_same_seed_same_plan():
+    files = ["a.wav", "b.wav", "c.wav", "d.wav"]
+    for mode in ("shuffle", "latin_square", "rotate"):
+        first, second = PlaybackPlan(files, mode, 42, "A"), PlaybackPlan(files, mode, 42, "A")
+        assert [first.next() for _ in range(2500)] == [second.next() for _ in range(2500)]
+
+
+def test_balanced_latin_square():
+    for n in (3, 4, 5):
+        square = balanced_latin_square(n)
+        positions = {(value, position) for row in square for position, value in enumerate(row)}
+        assert len(positions) == n * n and all(sorted(row) == list(range(n)) for row in square)
+
+
+#The seed and the files of the start block, with the playback decisions logged after it, give back
+#the files played, even when songs were played by hand before START
+@posix_only
+def test_seed_and_log_rebuild_played_order(engine, tmp_path):
+    files = [silent_wav(tmp_path / f"song{n}.wav", 0.02 + 0.01 * n) for n in range(3)]
+    engine.set_position(1, engine.arena.default_label)
+    engine.set_schedule([(1, "00:00:00", "23:59:59")])
+    engine.set_songs("A", files)
+    engine.set_playback_plan("rotate", 7)
+    engine.set_playback_policy("queue")
+    engine.start()
+    for _ in range(2):
+        engine.play("A", 1)   # Song A button before START
+    time.sleep(0.3)
+    engine.start_session(250, "", "")
+    time.sleep(0.2)   # the box is in run mode
+    for _ in range(8):
+        engine.box.hit(1)
+        time.sleep(0.3)   # over the perch timeout
+    time.sleep(0.5)
+    engine.stop_session()
+
+    block = next(n for n, line in enumerate(engine.lines) if "\nPlayback plan: " in line)
+    mode, seed = re.search(r"\nPlayback plan: (\w+), seed (\d+)", engine.lines[block]).groups()
+    selected = re.search(r"\nThe files selected for Song A are: (.*)", engine.lines[block]).group(1).split(", ")
+    triggers = sum("SongA on speaker 1: " in line for line in engine.lines[block:])
+    played = [line.rsplit(": ", 1)[1] for line in engine.lines[block:] if "SongA played this file: " in line]
+    plan = PlaybackPlan(selected, mode, int(seed), "A")
+    planned = [os.path.basename(path) for _ in range(triggers) for path in plan.next()]
+    assert triggers == 8
+    assert played == planned
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from conftest import posix_only
+from discovery import open_serial_port
+from perch_emulator import VirtualPerchDetector, help_text
+from serial_link import SerialTransport, expected_reply_lines
+
+
+def test_list_reply_follows_the_channels():
+    assert expected_reply_lines("l r/n") == 11
+    assert expected_reply_lines("l r/n", channels=8) == 19
+    assert expected_reply_lines("h r/n") == len(help_text(4)) == 28
+    assert expected_reply_lines("h r/n", channels=8) == len(help_text(8)) == 36
+
+
+@posix_only
+def test_list_reply_of_an_eight_channel_box():
+    with VirtualPerchDetector(channels=8) as box:
+        ser = open_serial_port(box.port)
+        transport = SerialTransport(ser, channels=8)
+        try:
+            reply = transport.send("l r/n").result(timeout=5)
+            follow = transport.send("p r/n").result(timeout=5)
+        finally:
+            transport.close()
+            ser.close()
+    assert len(reply.split()) == 2 + 16 and follow.endswith("STOPMODE")  # RUNMODE, delay, 8 switches, 8 relays
+
+
+#The help text has a line per switch and per relay, the reply of the next command is not mixed into it
+@posix_only
+def test_help_reply_of_an_eight_channel_box():
+    with VirtualPerchDetector(channels=8) as box:
+        ser = open_serial_port(box.port)
+        transport = SerialTransport(ser, channels=8)
+        try:
+            reply = transport.send("h r/n").result(timeout=5)
+            follow = transport.send("p r/n").result(timeout=5)
+        finally:
+            transport.close()
+            ser.close()
+    assert "18: State Relay 8" in reply and "(1-8)" in reply and follow.endswith("STOPMODE")
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+from conftest import posix_only, silent_wav
+import stimulus_import
+from stimulus_import import IMPORT_COMMAND, import_stimuli
+
+GUI_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "4CT.py")
+
+
+#Frozen build: the import runs the program itself, here a launcher of 4CT.py standing in for 4CT.exe
+@posix_only
+def test_frozen_program_runs_the_import(monkeypatch, tmp_path):
+    program = tmp_path / "4CT"
+    program.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{GUI_SCRIPT}" "$@"\n')
+    program.chmod(0o755)
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(sys, "executable", str(program))
+    assert stimulus_import.child_command() == [str(program), IMPORT_COMMAND]
+
+    song = silent_wav(tmp_path / "song.wav", 0.1)
+    prepared, failed = import_stimuli([song], str(tmp_path / "stimuli"))
+    assert failed == [] and os.path.exists(prepared[song][0])
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+Time of day spinboxes.
+
+The arrows compute the next value from the current one (HH:MM:SS, wrapping at midnight) instead of
+walking a list of the 86,400 times of the day, so no picker holds a list of values.
+"""
+from tkinter import ttk
+
+from schedule import parse_time, format_time
+
+
+#Time delta seconds after (or before) text, wrapping around midnight
+def step_time(text, delta):
+    try:
+        return format_time(parse_time(text) + delta)
+    except ValueError:
+        return "00:00:00"
+
+#Spinbox for a time of day, the arrows (and Up/Down keys, mouse wheel) step by one second
+def create_time_spinbox(parent, textvariable, width=10):
+    spinbox = ttk.Spinbox(parent, textvariable=textvariable, width=width)
+
+    def spin(delta):
+        textvariable.set(step_time(textvariable.get(), delta))
+        return "break"  # skip the default numeric spin of ttk
+
+    spinbox.bind("<<Increment>>", lambda event: spin(1))
+    spinbox.bind("<<Decrement>>", lambda event: spin(-1))
+    return spinbox
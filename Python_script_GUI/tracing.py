@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Span tracing of the event path.
+
+The functions a perch event goes through (serial routing, handle_perch, send, log, play, the GUI
+update tick...) are decorated with TRACER.traced. While tracing is enabled every call writes its
+start, duration, thread and, when given, the depth of the queue in front of it into a ring buffer
+preallocated at startup; the oldest spans are overwritten. Disabled, a decorated call costs one
+attribute check. dump() writes the buffer as a Chrome trace (chrome://tracing or ui.perfetto.dev)
+to find what stalled during a live run without attaching a profiler.
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from array import array
+
+DEFAULT_CAPACITY = 65536   # spans kept, about 2 MB
+NO_DEPTH = -1
+
+
+class Tracer:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.enabled = False
+        self.capacity = capacity
+        self.names = []            # span name of each id
+        self.name_ids = {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.starts = array("d", bytes(8 * self.capacity))     # perf_counter seconds
+        self.durations = array("d", bytes(8 * self.capacity))  # seconds
+        self.name_of = array("H", bytes(2 * self.capacity))
+        self.threads = array("Q", bytes(8 * self.capacity))
+        self.depths = array("q", bytes(8 * self.capacity))     # queue depth at the start, NO_DEPTH if none
+        self.slots = itertools.count()  # next() is atomic under the GIL, no lock on the hot path
+
+    def name_id(self, name):
+        with self.lock:
+            if name not in self.name_ids:
+                self.name_ids[name] = len(self.names)
+                self.names.append(name)
+            return self.name_ids[name]
+
+    def record(self, name_id, start, duration, depth=NO_DEPTH):
+        slot = next(self.slots) % self.capacity
+        self.starts[slot] = start
+        self.durations[slot] = duration
+        self.name_of[slot] = name_id
+        self.threads[slot] = threading.get_ident()
+        self.depths[slot] = depth
+
+    #Decorator: trace every call of the function as a span; depth(*args, **kwargs) gives the queue depth
+    def traced(self, name, depth=None):
+        name_id = self.name_id(name)
+
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                queued = depth(*args, **kwargs) if depth else NO_DEPTH
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name_id, start, time.perf_counter() - start, queued)
+            return wrapper
+        return decorate
+
+    #Spans in the buffer, oldest first: (name, start, duration, thread, depth)
+    def spans(self):
+        written = next(self.slots)  # also takes a slot, left empty
+        self.starts[written % self.capacity] = self.durations[written % self.capacity] = 0.0
+        first = max(0, written - self.capacity)
+        spans = []
+        for n in range(first, written):
+            slot = n % self.capacity
+            if self.durations[slot] or self.starts[slot]:
+                spans.append((self.names[self.name_of[slot]], self.starts[slot], self.durations[slot],
+                              self.threads[slot], self.depths[slot]))
+        return sorted(spans, key=lambda span: span[1])
+
+    #Write the buffer as Chrome trace JSON, returns the number of spans
+    def dump(self, path):
+        spans = self.spans()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        pid = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": name}}
+                  for ident, name in thread_names.items()]
+        for name, start, duration, thread, depth in spans:
+            event = {"name": name, "ph": "X", "ts": start * 1e6, "dur": duration * 1e6, "pid": pid, "tid": thread}
+            if depth != NO_DEPTH:
+                event["args"] = {"queue_depth": depth}
+                events.append({"name": f"{name} queue", "ph": "C", "ts": start * 1e6, "pid": pid,
+                               "args": {"depth": depth}})
+            events.append(event)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        return len(spans)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+
+TRACER = Tracer()
+if os.environ.get("FOURCT_TRACE"):
+    TRACER.enable()
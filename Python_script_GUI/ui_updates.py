@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Thread-safe queue of GUI updates.
+
+Tkinter widgets may only be touched from the Tk main loop. Other threads (serial, audio) post their
+updates here and the main loop applies them every few milliseconds: several values for the same
+widget collapse into the latest one and log lines are inserted in a single batch.
+"""
+import threading
+import tkinter as tk
+
+from tracing import TRACER
+
+UPDATE_INTERVAL_MS = 50
+
+
+class UiUpdateQueue:
+    def __init__(self, root, interval_ms=UPDATE_INTERVAL_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.lock = threading.Lock()
+        self.texts = {}       # widget -> latest text
+        self.logs = {}        # LogView -> lines waiting to be appended
+        self.calls = []       # functions to run on the Tk thread
+        self.tick_hooks = []  # functions run on every drain, e.g. to snapshot widget values
+        self.root.after(self.interval_ms, self.drain)
+
+    #Replace the content of a text widget, only the last value before the next drain is drawn
+    def set_text(self, widget, value):
+        with self.lock:
+            self.texts[widget] = value
+
+    #Append a line at the end of a log view
+    def append_log(self, view, line):
+        with self.lock:
+            self.logs.setdefault(view, []).append(line)
+
+    #Run a function on the Tk thread (message boxes, dialogs...)
+    def call(self, function, *args):
+        with self.lock:
+            self.calls.append((function, args))
+
+    def on_tick(self, function):
+        self.tick_hooks.append(function)
+
+    #depth: updates waiting, counted without the lock
+    @TRACER.traced("gui.drain", depth=lambda self: len(self.texts) + len(self.calls) + sum(map(len, list(self.logs.values()))))
+    def drain(self):
+        with self.lock:
+            texts, self.texts = self.texts, {}
+            logs, self.logs = self.logs, {}
+            calls, self.calls = self.calls, []
+        try:
+            for widget, value in texts.items():
+                widget.delete("1.0", tk.END)
+                widget.insert(tk.END, value)
+            for view, lines in logs.items():
+                view.append(lines)
+            for function, args in calls:
+                function(*args)
+            for function in self.tick_hooks:
+                function()
+        finally:
+            self.root.after(self.interval_ms, self.drain)